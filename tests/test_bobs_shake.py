@@ -0,0 +1,106 @@
+"""Tests for Bob's Shake
+
+Run with `python -m unittest discover tests` from the repository root.
+"""
+import datetime
+import random
+import unittest
+
+from zygrader import bobs_shake
+
+START = datetime.datetime(2021, 1, 28, 9, 0, 0)
+
+
+def sandwiches(outer_pair, inner_pair):
+    """The pairwise check _sandwiched_pairs replaced"""
+    outer_begin, outer_end = outer_pair
+    inner_begin, inner_end = inner_pair
+    return (outer_begin.time_stamp < inner_begin.time_stamp
+            and outer_end.time_stamp > inner_end.time_stamp)
+
+
+def quadratic_sandwiched_pairs(open_close_pairs):
+    return {
+        index
+        for index, pair in enumerate(open_close_pairs) if any(
+            sandwiches(outer, pair) for outer in open_close_pairs)
+    }
+
+
+def lock_log_rows(rng: random.Random, num_items: int, span: int):
+    """Random LOCK/UNLOCK rows for one TA in the lock log format
+
+    Times are whole seconds within span so many events share a time stamp.
+    """
+    rows = []
+    for item in range(num_items):
+        begin = rng.randrange(span)
+        end = begin + rng.randrange(span // 4 + 1)
+        student = f"Student {item % 7}"
+        assignment = f"Lab {item}"
+        for offset, lock_type in ((begin, "LOCK"), (end, "UNLOCK")):
+            time_stamp = START + datetime.timedelta(seconds=offset)
+            rows.append([
+                time_stamp.isoformat(), "LAB", student, assignment, "ta1",
+                lock_type
+            ])
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def open_close_pairs(rows):
+    events = [bobs_shake._WorkEvent.from_native_data(row) for row in rows]
+    pairs, _ = bobs_shake._pair_events(events)
+    return pairs
+
+
+class SandwichedPairsTest(unittest.TestCase):
+    def check(self, rows):
+        pairs = open_close_pairs(rows)
+        self.assertEqual(bobs_shake._sandwiched_pairs(pairs),
+                         quadratic_sandwiched_pairs(pairs))
+
+        # The pairs come out in order of close time, shuffle them so ties
+        # in begin time are not always shortest first
+        random.Random(len(pairs)).shuffle(pairs)
+        self.assertEqual(bobs_shake._sandwiched_pairs(pairs),
+                         quadratic_sandwiched_pairs(pairs))
+
+    def test_nested_and_tied_items(self):
+        def row(second, lab, lock_type):
+            time_stamp = START + datetime.timedelta(seconds=second)
+            return [
+                time_stamp.isoformat(), "LAB", "Student", lab, "ta1", lock_type
+            ]
+
+        rows = [
+            row(0, "Outer", "LOCK"),
+            row(0, "Same begin", "LOCK"),
+            row(5, "Inner", "LOCK"),
+            row(10, "Inner", "UNLOCK"),
+            row(10, "Same end", "LOCK"),
+            row(20, "Same begin", "UNLOCK"),
+            row(30, "Outer", "UNLOCK"),
+            row(30, "Same end", "UNLOCK"),
+        ]
+        pairs = open_close_pairs(rows)
+        sandwiched = {
+            pairs[index][0].og_data[3]
+            for index in bobs_shake._sandwiched_pairs(pairs)
+        }
+        self.assertEqual(sandwiched, {"Inner"})
+        self.check(rows)
+
+    def test_matches_quadratic_check(self):
+        rng = random.Random(47)
+        for _ in range(300):
+            num_items = rng.randrange(1, 40)
+            span = rng.choice([5, 60, 3600])
+            self.check(lock_log_rows(rng, num_items, span))
+
+    def test_empty(self):
+        self.assertEqual(bobs_shake._sandwiched_pairs([]), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
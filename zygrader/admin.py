@@ -4,27 +4,57 @@ from zygrader.ui.templates import filename_input
 from zygrader.ui import window
 from zygrader.config import preferences
 
+import collections
+import concurrent.futures
 import csv
+import itertools
 import os
 import requests
 import re
 import time
 
-from zygrader import bobs_shake, class_manager, data, grade_puller, ui, utils
+from zygrader import (bobs_shake, checkpoint, class_manager, compiler, data,
+                      grade_puller, gradebook, patterns, search_index,
+                      similarity, ui, utils)
 from zygrader.zybooks import Zybooks
 
-
-def check_student_submissions(zy_api, student_id, lab, search_pattern):
-    """Search for a substring in all of a student's submissions for a given lab.
-    Supports regular expressions.
+# Students searched at once. Each worker mostly waits on the network.
+SEARCH_WORKERS = 8
+# Seconds to wait after a download times out, doubled after each failure
+SEARCH_RETRY_DELAY = 5
+SEARCH_MAX_RETRY_DELAY = 60
+SEARCH_MAX_ATTEMPTS = 6
+
+
+def check_student_submissions(zy_api,
+                              student_id,
+                              lab,
+                              pattern_set,
+                              index=None,
+                              plan=None):
+    """Search all of a student's submissions for a given lab part for each
+    pattern in a PatternSet.
+
+    Each file is scanned once for every pattern still missing. The result
+    maps the index of each found pattern to the time of the first
+    submission containing it. With a search index and plan, submissions
+    that can't match are skipped and new submissions are added to the index.
     """
-    response = {"code": Zybooks.NO_SUBMISSION}
+    response = {"code": Zybooks.NO_SUBMISSION, "matches": {}}
 
-    all_submissions = zy_api.get_all_submissions(lab["id"], student_id)
+    try:
+        all_submissions = zy_api.get_all_submissions(lab["id"], student_id)
+    except requests.exceptions.ConnectionError:
+        return {"code": Zybooks.DOWNLOAD_TIMEOUT}
     if not all_submissions:
         return response
 
+    matches = response["matches"]
     for submission in all_submissions:
+        zip_name = os.path.basename(submission["zip_location"])
+        if plan and not plan.should_open(zip_name):
+            continue
+
         # Get file from zip url
         try:
             zip_file = zy_api.get_submission_zip(submission["zip_location"])
@@ -39,114 +69,243 @@ def check_student_submissions(zy_api, student_id, lab, search_pattern):
             continue
 
         extracted_zip_files = utils.extract_zip(zip_file)
+        if index:
+            index.add_zip(zip_name, student_id, extracted_zip_files)
 
-        # Check each file for the matched string
+        # Check each file for all of the patterns at once
+        found = set()
         for source_file in extracted_zip_files.keys():
-            if search_pattern.search(extracted_zip_files[source_file]):
+            if plan and not plan.should_search(zip_name, source_file):
+                continue
+            found |= pattern_set.search(extracted_zip_files[source_file])
 
-                # Get the date and time of the submission and return it
-                response["time"] = zy_api.get_time_string(submission)
-                response["code"] = Zybooks.NO_ERROR
+        time_string = zy_api.get_time_string(submission)
+        for pattern_index in found:
+            matches.setdefault(pattern_index, time_string)
 
-                return response
+        if len(matches) == len(pattern_set.patterns):
+            break
 
+    if matches:
+        response["code"] = Zybooks.NO_ERROR
     return response
 
 
-def submission_search_fn(logger, lab, search_string, output_path, use_regex):
-    students = data.get_students()
-    zy_api = Zybooks()
+def search_student(zy_api, student_id, lab, pattern_set, index, plan):
+    """Run check_student_submissions, retrying with backoff on timeouts
 
-    regex_str = search_string if use_regex else re.escape(search_string)
-    search_pattern = re.compile(regex_str)
+    Each worker backs off on its own, so one slow download doesn't stall
+    the other students being searched.
+    """
+    delay = SEARCH_RETRY_DELAY
+    for attempt in range(SEARCH_MAX_ATTEMPTS):
+        match_result = check_student_submissions(zy_api, student_id, lab,
+                                                 pattern_set, index, plan)
+        if match_result["code"] != Zybooks.DOWNLOAD_TIMEOUT:
+            match_result["retries"] = attempt
+            return match_result
+
+        # No point waiting when there is no attempt left to make
+        if attempt + 1 < SEARCH_MAX_ATTEMPTS:
+            time.sleep(delay)
+        delay = min(delay * 2, SEARCH_MAX_RETRY_DELAY)
+
+    return {
+        "code": Zybooks.DOWNLOAD_TIMEOUT,
+        "matches": {},
+        "error": "Download timed out",
+        "retries": SEARCH_MAX_ATTEMPTS - 1
+    }
+
+
+def __record_search_result(saved_search, key, future):
+    if future.cancelled() or future.exception():
+        return
 
-    with open(output_path, "w", newline="") as log_file:
+    match_result = future.result()
+    # Timeouts are worth retrying when the search resumes
+    if match_result["code"] != Zybooks.DOWNLOAD_TIMEOUT:
+        saved_search.record(key, match_result)
+
+
+def search_checkpoint(selections, pattern_set):
+    """The checkpoint of a search over these lab parts for these patterns"""
+    params = {
+        "parts": [part["id"] for _, part in selections],
+        "patterns": [str(pattern) for pattern in pattern_set.patterns]
+    }
+    description = ", ".join(f"{lab.name} - {part['name']}"
+                            for lab, part in selections)
+    return checkpoint.Checkpoint("submission-search", params, description)
+
+
+def submission_search_fn(logger,
+                         selections,
+                         pattern_set,
+                         output_path,
+                         saved_search,
+                         completed=None):
+    """Search each selected (lab, part) for every pattern in one pass
+
+    Writes one row per student and part that matched any pattern, with a
+    column per pattern holding the time of the first matching submission.
+    Each student's result is saved to the checkpoint as it finishes, and
+    students in `completed` (the results loaded from a checkpoint) are not
+    searched again. The CSV is only moved into place once the search is
+    done.
+    """
+    students = data.get_students()
+    zy_api = Zybooks()
+    completed = completed or {}
+    saved_search.start(resume=bool(completed))
+
+    regexes = [pattern.regex() for pattern in pattern_set.patterns]
+    pattern_names = [str(pattern) for pattern in pattern_set.patterns]
+
+    indexes = {}
+    plans = {}
+    for _, part in selections:
+        if part["id"] not in indexes:
+            indexes[part["id"]] = search_index.TrigramIndex(part["id"])
+            plans[part["id"]] = search_index.SearchPlan(indexes[part["id"]],
+                                                        regexes)
+
+    partial_path = f"{output_path}.partial"
+    with open(partial_path, "w", newline="") as log_file, \
+            concurrent.futures.ThreadPoolExecutor(SEARCH_WORKERS) as pool:
         csv_log = csv.DictWriter(log_file,
-                                 fieldnames=[
-                                     "Name", "Submission",
-                                     (f"(Searching for {search_string})"
-                                      f"{' as a regex' if use_regex else ''}")
-                                 ])
+                                 fieldnames=["Name", "Lab", "Part"] +
+                                 pattern_names)
         csv_log.writeheader()
-        student_num = 1
 
-        for student in students:
-            while True:
+        # All workers share the zy_api session, and every part is queued up
+        # front so the pool stays busy across parts
+        futures = {}
+        for _, part in selections:
+            for student in students:
+                key = f"{part['id']}/{student.id}"
+                if key in completed:
+                    continue
+
+                future = pool.submit(search_student, zy_api, str(student.id),
+                                     part, pattern_set, indexes[part["id"]],
+                                     plans[part["id"]])
+                future.add_done_callback(
+                    lambda future, key=key: __record_search_result(
+                        saved_search, key, future))
+                futures[key] = future
+
+        # Log and write results in order as they finish
+        for lab, part in selections:
+            logger.log(f"Searching {lab.name} - {part['name']}")
+
+            for student_num, student in enumerate(students, 1):
                 counter = f"[{student_num}/{len(students)}]"
                 logger.log(f"{counter:12} Checking {student.full_name}")
 
-                match_result = check_student_submissions(
-                    zy_api, str(student.id), lab, search_pattern)
-
-                if match_result["code"] == Zybooks.DOWNLOAD_TIMEOUT:
-                    logger.log(
-                        "Download timed out... trying again after a few seconds"
-                    )
-                    time.sleep(5)
+                key = f"{part['id']}/{student.id}"
+                if key in completed:
+                    match_result = completed[key]
+                    # JSON keys are always strings
+                    match_result["matches"] = {
+                        int(i): time_string
+                        for i, time_string in match_result["matches"].items()
+                    }
+                    logger.append(" (resumed)")
                 else:
-                    break
+                    match_result = futures[key].result()
+                    if match_result["retries"]:
+                        logger.append(
+                            f" (retried {match_result['retries']} times)")
 
-            if match_result["code"] == Zybooks.NO_ERROR:
-                csv_log.writerow({
+                row = {
                     "Name": student.full_name,
-                    "Submission": match_result['time']
-                })
+                    "Lab": lab.name,
+                    "Part": part["name"]
+                }
+                matches = match_result["matches"]
+                if match_result["code"] == Zybooks.NO_ERROR:
+                    for pattern_index, time_string in matches.items():
+                        row[pattern_names[pattern_index]] = time_string
+                    found = ", ".join(pattern_names[i] for i in sorted(matches))
+                    logger.append(f" found {found}")
 
-                logger.append(f" found {search_string}")
+                # Check for and log errors
+                if "error" in match_result:
+                    for name in pattern_names:
+                        row.setdefault(name, f"ERROR: {match_result['error']}")
 
-            # Check for and log errors
-            if "error" in match_result:
-                csv_log.writerow({
-                    "Name": student.full_name,
-                    "Submission": f"ERROR: {match_result['error']}"
-                })
+                if matches or "error" in match_result:
+                    csv_log.writerow(row)
+
+    os.replace(partial_path, output_path)
+    saved_search.finish()
 
-            student_num += 1
+    for index in indexes.values():
+        index.close()
 
 
 def submission_search_init():
-    """Get lab part and string from the user for searching"""
+    """Get lab parts and patterns from the user for searching"""
     window = ui.get_window()
     labs = data.get_labs()
 
-    menu = ui.layers.ListLayer()
-    menu.set_searchable("Assignment")
-    for lab in labs:
-        menu.add_row_text(str(lab))
-    window.run_layer(menu, "Submissions Search")
-    if menu.canceled:
-        return
+    # Select any number of lab parts
+    selected = {}
+    popup = ui.layers.ListLayer("Select Lab Parts", popup=True)
+    popup.set_exit_text("Done")
+    for lab_index, lab in enumerate(labs):
+        if len(lab.parts) == 1:
+            selected[(lab_index, 0)] = False
+            popup.add_row_toggle(str(lab), LockToggle((lab_index, 0), selected))
+            continue
 
-    assignment = labs[menu.selected_index()]
+        row = popup.add_row_parent(str(lab))
+        for part_index, part in enumerate(lab.parts):
+            selected[(lab_index, part_index)] = False
+            row.add_row_toggle(part["name"],
+                               LockToggle((lab_index, part_index), selected))
+    window.run_layer(popup, "Submissions Search")
+
+    selections = [(labs[lab_index], labs[lab_index].parts[part_index])
+                  for (lab_index, part_index), toggled in selected.items()
+                  if toggled]
+    if not selections:
+        return
 
-    # Select the lab part if needed
-    if len(assignment.parts) > 1:
-        popup = ui.layers.ListLayer("Select Part", popup=True)
-        for part in assignment.parts:
-            popup.add_row_text(part["name"])
-        window.run_layer(popup, "Submissions Search")
-        if popup.canceled:
+    # Read patterns until a blank one is entered
+    search_patterns = []
+    while True:
+        text_input = ui.layers.TextInputLayer("Search Pattern")
+        text_input.set_prompt([
+            f"Enter search pattern {len(search_patterns) + 1}",
+            "Wrap a pattern in slashes to use a regex, like /cin\s*>>/",
+            "Leave blank to start searching"
+        ])
+        window.run_layer(text_input, "Submissions Search")
+        if text_input.canceled:
             return
 
-        part = assignment.parts[popup.selected_index()]
-    else:
-        part = assignment.parts[0]
-
-    regex_input = ui.layers.BoolPopup("Use Regex")
-    regex_input.set_message(["Would you like to use regex?"])
-    window.run_layer(regex_input)
-    if regex_input.canceled:
-        return
-    use_regex = regex_input.get_result()
+        text = text_input.get_text()
+        if not text:
+            break
 
-    text_input = ui.layers.TextInputLayer("Search String")
-    text_input.set_prompt(["Enter a search string"])
-    window.run_layer(text_input, "Submissions Search")
-    if text_input.canceled:
+        pattern = patterns.Pattern.parse(text)
+        if pattern.is_regex:
+            try:
+                re.compile(pattern.text)
+            except re.error as e:
+                popup = ui.layers.Popup("Invalid Regex")
+                popup.set_message([f"{pattern} is not a valid regex: {e}"])
+                window.run_layer(popup)
+                continue
+        # Each pattern is a CSV column, so skip repeats
+        if pattern not in search_patterns:
+            search_patterns.append(pattern)
+
+    if not search_patterns:
         return
 
-    search_string = text_input.get_text()
-
     # Get a valid output path
     filename_input = ui.layers.PathInputLayer("Output File")
     filename_input.set_prompt(["Enter the filename to save the search results"])
@@ -155,12 +314,238 @@ def submission_search_init():
     if filename_input.canceled:
         return
 
+    pattern_set = patterns.PatternSet(search_patterns)
+
+    # Offer to pick up where an interrupted search of the same parts and
+    # patterns left off
+    saved_search = search_checkpoint(selections, pattern_set)
+    completed = saved_search.load()
+    if completed:
+        started = time.strftime("%m/%d/%Y %I:%M %p",
+                                time.localtime(saved_search.started))
+        popup = ui.layers.BoolPopup("Resume Search")
+        popup.set_message([
+            f"An unfinished search of {saved_search.description}"
+            f" was started {started}.",
+            f"{len(completed)} results were saved. Resume the search?"
+        ])
+        window.run_layer(popup)
+        if popup.canceled:
+            return
+        if not popup.get_result():
+            completed = {}
+
     logger = ui.layers.LoggerLayer()
     logger.set_log_fn(lambda: submission_search_fn(
-        logger, part, search_string, filename_input.get_path(), use_regex))
+        logger, selections, pattern_set, filename_input.get_path(
+        ), saved_search, completed))
     window.run_layer(logger, "Submission Search")
 
 
+def first_error_lines(stderr: str, num_lines=3) -> str:
+    """Return the first few error lines from compiler output"""
+    lines = [line for line in stderr.splitlines() if "error" in line]
+    if not lines:
+        lines = stderr.splitlines()
+    return "\n".join(lines[:num_lines])
+
+
+def precompile_lab_fn(logger, lab, output_path):
+    """Compile the graded submission of every student for a lab
+
+    The submission for each part is chosen with the same rules used when
+    grading. Compiling fills the shared compile cache so graders start
+    with binaries ready, and a report of compile failures is written.
+    """
+    students = data.get_students()
+    zy_api = Zybooks()
+
+    # Collect the extracted submission for each student and part,
+    # compiling in the pool while the rest are downloaded
+    jobs = []
+    with compiler.create_pool() as pool:
+        for student_num, student in enumerate(students, 1):
+            counter = f"[{student_num}/{len(students)}]"
+            logger.log(f"{counter:12} Downloading {student.full_name}")
+
+            try:
+                response = zy_api.download_assignment(student, lab)
+            except requests.exceptions.ConnectionError:
+                jobs.append((student, "", "Download Error", None))
+                continue
+
+            for part in response["parts"]:
+                part_name = part["name"] if part["name"] else part["id"]
+                if part["code"] == Zybooks.NO_SUBMISSION:
+                    continue
+
+                zip_file = zy_api.get_submission_zip(part["zip_url"])
+                if zip_file == Zybooks.ERROR:
+                    jobs.append((student, part_name, "Download Error", None))
+                    continue
+
+                root_dir = utils.get_extracted_submission(zip_file)
+                future = pool.submit(compiler.compile_directory, root_dir)
+                jobs.append((student, part_name, "", future))
+
+        logger.log("Waiting for compilation to finish")
+
+        failures = []
+        for student, part_name, status, future in jobs:
+            errors = ""
+            if future:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # One bad submission (or a dead pool worker) shouldn't
+                    # lose the report for the rest of the lab
+                    status = "Compile Failed"
+                    errors = f"{type(e).__name__}: {e}"
+                else:
+                    if result.success():
+                        continue
+                    status = "Compile Error"
+                    errors = first_error_lines(result.stderr)
+
+            # Strip file and line information to group common errors
+            error_type = errors.split("\n")[0].split("error:")[-1].strip()
+
+            failures.append({
+                "Name": student.full_name,
+                "Part": part_name,
+                "Status": status,
+                "Error Type": error_type,
+                "Errors": errors
+            })
+
+    # Sort the most common errors first so systemic issues stand out
+    error_counts = collections.Counter(row["Error Type"] for row in failures)
+    failures.sort(key=lambda row: (-error_counts[row["Error Type"]], row[
+        "Error Type"], row["Name"]))
+
+    with open(output_path, "w", newline="") as report_file:
+        writer = csv.DictWriter(
+            report_file,
+            fieldnames=["Name", "Part", "Status", "Error Type", "Errors"])
+        writer.writeheader()
+        writer.writerows(failures)
+
+
+def precompile_lab_init():
+    """Get the lab and output path from the user to precompile a lab"""
+    window = ui.get_window()
+    labs = data.get_labs()
+
+    menu = ui.layers.ListLayer()
+    menu.set_searchable("Assignment")
+    for lab in labs:
+        menu.add_row_text(str(lab))
+    window.run_layer(menu, "Precompile Lab")
+    if menu.canceled:
+        return
+
+    lab = labs[menu.selected_index()]
+
+    out_path = filename_input(purpose="the compile error report",
+                              text=os.path.join(preferences.get("output_dir"),
+                                                "compile_errors.csv"))
+    if out_path is None:
+        return
+
+    logger = ui.layers.LoggerLayer()
+    logger.set_log_fn(lambda: precompile_lab_fn(logger, lab, out_path))
+    window.run_layer(logger, "Precompile Lab")
+
+
+def similarity_check_fn(logger, lab, output_path):
+    """Find pairs of students with similar code for each part of a lab
+
+    The graded submission of each student is fingerprinted, then pairs are
+    found with MinHash/LSH so a whole lab is checked in about linear time.
+    """
+    students = data.get_students()
+    zy_api = Zybooks()
+
+    part_submissions = collections.defaultdict(list)
+    for student_num, student in enumerate(students, 1):
+        counter = f"[{student_num}/{len(students)}]"
+        logger.log(f"{counter:12} Fingerprinting {student.full_name}")
+
+        try:
+            response = zy_api.download_assignment(student, lab)
+        except requests.exceptions.ConnectionError:
+            logger.append(" (download error)")
+            continue
+
+        for part in response["parts"]:
+            part_name = part["name"] if part["name"] else part["id"]
+            if part["code"] == Zybooks.NO_SUBMISSION:
+                continue
+
+            zip_file = zy_api.get_submission_zip(part["zip_url"])
+            if zip_file == Zybooks.ERROR:
+                logger.append(" (download error)")
+                continue
+
+            root_dir = utils.get_extracted_submission(zip_file)
+            part_submissions[part_name].append(
+                similarity.read_submission(student.full_name, root_dir))
+
+    logger.log("Comparing submissions")
+
+    matches = []
+    for part_name, submissions in part_submissions.items():
+        matches.extend((part_name, match)
+                       for match in similarity.find_similar(submissions))
+
+    # Rank the most similar pairs of all parts first
+    matches.sort(key=lambda item: item[1].similarity, reverse=True)
+
+    with open(output_path, "w", newline="") as report_file:
+        writer = csv.DictWriter(report_file,
+                                fieldnames=[
+                                    "Part", "First Student", "Second Student",
+                                    "Similarity", "First Regions",
+                                    "Second Regions"
+                                ])
+        writer.writeheader()
+        for part_name, match in matches:
+            writer.writerow({
+                "Part": part_name,
+                "First Student": match.first.name,
+                "Second Student": match.second.name,
+                "Similarity": f"{match.similarity:.0%}",
+                "First Regions": "; ".join(match.first_regions),
+                "Second Regions": "; ".join(match.second_regions)
+            })
+
+
+def similarity_check_init():
+    """Get the lab and output path from the user to check code similarity"""
+    window = ui.get_window()
+    labs = data.get_labs()
+
+    menu = ui.layers.ListLayer()
+    menu.set_searchable("Assignment")
+    for lab in labs:
+        menu.add_row_text(str(lab))
+    window.run_layer(menu, "Similarity Check")
+    if menu.canceled:
+        return
+
+    lab = labs[menu.selected_index()]
+
+    out_path = filename_input(purpose="the similarity report",
+                              text=os.path.join(preferences.get("output_dir"),
+                                                "similarity.csv"))
+    if out_path is None:
+        return
+
+    logger = ui.layers.LoggerLayer()
+    logger.set_log_fn(lambda: similarity_check_fn(logger, lab, out_path))
+    window.run_layer(logger, "Similarity Check")
+
+
 class LockToggle(ui.layers.Toggle):
     def __init__(self, name, list):
         super().__init__()
@@ -216,6 +601,36 @@ def _confirm_gradebook_ready():
     return (not confirmation.canceled) and confirmation.get_result()
 
 
+def gradebook_gaps(puller):
+    """Return the gaps in the gradebook as CSV rows, with a column of
+    students missing a score for each assignment. Empty if there are none.
+    """
+    real_assignment_pattern = re.compile(r".*\([0-9]+\)")
+    real_assignments = [
+        assignment for assignment in puller.canvas_header
+        if real_assignment_pattern.match(assignment)
+    ]
+
+    # Create mapping from assignment names to lists of students
+    # with no grade for that assignment
+    all_gaps = gradebook.Gradebook(puller).gaps(real_assignments)
+    if not all_gaps:
+        return []
+
+    # Transpose the data for easier reading
+    rows = [list(all_gaps.keys())]
+    rows.extend(
+        list(row)
+        for row in itertools.zip_longest(*all_gaps.values(), fillvalue=""))
+    return rows
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerows(rows)
+
+
 def report_gaps():
     """Report any cells in the gradebook that do not have a score"""
     window = ui.get_window()
@@ -230,50 +645,22 @@ def report_gaps():
     except grade_puller.GradePuller.StoppingException:
         return
 
-    real_assignment_pattern = re.compile(r".*\([0-9]+\)")
-
-    # Create mapping from assignment names to lists of students
-    # with no grade for that assignment
-    all_gaps = dict()
-    for assignment in puller.canvas_header:
-        if real_assignment_pattern.match(assignment):
-            gaps = []
-            for student in puller.canvas_students.values():
-                if not student[assignment]:
-                    gaps.append(student['Student'])
-            if gaps:
-                all_gaps[assignment] = gaps
+    rows = gradebook_gaps(puller)
 
     # Abort if no gaps present
-    if not all_gaps:
+    if not rows:
         popup = ui.layers.Popup("Full Gradebook",
                                 ["There are no gaps in the gradebook"])
         window.run_layer(popup)
         return
 
-    # Transpose the data for easier reading
-    rows = [list(all_gaps.keys())]
-    added = True
-    while added:
-        added = False
-        new_row = []
-        for assignment in rows[0]:
-            if all_gaps[assignment]:
-                new_row.append(all_gaps[assignment].pop(0))
-                added = True
-            else:
-                new_row.append("")
-        rows.append(new_row)
-
     # select the output file and write to it
     out_path = filename_input(purpose="the gap report",
                               text=os.path.join(preferences.get("output_dir"),
                                                 "gradebook_gaps.csv"))
     if out_path is None:
         return
-    with open(out_path, "w", newline="") as out_file:
-        writer = csv.writer(out_file)
-        writer.writerows(rows)
+    write_rows(out_path, rows)
 
 
 def midterm_mercy():
@@ -313,25 +700,8 @@ def midterm_mercy():
     except grade_puller.GradePuller.StoppingException:
         return
 
-    # Do the replacement for each student
-    for student in puller.canvas_students.values():
-        midterm_1_score = float(student[midterm_1_assignment])
-        midterm_2_score = (float(student[midterm_2_assignment])
-                           if midterm_2_assignment else None)
-        final_exam_score = float(student[final_exam_assignment])
-
-        if midterm_2_assignment:
-            # Figure out lower midterm, then if it should be replaced do so
-            if midterm_2_score < midterm_1_score:
-                if final_exam_score > midterm_2_score:
-                    student[midterm_2_assignment] = final_exam_score
-            else:
-                if final_exam_score > midterm_1_score:
-                    student[midterm_1_assignment] = final_exam_score
-        else:
-            # With only one midterm, just replace it if lower than final
-            if final_exam_score > midterm_1_score:
-                student[midterm_1_assignment] = final_exam_score
+    apply_midterm_mercy(puller, midterm_1_assignment, midterm_2_assignment,
+                        final_exam_assignment)
 
     out_path = filename_input(purpose="the updated midterm scores",
                               text=os.path.join(preferences.get("output_dir"),
@@ -339,12 +709,8 @@ def midterm_mercy():
     if out_path is None:
         return
 
-    # Again use the gradepuller functionality
-    # We just need to programmatically set the selected assignments
-    puller.selected_assignments = [midterm_1_assignment]
-    if midterm_2_assignment:
-        puller.selected_assignments.append(midterm_2_assignment)
-    puller.write_upload_file(out_path)
+    write_midterm_mercy(puller, out_path, midterm_1_assignment,
+                        midterm_2_assignment)
 
     popup = ui.layers.Popup("Reminder")
     popup.set_message([
@@ -354,6 +720,34 @@ def midterm_mercy():
     window.run_layer(popup)
 
 
+def apply_midterm_mercy(puller, midterm_1_assignment, midterm_2_assignment,
+                        final_exam_assignment):
+    """Replace each student's lower midterm score with their final exam score
+    if it is higher. midterm_2_assignment may be None."""
+    midterms = [midterm_1_assignment]
+    if midterm_2_assignment:
+        midterms.append(midterm_2_assignment)
+
+    gradebook.Gradebook(puller).replace_lowest(midterms, final_exam_assignment)
+
+
+def write_midterm_mercy(puller, out_path, midterm_1_assignment,
+                        midterm_2_assignment):
+    # Again use the gradepuller functionality
+    # We just need to programmatically set the selected assignments
+    puller.selected_assignments = [midterm_1_assignment]
+    if midterm_2_assignment:
+        puller.selected_assignments.append(midterm_2_assignment)
+    puller.write_upload_file(out_path)
+
+
+# The built in mappings from classes missed to participation score
+ATTENDANCE_SCHEMES = [
+    ("TR", [100, 100, 98, 95, 91, 86, 80, 73, 65, 57, 49, 46]),
+    ("MWF", [100, 100, 99, 97, 94, 90, 85, 80, 75, 70, 65, 60, 55, 53]),
+]
+
+
 def attendance_score():
     """Calculate the participation score from the attendance score columns"""
     window = ui.get_window()
@@ -384,19 +778,9 @@ def attendance_score():
     except grade_puller.GradePuller.StoppingException:
         return
 
-    # Get all of the assignments between the start and end
-    start_index = puller.canvas_header.index(start_classes_missed_assignment)
-    end_index = puller.canvas_header.index(end_classes_missed_assignment)
-    all_classes_missed_assignments = puller.canvas_header[
-        start_index:end_index + 1]
-
     # Figure out the grading scheme - the mapping from classes missed to grade
-    builtin_schemes = [
-        ("TR", [100, 100, 98, 95, 91, 86, 80, 73, 65, 57, 49, 46]),
-        ("MWF", [100, 100, 99, 97, 94, 90, 85, 80, 75, 70, 65, 60, 55, 53]),
-    ]
     scheme_selector = ui.layers.ListLayer("Scheme Selector", popup=True)
-    for name, scheme in builtin_schemes:
+    for name, scheme in ATTENDANCE_SCHEMES:
         scheme_selector.add_row_text(f"{name}: {','.join(map(str,scheme))},...")
     scheme_selector.add_row_text("Create New Scheme")
 
@@ -405,8 +789,8 @@ def attendance_score():
         return
 
     selected = scheme_selector.selected_index()
-    if selected < len(builtin_schemes):
-        points_by_classes_missed = builtin_schemes[selected][1]
+    if selected < len(ATTENDANCE_SCHEMES):
+        points_by_classes_missed = list(ATTENDANCE_SCHEMES[selected][1])
     else:
         # Get the custom scheme
         scheme_inputter = ui.layers.TextInputLayer("New Scheme")
@@ -423,6 +807,33 @@ def attendance_score():
         scheme_text = scheme_inputter.get_text()
         points_by_classes_missed = list(map(int, scheme_text.split(',')))
 
+    apply_attendance_score(puller, participation_score_assignment,
+                           start_classes_missed_assignment,
+                           end_classes_missed_assignment, class_sections,
+                           points_by_classes_missed)
+
+    out_path = filename_input(purpose="the partipation score",
+                              text=os.path.join(preferences.get("output_dir"),
+                                                "participation.csv"))
+    if out_path is None:
+        return
+
+    write_attendance_score(puller, out_path, participation_score_assignment,
+                           class_sections)
+
+
+def apply_attendance_score(puller, participation_score_assignment,
+                           start_classes_missed_assignment,
+                           end_classes_missed_assignment, class_sections,
+                           points_by_classes_missed):
+    """Set the participation score of each student in class_sections from
+    the classes they missed, using points_by_classes_missed as the scheme"""
+    # Get all of the assignments between the start and end
+    start_index = puller.canvas_header.index(start_classes_missed_assignment)
+    end_index = puller.canvas_header.index(end_classes_missed_assignment)
+    all_classes_missed_assignments = puller.canvas_header[
+        start_index:end_index + 1]
+
     # Extend the scheme until 0 is reached
     delta = points_by_classes_missed[-2] - points_by_classes_missed[-1]
     while points_by_classes_missed[-1] >= 0:
@@ -430,29 +841,17 @@ def attendance_score():
     # Get rid of the negative element
     del points_by_classes_missed[-1]
 
-    # Calculate and assign the grade for each student
-    for student in puller.canvas_students.values():
-        if student["section_number"] in class_sections:
-            total_classes_missed = 0
-            for assignment in all_classes_missed_assignments:
-                try:
-                    total_classes_missed += int(student[assignment])
-                except ValueError:
-                    total_classes_missed += int(
-                        puller.canvas_points_out_of[assignment])
-
-            try:
-                grade = points_by_classes_missed[total_classes_missed]
-            except IndexError:
-                grade = 0
-            student[participation_score_assignment] = grade
+    # Calculate and assign the grade for each student. Missing or invalid
+    # cells count as missing every class in that column.
+    book = gradebook.Gradebook(puller)
+    rows = book.rows(class_sections)
+    total_classes_missed = book.totals(all_classes_missed_assignments, rows)
+    grades = gradebook.lookup(total_classes_missed, points_by_classes_missed)
+    book.set_scores(participation_score_assignment, rows, grades)
 
-    out_path = filename_input(purpose="the partipation score",
-                              text=os.path.join(preferences.get("output_dir"),
-                                                "participation.csv"))
-    if out_path is None:
-        return
 
+def write_attendance_score(puller, out_path, participation_score_assignment,
+                           class_sections):
     # Again use the gradepuller functionality
     # We just need to programmatically set the selected assignments
     puller.selected_assignments = [participation_score_assignment]
@@ -479,6 +878,8 @@ def admin_menu():
 
     menu = ui.layers.ListLayer()
     menu.add_row_text("Submissions Search", submission_search_init)
+    menu.add_row_text("Precompile Lab", precompile_lab_init)
+    menu.add_row_text("Similarity Check", similarity_check_init)
     menu.add_row_text("Grade Puller", grade_puller.GradePuller().pull)
     menu.add_row_text("Find Unmatched Students",
                       grade_puller.GradePuller().find_unmatched_students)
@@ -1,19 +1,60 @@
 """Bob's Shake: A tool to analyze TA work statistics.
 
-`shake` is the singular entry point to this module
+`shake` is the interactive entry point to this module, and
+`shake_unattended` runs the same steps from given inputs without any UI.
 """
 
 from collections import namedtuple
+import bisect
 import csv
 import datetime
+import io
+import itertools
+import json
 import os
+import tempfile
 import typing
 
 from zygrader import data, ui
 from zygrader.data.lock import get_lock_log_path
 from zygrader.config import preferences
+from zygrader.config.shared import SharedData
 from zygrader.ui.templates import filename_input
 
+# Each TA's machine logs locks with its own clock, so the lock log is read a
+# little past each end of the time range in case rows are slightly out of
+# order
+_LOCK_LOG_CLOCK_SKEW = datetime.timedelta(minutes=10)
+
+# the forgot to close thresholds were chosen arbitrarily but carefully
+# the main rationale was finding a time where it could clearly be said
+# "work events never take that long to finish, so if an item was open
+# that long, it must have been a mistake"
+_FORGOT_TO_CLOSE_THRESHOLDS = {
+    'LAB': datetime.timedelta(minutes=30),
+    'EMAIL': datetime.timedelta(minutes=30),
+    'HELP': datetime.timedelta(hours=1),
+}
+
+# the default average times were taken from the first seven weeks
+# of the Winter 2021 semester
+# they are the mean of the average time per item across all TAs
+_DEFAULT_AVG_TIMES = {
+    'LAB': datetime.timedelta(minutes=6, seconds=4),
+    'EMAIL': datetime.timedelta(minutes=4, seconds=20),
+    'HELP': datetime.timedelta(minutes=9, seconds=42),
+}
+
+# Whole days of the lock log are summarized once and saved in the class
+# folder. Change this when the analysis changes so old summaries are redone.
+_SUMMARY_VERSION = 2
+
+# The lengths of the windows a time range can be split into
+PERIODS = {
+    "daily": datetime.timedelta(days=1),
+    "weekly": datetime.timedelta(weeks=1),
+}
+
 
 def shake():
     """Read TA work data, "shake" it, and report the shaken statistics.
@@ -28,7 +69,8 @@ def shake():
     and additional data is read from a csv file created by our help queue.
 
     "shaking" occurs in a series of steps, roughly:
-        - user selects start and end time to include
+        - user selects start and end time to include, and whether to
+          split that range into daily or weekly windows
         - user points Bob to the data from the help queue
         - data is read from zygrader's log and the queue info
         - errors encountered and corrections that need to be made
@@ -46,6 +88,7 @@ def shake():
     steps = [
         Step(True, None, worker.select_start_time),
         Step(True, None, worker.select_end_time),
+        Step(True, None, worker.select_period),
         Step(True, None, worker.select_help_queue_data_file),
         Step(False, "Read data from the log file", worker.read_in_native_stats),
         Step(False, "Read data from help queue file",
@@ -74,26 +117,108 @@ def shake():
                 return
 
 
-class _WorkEvent:
-    queue_errors = []
+def shake_unattended(start_time: datetime.datetime,
+                     end_time: datetime.datetime,
+                     help_queue_csv_filepath: str,
+                     output_path: str,
+                     queue_errors_path: str = None,
+                     queue_netids: typing.Dict[str, str] = None,
+                     progress_fn=None,
+                     refresh_summaries=False) -> typing.List[str]:
+    """Run Bob's Shake without prompting for anything
+
+    queue_netids maps help queue names to netids for TAs that aren't stored
+    yet. Returns the help queue names that still have no netid, in which
+    case nothing is written. refresh_summaries redoes the saved daily
+    summaries of the lock log.
+    """
+    worker = _StatsWorker()
+    worker.start_time = start_time
+    worker.end_time = end_time
+    worker.refresh_summaries = refresh_summaries
+    return _run_unattended(worker, help_queue_csv_filepath, output_path,
+                           queue_errors_path, queue_netids, progress_fn)
+
+
+def shake_windows_unattended(windows: typing.List[typing.Tuple[
+    datetime.datetime, datetime.datetime]],
+                             help_queue_csv_filepath: str,
+                             output_path: str,
+                             queue_errors_path: str = None,
+                             queue_netids: typing.Dict[str, str] = None,
+                             progress_fn=None,
+                             refresh_summaries=False) -> typing.List[str]:
+    """Run Bob's Shake for each (start, end) window without prompting
+
+    Each TA's stats for each window are written as one row per category of
+    work. The arguments and return value are the same as shake_unattended.
+    """
+    worker = _StatsWorker()
+    worker.set_windows(windows)
+    worker.refresh_summaries = refresh_summaries
+    return _run_unattended(worker, help_queue_csv_filepath, output_path,
+                           queue_errors_path, queue_netids, progress_fn)
 
-    def __init__(self, time_stamp, event_type, student_name, ta_name, is_begin,
-                 og_data, uniq_item):
-        self.time_stamp = time_stamp
-        self.event_type = event_type
-        self.student_name = student_name
-        self.ta_name = ta_name
-        self.is_begin = is_begin
-        self.og_data = og_data
-        self.uniq_item = uniq_item
+
+def _run_unattended(worker: "_StatsWorker", help_queue_csv_filepath: str,
+                    output_path: str, queue_errors_path: str,
+                    queue_netids: typing.Dict[str, str],
+                    progress_fn) -> typing.List[str]:
+    progress_fn = progress_fn or (lambda msg: None)
+    worker.help_queue_csv_filepath = help_queue_csv_filepath
+    worker.output_path = output_path
+
+    _WorkEvent.queue_errors = []
+
+    progress_fn("Read data from the log file")
+    worker.read_in_native_stats()
+    progress_fn("Read data from help queue file")
+    worker.read_in_help_queue_stats()
+
+    if _WorkEvent.queue_errors and queue_errors_path:
+        progress_fn(f"Write queue data errors to {queue_errors_path}")
+        worker.write_queue_errors(queue_errors_path)
+
+    unknown_qnames = worker.store_queue_names(queue_netids or {})
+    if unknown_qnames:
+        return unknown_qnames
+
+    progress_fn("Assign events to individual tas")
+    worker.assign_events_to_tas()
+    progress_fn("Analyze stats for each TA")
+    worker.analyze_tas_individually()
+    progress_fn("Write shaken stats to file")
+    worker.write_stats_to_file()
+    return []
+
+
+def split_time_range(start_time: datetime.datetime, end_time: datetime.datetime,
+                     period: str):
+    """Split the time range into back to back windows of one of the PERIODS,
+    with the last window cut short at end_time"""
+    windows = []
+    window_start = start_time
+    while window_start < end_time:
+        window_end = min(window_start + PERIODS[period], end_time)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+class _WorkEvent(typing.NamedTuple):
+    time_stamp: datetime.datetime
+    event_type: str
+    student_name: str
+    ta_name: str
+    is_begin: bool
+    og_data: typing.Tuple[str, ...]
+    uniq_item: str
+
+    queue_errors = []
 
     @classmethod
     def from_native_data(cls, row):
-        time_stamp_str = row[0]
-        # TODO: convert to datetime.datetime.fromisoformat
-        # once we are using python 3.7
-        time_stamp = datetime.datetime.strptime(time_stamp_str,
-                                                "%Y-%m-%dT%H:%M:%S.%f")
+        time_stamp = datetime.datetime.fromisoformat(row[0])
 
         # The old lock format did not have an event_type field
         # (all locks were for labs)
@@ -112,7 +237,7 @@ class _WorkEvent:
         is_lock = lock_type == "LOCK"
 
         return _WorkEvent(time_stamp, event_type, student_name, ta_netid,
-                          is_lock, row, uniq_item)
+                          is_lock, tuple(row), uniq_item)
 
     uniq_help_id = 0
 
@@ -123,8 +248,7 @@ class _WorkEvent:
             ta_name = row[2]
 
             begin_time_str = row[4]
-            begin_time = datetime.datetime.strptime(begin_time_str,
-                                                    "%m/%d/%Y %I:%M:%S %p")
+            begin_time = _parse_queue_time(begin_time_str)
 
             duration_str = row[7]
             if duration_str == "None":  # student helped themselves
@@ -145,9 +269,9 @@ class _WorkEvent:
             cls.uniq_help_id += 1
 
             begin_event = _WorkEvent(begin_time, 'HELP', student_name, ta_name,
-                                     True, row, uniq_item)
+                                     True, tuple(row), uniq_item)
             end_event = _WorkEvent(end_time, 'HELP', student_name, ta_name,
-                                   False, row, uniq_item)
+                                   False, tuple(row), uniq_item)
 
             return begin_event, end_event
         except Exception:
@@ -161,11 +285,190 @@ class _WorkEvent:
                 f"({self.og_data})")
 
 
-def _sandwiches(outer_pair, inner_pair):
-    outer_begin, outer_end = outer_pair
-    inner_begin, inner_end = inner_pair
-    return (outer_begin.time_stamp < inner_begin.time_stamp
-            and outer_end.time_stamp > inner_end.time_stamp)
+def _parse_queue_time(text: str) -> datetime.datetime:
+    """Parse a help queue time like 1/28/2021 3:04:05 PM
+
+    This is the "%m/%d/%Y %I:%M:%S %p" format, split by hand because
+    strptime is slow when reading a semester of queue data.
+    """
+    date, clock, meridiem = text.split()
+    month, day, year = date.split("/")
+    hour, minute, second = (int(part) for part in clock.split(":"))
+    if not 1 <= hour <= 12 or meridiem.upper() not in ("AM", "PM"):
+        raise ValueError(f"Invalid help queue time '{text}'")
+    hour = hour % 12 + (12 if meridiem.upper() == "PM" else 0)
+    return datetime.datetime(int(year), int(month), int(day), hour, minute,
+                             second)
+
+
+def _line_start(log_file, offset: int) -> int:
+    """The offset of the first line starting at or after offset"""
+    if offset == 0:
+        return 0
+    log_file.seek(offset - 1)
+    log_file.readline()
+    return log_file.tell()
+
+
+def _lock_log_offset(log_file, time_stamp: datetime.datetime) -> int:
+    """Bisect the lock log for the offset of the first row logged at or
+    after time_stamp
+
+    The lock log is appended to as TAs work, so its rows are in order.
+    """
+    log_file.seek(0, os.SEEK_END)
+    low, high = 0, log_file.tell()
+    while low < high:
+        middle = (low + high) // 2
+        log_file.seek(_line_start(log_file, middle))
+        line = log_file.readline()
+        row_time = line.split(b",", 1)[0].decode()
+        if not line or datetime.datetime.fromisoformat(row_time) >= time_stamp:
+            high = middle
+        else:
+            low = middle + 1
+    return _line_start(log_file, low)
+
+
+def _read_lock_log(path: str,
+                   start_time: datetime.datetime,
+                   end_time: datetime.datetime,
+                   include_start=False,
+                   netids: typing.Set[str] = None) -> typing.List[_WorkEvent]:
+    """Read the events logged between start_time and end_time, excluding
+    both ends unless include_start is set
+
+    Only the rows near the time range are read and parsed. With netids, the
+    rows of other TAs are skipped without parsing them.
+    """
+    stop_time = end_time + _LOCK_LOG_CLOCK_SKEW
+    events = []
+    with open(path, "rb") as log_file:
+        log_file.seek(
+            _lock_log_offset(log_file, start_time - _LOCK_LOG_CLOCK_SKEW))
+        lines = io.TextIOWrapper(log_file, newline="")
+        if netids is not None:
+            # Rows start with their ISO time stamp, which sorts as text. The
+            # netid is always the second to last column.
+            stop_text = stop_time.isoformat()
+            lines = (line for line in itertools.takewhile(
+                lambda line: line < stop_text, lines)
+                     if line.rsplit(",", 2)[1] in netids)
+
+        for row in csv.reader(lines):
+            time_stamp = datetime.datetime.fromisoformat(row[0])
+            if time_stamp >= stop_time:
+                break
+            after_start = (time_stamp >= start_time
+                           if include_start else time_stamp > start_time)
+            if after_start and time_stamp < end_time:
+                events.append(_WorkEvent.from_native_data(row))
+    return events
+
+
+def _sandwiched_pairs(open_close_pairs) -> typing.Set[int]:
+    """Return the indices of the pairs that began strictly after and ended
+    strictly before some other pair
+
+    The pairs are swept in order of their begin times, keeping the latest
+    end time of the pairs that began strictly earlier.
+    """
+    order = sorted(range(len(open_close_pairs)),
+                   key=lambda i: open_close_pairs[i][0].time_stamp)
+
+    sandwiched = set()
+    latest_end = None
+    for _, group in itertools.groupby(
+            order, key=lambda i: open_close_pairs[i][0].time_stamp):
+        # Pairs beginning at the same time can't sandwich each other
+        group = list(group)
+        for i in group:
+            end_time = open_close_pairs[i][1].time_stamp
+            if latest_end is not None and latest_end > end_time:
+                sandwiched.add(i)
+        group_end = max(open_close_pairs[i][1].time_stamp for i in group)
+        if latest_end is None or group_end > latest_end:
+            latest_end = group_end
+    return sandwiched
+
+
+def _pair_events(events: typing.List[_WorkEvent]):
+    """Pair each item's begin event with its close event
+
+    Returns the pairs and a dict of the items still open at the end, mapping
+    the uniq_item key to the begin event.
+    """
+    # events from queue data might not be sorted
+    sorted_events = sorted(events, key=lambda event: event.time_stamp)
+
+    # maps from uniq_item key to begin event for that item
+    # until the close event is encountered
+    open_items = dict()
+    open_close_pairs = []
+
+    for event in sorted_events:
+        if event.is_begin:
+            if event.uniq_item not in open_items:
+                open_items[event.uniq_item] = event
+        else:
+            if event.uniq_item in open_items:
+                open_close_pairs.append((open_items[event.uniq_item], event))
+                del open_items[event.uniq_item]
+
+    return open_close_pairs, open_items
+
+
+def _item_states(events: typing.List[_WorkEvent]):
+    """Return the items with events, and the items left open at the end of
+    the events, as (netid, event type, uniq_item) keys"""
+    streams = dict()
+    for event in events:
+        streams.setdefault((event.ta_name, event.event_type), []).append(event)
+
+    touched_items = set()
+    open_items = set()
+    for (netid, event_type), stream in streams.items():
+        touched_items.update(
+            (netid, event_type, event.uniq_item) for event in stream)
+        open_items.update((netid, event_type, uniq_item)
+                          for uniq_item in _pair_events(stream)[1])
+    return touched_items, open_items
+
+
+def _spanned_streams(touched_items: typing.List[set],
+                     open_items: typing.List[set]) -> typing.Set[tuple]:
+    """The (segment index, netid, event type) of each TA's work in the
+    segments that an item left open passes through
+
+    An item left open in one segment and used again in a later one can
+    make a pair spanning every segment between them, so the TA's work in
+    those segments can't be counted one segment at a time. Items never used
+    again don't matter.
+    """
+    spanned = set()
+    # maps each item left open to the segment it was left open in
+    left_open = dict()
+    for index, (touched, still_open) in enumerate(zip(touched_items,
+                                                      open_items)):
+        for item in touched & left_open.keys():
+            netid, event_type, _ = item
+            spanned.update(
+                (spanned_index, netid, event_type)
+                for spanned_index in range(left_open.pop(item), index + 1))
+        for item in still_open:
+            left_open[item] = index
+    return spanned
+
+
+class _WorkCounts(typing.NamedTuple):
+    num_closed: int = 0
+    # The time spent on the closed items that weren't forgotten
+    closed_time: datetime.timedelta = datetime.timedelta()
+    num_forgot_to_close: int = 0
+
+    def add(self, other: "_WorkCounts") -> "_WorkCounts":
+        return _WorkCounts(*(mine + theirs
+                             for mine, theirs in zip(self, other)))
 
 
 class _EventStreamStats:
@@ -175,46 +478,34 @@ class _EventStreamStats:
         self.total_time = datetime.timedelta()
         self.total_num_closed = 0
         self.worked_event_pairs = []
+        self.counts = _WorkCounts()
 
-    def analyze(self, events: typing.List[_WorkEvent],
-                forgot_to_close_threshold, default_avg_time):
-        if not events:
-            return
-        # events from queue data might not be sorted
-        sorted_events = sorted(events, key=lambda event: event.time_stamp)
-
-        # maps from uniq_item key to begin event for that item
-        # until the close event is encountered
-        open_items = dict()
-        open_close_pairs = []
-
-        for event in sorted_events:
-            if event.is_begin:
-                if event.uniq_item not in open_items:
-                    open_items[event.uniq_item] = event
-            else:
-                if event.uniq_item in open_items:
-                    open_close_pairs.append(
-                        (open_items[event.uniq_item], event))
-                    del open_items[event.uniq_item]
+    def count(self, events: typing.List[_WorkEvent],
+              forgot_to_close_threshold) -> dict:
+        """Count the items worked on in the events
+
+        Returns the items left open at the end of the events.
+        """
+        open_close_pairs, open_items = _pair_events(events)
 
         # if the total time is too long, the TA probably just forgot
         # to close the item. keep track of this to account for it after
         num_forgot_to_close = 0
+        closed_time = datetime.timedelta()
+
+        # if an item was both locked and unlocked while another item was
+        # open, then it doesn't count, so we only count unsandwiched items
+        sandwiched = _sandwiched_pairs(open_close_pairs)
 
         new_worked_event_pairs = []
-        for open_close_pair in open_close_pairs:
-            # if an item was both locked and unlocked while another item was
-            # open, then it doesn't count, so we only count unsandwiched items
-            if not any(
-                    map(lambda outer: _sandwiches(outer, open_close_pair),
-                        open_close_pairs)):
+        for index, open_close_pair in enumerate(open_close_pairs):
+            if index not in sandwiched:
                 open_event, close_event = open_close_pair
                 time_spent = close_event.time_stamp - open_event.time_stamp
                 if time_spent > _EventStreamStats.REAL_WORK_THRESHOLD:
                     new_worked_event_pairs.append(open_close_pair)
                     if time_spent < forgot_to_close_threshold:
-                        self.total_time += time_spent
+                        closed_time += time_spent
                     else:
                         num_forgot_to_close += 1
 
@@ -222,13 +513,26 @@ class _EventStreamStats:
             self.worked_event_pairs + new_worked_event_pairs,
             key=lambda p: (p[0].time_stamp, p[1].time_stamp))
 
-        self.total_num_closed = len(self.worked_event_pairs)
+        self.add_counts(
+            _WorkCounts(len(new_worked_event_pairs), closed_time,
+                        num_forgot_to_close))
+        return open_items
+
+    def add_counts(self, counts: _WorkCounts):
+        self.counts = self.counts.add(counts)
 
-        num_closed_added_to_time = self.total_num_closed - num_forgot_to_close
-        avg_time = (self.total_time / num_closed_added_to_time
+    def finish(self, default_avg_time):
+        """Total the time spent, counting each forgotten item as the
+        average time of the others"""
+        self.total_num_closed = self.counts.num_closed
+
+        num_closed_added_to_time = (self.counts.num_closed -
+                                    self.counts.num_forgot_to_close)
+        avg_time = (self.counts.closed_time / num_closed_added_to_time
                     if num_closed_added_to_time != 0 else default_avg_time)
 
-        self.total_time += avg_time * num_forgot_to_close
+        self.total_time = (self.counts.closed_time +
+                           avg_time * self.counts.num_forgot_to_close)
 
 
 class _TA:
@@ -237,6 +541,8 @@ class _TA:
         self.lab_events: typing.List[_WorkEvent] = []
         self.email_events: typing.List[_WorkEvent] = []
         self.help_events: typing.List[_WorkEvent] = []
+        # Counts from the daily summaries, by event type
+        self.summary_counts: typing.Dict[str, _WorkCounts] = dict()
 
     def add_event(self, event: _WorkEvent):
         if event.event_type == 'LAB':
@@ -249,31 +555,121 @@ class _TA:
             raise ValueError(
                 f"Unknown event type '{event.event_type}' encountered")
 
+    def add_summary_counts(self, event_type: str, counts: _WorkCounts):
+        self.summary_counts[event_type] = self.summary_counts.get(
+            event_type, _WorkCounts()).add(counts)
+
     def analyze_all_events(self):
         self.lab_stats = _EventStreamStats()
         self.email_stats = _EventStreamStats()
         self.help_stats = _EventStreamStats()
 
-        # the default average times were taken from the first seven weeks
-        # of the Winter 2021 semester
-        # they are the mean of the average time per item across all TAs
-        #
-        # the forgot to close thresholds were chosen arbitrarily but carefully
-        # the main rationale was finding a time where it could clearly be said
-        # "work events never take that long to finish, so if an item was open
-        # that long, it must have been a mistake"
-        self.lab_stats.analyze(
-            self.lab_events,
-            forgot_to_close_threshold=datetime.timedelta(minutes=30),
-            default_avg_time=datetime.timedelta(minutes=6, seconds=4))
-        self.email_stats.analyze(
-            self.email_events,
-            forgot_to_close_threshold=datetime.timedelta(minutes=30),
-            default_avg_time=datetime.timedelta(minutes=4, seconds=20))
-        self.help_stats.analyze(
-            self.help_events,
-            forgot_to_close_threshold=datetime.timedelta(hours=1),
-            default_avg_time=datetime.timedelta(minutes=9, seconds=42))
+        for event_type, stats, events in (
+            ('LAB', self.lab_stats, self.lab_events),
+            ('EMAIL', self.email_stats, self.email_events),
+            ('HELP', self.help_stats, self.help_events),
+        ):
+            stats.count(events, _FORGOT_TO_CLOSE_THRESHOLDS[event_type])
+            if event_type in self.summary_counts:
+                stats.add_counts(self.summary_counts[event_type])
+            stats.finish(_DEFAULT_AVG_TIMES[event_type])
+
+
+def _day_segments(start_time: datetime.datetime, end_time: datetime.datetime):
+    """Split the time range at each midnight
+
+    Returns (start, end, date) for each part, where date is None unless the
+    part is a whole day. The range excludes start_time, so when it starts
+    at midnight the first day is missing the rows logged at midnight.
+    """
+    segments = []
+    segment_start = start_time
+    while segment_start < end_time:
+        next_midnight = datetime.datetime.combine(
+            segment_start.date() + datetime.timedelta(days=1), datetime.time())
+        segment_end = min(next_midnight, end_time)
+        is_whole_day = (segment_start.time() == datetime.time()
+                        and segment_end == next_midnight)
+        segments.append((segment_start, segment_end,
+                         segment_start.date() if is_whole_day else None))
+        segment_start = segment_end
+    return segments
+
+
+def _summarize_day(day: datetime.date) -> dict:
+    """Count each TA's work from the lock log for one day"""
+    day_start = datetime.datetime.combine(day, datetime.time())
+    day_end = day_start + datetime.timedelta(days=1)
+    events = _read_lock_log(get_lock_log_path(),
+                            day_start,
+                            day_end,
+                            include_start=True)
+
+    # netids are kept in the order they first appear, like a full read
+    streams = dict()
+    for event in events:
+        if event.event_type not in _FORGOT_TO_CLOSE_THRESHOLDS:
+            raise ValueError(
+                f"Unknown event type '{event.event_type}' encountered")
+        streams.setdefault(event.ta_name,
+                           dict()).setdefault(event.event_type,
+                                              []).append(event)
+
+    counts = dict()
+    for netid, ta_streams in streams.items():
+        counts[netid] = dict()
+        for event_type, stream in ta_streams.items():
+            stats = _EventStreamStats()
+            stats.count(stream, _FORGOT_TO_CLOSE_THRESHOLDS[event_type])
+            counts[netid][event_type] = [
+                stats.counts.num_closed,
+                stats.counts.closed_time // datetime.timedelta(microseconds=1),
+                stats.counts.num_forgot_to_close
+            ]
+
+    touched_items, open_items = _item_states(events)
+    return {
+        "version": _SUMMARY_VERSION,
+        "has_midnight_rows":
+        any(event.time_stamp == day_start for event in events),
+        "counts": counts,
+        "touched_items": sorted(touched_items),
+        "open_items": sorted(open_items)
+    }
+
+
+def _load_day_summary(day: datetime.date, refresh=False) -> dict:
+    """The summary of a day of the lock log, made and saved the first time
+    it is needed. Returns None for days that can still get new rows."""
+    day_end = datetime.datetime.combine(day + datetime.timedelta(days=1),
+                                        datetime.time())
+    if day_end + _LOCK_LOG_CLOCK_SKEW > datetime.datetime.now():
+        return None
+
+    path = os.path.join(SharedData.get_shake_directory(),
+                        f"{day.isoformat()}.json")
+    if not refresh and os.path.exists(path):
+        try:
+            with open(path, "r") as _file:
+                summary = json.load(_file)
+            if summary.get("version") == _SUMMARY_VERSION:
+                return summary
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    summary = _summarize_day(day)
+    directory = os.path.dirname(path)
+    fd, temp_name = tempfile.mkstemp(prefix=".summary-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as _file:
+            json.dump(summary, _file)
+        # mkstemp files are private, the summaries are shared
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, path)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    return summary
 
 
 def _select_time(title: str, default_time: datetime.time):
@@ -290,8 +686,25 @@ def _select_time(title: str, default_time: datetime.time):
 class _StatsWorker:
     def __init__(self):
         self.native_events = []
+        # Counts from the daily summaries for each netid, in the order the
+        # TAs first appear in the lock log
+        self.native_counts: typing.Dict[str, list] = dict()
+        # Redo the daily summaries instead of using the saved ones
+        self.refresh_summaries = False
         self.queuee_events = []
         self.tas: typing.Dict[str, _TA] = dict()
+        # (start, end) windows to report separately instead of the whole
+        # time range, each counted by its own worker
+        self.windows: typing.List[typing.Tuple[datetime.datetime,
+                                               datetime.datetime]] = []
+        self.window_workers: typing.List[_StatsWorker] = []
+
+    def set_windows(self, windows):
+        self.windows = list(windows)
+        if not self.windows:
+            raise ValueError("there are no time windows to shake")
+        self.start_time = min(start for start, _ in self.windows)
+        self.end_time = max(end for _, end in self.windows)
 
     def select_start_time(self):
         self.start_time = _select_time(
@@ -301,18 +714,141 @@ class _StatsWorker:
     def select_end_time(self):
         self.end_time = _select_time(
             "End Time", datetime.time(hour=23, minute=59, second=59))
+        if self.end_time and self.end_time <= self.start_time:
+            popup = ui.layers.Popup("Bob's Shake", [
+                "The end time must be after the start time",
+            ])
+            ui.get_window().run_layer(popup)
+            return False
         return self.end_time
 
+    def select_period(self):
+        options = ["Whole Range"] + [period.title() for period in PERIODS]
+        period_input = ui.layers.ListLayer("Split Into Windows", popup=True)
+        for option in options:
+            period_input.add_row_text(option)
+        ui.get_window().run_layer(period_input, "Bob's Shake")
+        if period_input.canceled:
+            return False
+
+        index = period_input.selected_index()
+        if index > 0:
+            period = list(PERIODS)[index - 1]
+            self.set_windows(
+                split_time_range(self.start_time, self.end_time, period))
+        return True
+
     def read_in_native_stats(self):
-        """goes through zygrader's lock log, using each row to make an event"""
-        file_name = get_lock_log_path()
-        with open(file_name, 'r', newline='') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                event = _WorkEvent.from_native_data(row)
-                if (event.time_stamp > self.start_time
-                        and event.time_stamp < self.end_time):
-                    self.native_events.append(event)
+        """goes through zygrader's lock log, using each row in the time range
+        to make an event
+
+        Whole days are counted from their daily summaries instead, except
+        for TAs who left an item open across midnight and used it again,
+        since their work on those days depends on the other days.
+        """
+        if self.windows:
+            self.read_in_window_native_stats()
+            return
+
+        log_path = get_lock_log_path()
+        segments = _day_segments(self.start_time, self.end_time)
+        summaries = [
+            _load_day_summary(day, self.refresh_summaries) if day else None
+            for _, _, day in segments
+        ]
+        # The range leaves out its start time, so a first day with rows
+        # logged right at midnight can't use its summary
+        if summaries and summaries[0] and summaries[0]["has_midnight_rows"]:
+            summaries[0] = None
+
+        def read_segment(index, netids=None):
+            segment_start, segment_end, _ = segments[index]
+            return _read_lock_log(log_path,
+                                  segment_start,
+                                  segment_end,
+                                  include_start=segment_start
+                                  != self.start_time,
+                                  netids=netids)
+
+        segment_events = dict()
+        touched_items = []
+        open_items = []
+        for index, summary in enumerate(summaries):
+            if summary:
+                touched_items.append(
+                    set(map(tuple, summary.pop("touched_items"))))
+                open_items.append(set(map(tuple, summary.pop("open_items"))))
+            else:
+                segment_events[index] = read_segment(index)
+                touched, still_open = _item_states(segment_events[index])
+                touched_items.append(touched)
+                open_items.append(still_open)
+
+        spanned_streams = _spanned_streams(touched_items, open_items)
+        # Only the counts are needed from here on
+        del touched_items, open_items
+        num_summarized_streams = sum(
+            len(counts) for summary in summaries if summary
+            for counts in summary["counts"].values())
+        if len(spanned_streams) * 2 > num_summarized_streams:
+            # Most of the work depends on other days, so reading the whole
+            # range at once is faster than reading it a TA at a time
+            self.__add_native_events(
+                _read_lock_log(log_path, self.start_time, self.end_time))
+            return
+
+        spanned = dict()
+        for index, netid, event_type in spanned_streams:
+            spanned.setdefault(index, set()).add((netid, event_type))
+
+        for index, summary in enumerate(summaries):
+            if not summary:
+                self.__add_native_events(segment_events[index])
+                continue
+
+            streams = spanned.get(index, set())
+            self.__add_summary(summary, streams)
+            if streams:
+                events = read_segment(index, {netid for netid, _ in streams})
+                self.__add_native_events([
+                    event for event in events
+                    if (event.ta_name, event.event_type) in streams
+                ])
+
+    def read_in_window_native_stats(self):
+        """Read the lock log for each window with a worker of its own
+
+        Windows that don't overlap never read the same rows or daily
+        summaries twice.
+        """
+        self.window_workers = []
+        for start, end in self.windows:
+            worker = _StatsWorker()
+            worker.start_time = start
+            worker.end_time = end
+            worker.refresh_summaries = self.refresh_summaries
+            worker.read_in_native_stats()
+            self.window_workers.append(worker)
+
+    def __add_native_events(self, events: typing.List[_WorkEvent]):
+        for event in events:
+            self.native_counts.setdefault(event.ta_name, [])
+        self.native_events.extend(events)
+
+    def __add_summary(self, summary: dict, skipped_streams: set):
+        """Add the counts of a daily summary, except for the skipped
+        (netid, event type) streams"""
+        for netid, counts in summary["counts"].items():
+            ta_counts = self.native_counts.setdefault(netid, [])
+            for event_type, (num_closed, closed_time,
+                             num_forgot_to_close) in counts.items():
+                if (netid, event_type) in skipped_streams:
+                    continue
+                ta_counts.append(
+                    (event_type,
+                     _WorkCounts(num_closed,
+                                 datetime.timedelta(microseconds=closed_time),
+                                 num_forgot_to_close)))
 
     def select_help_queue_data_file(self):
         filepath_entry = ui.layers.PathInputLayer("Help Queue Data")
@@ -341,6 +877,22 @@ class _StatsWorker:
                     self.queuee_events.append(begin_event)
                     self.queuee_events.append(end_event)
 
+        if self.windows:
+            self.__split_queue_events()
+
+    def __split_queue_events(self):
+        """Give each window's worker the help queue rows inside its window,
+        in the order they are in the file"""
+        pairs = list(zip(self.queuee_events[::2], self.queuee_events[1::2]))
+        order = sorted(range(len(pairs)), key=lambda i: pairs[i][0].time_stamp)
+        begin_times = [pairs[i][0].time_stamp for i in order]
+        for worker in self.window_workers:
+            first = bisect.bisect_right(begin_times, worker.start_time)
+            last = bisect.bisect_left(begin_times, worker.end_time)
+            for i in sorted(order[first:last]):
+                if pairs[i][1].time_stamp < worker.end_time:
+                    worker.queuee_events.extend(pairs[i])
+
     def present_queue_errors(self):
         error_rows = _WorkEvent.queue_errors
         if not error_rows:
@@ -363,24 +915,49 @@ class _StatsWorker:
         if path_input.canceled:
             return False
 
-        with open(path_input.get_path(), "w", newline="") as out_file:
-            writer = csv.writer(out_file)
-            writer.writerows(error_rows)
-
+        self.write_queue_errors(path_input.get_path())
         return True
 
-    def validate_queue_names(self):
-        """Make sure each TA name from the queue has a known netid"""
-        window = ui.get_window()
+    def write_queue_errors(self, path):
+        with open(path, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerows(_WorkEvent.queue_errors)
+
+    def unknown_queue_names(self) -> typing.List[str]:
+        """The TA names from the queue that have no stored netid"""
         used_qnames = {event.ta_name for event in self.queuee_events}
+        stored_qnames = {ta.queue_name for ta in data.get_tas()}
+        return sorted(used_qnames - stored_qnames)
+
+    def store_queue_names(self, queue_netids: typing.Dict[str, str]):
+        """Store the netids of TA names from the queue
+
+        Returns the queue names that are still unknown.
+        """
         stored_tas = data.get_tas().copy()
         stored_netids = {ta.netid: ta for ta in stored_tas}
-        stored_qnames = {ta.queue_name for ta in stored_tas}
 
-        unknown_qnames = used_qnames - stored_qnames
+        for qname in self.unknown_queue_names():
+            if qname not in queue_netids:
+                continue
+            netid = queue_netids[qname]
+            if netid in stored_netids:
+                stored_netids[netid].queue_name = qname
+            else:
+                new_ta = data.model.TA(netid, qname)
+                stored_netids[netid] = new_ta
+                stored_tas.append(new_ta)
 
+        data.write_tas(stored_tas)
+        return self.unknown_queue_names()
+
+    def validate_queue_names(self):
+        """Make sure each TA name from the queue has a known netid"""
+        window = ui.get_window()
+
+        queue_netids = dict()
         netid_input = ui.layers.TextInputLayer("Unknown Name in Queue Data")
-        for qname in unknown_qnames:
+        for qname in self.unknown_queue_names():
             netid_input.set_prompt([
                 f"There is no stored TA with the name {qname}.",
                 f"Please enter the netid for {qname}."
@@ -389,18 +966,22 @@ class _StatsWorker:
             window.run_layer(netid_input)
             if netid_input.canceled:
                 return False
-            netid = netid_input.get_text()
-            if netid in stored_netids:
-                stored_netids[netid].queue_name = qname
-            else:
-                new_ta = data.model.TA(netid, qname)
-                stored_netids[netid] = new_ta
-                stored_tas.append(new_ta)
+            queue_netids[qname] = netid_input.get_text()
 
-        data.write_tas(stored_tas)
+        self.store_queue_names(queue_netids)
         return True
 
     def assign_events_to_tas(self):
+        if self.windows:
+            for worker in self.window_workers:
+                worker.assign_events_to_tas()
+            return
+
+        for netid, counts in self.native_counts.items():
+            ta = self.tas.setdefault(netid, _TA(netid))
+            for event_type, work_counts in counts:
+                ta.add_summary_counts(event_type, work_counts)
+
         for event in self.native_events:
             self.tas.setdefault(event.ta_name,
                                 _TA(event.ta_name)).add_event(event)
@@ -412,12 +993,19 @@ class _StatsWorker:
             self.tas.setdefault(netid, _TA(netid)).add_event(event)
 
     def analyze_tas_individually(self):
+        if self.windows:
+            for worker in self.window_workers:
+                worker.analyze_tas_individually()
+            return
+
         for ta in self.tas.values():
             ta.analyze_all_events()
 
     def select_output_file(self):
+        default_name = ("shaken-stats-by-window.csv"
+                        if self.windows else "shaken-stats.csv")
         default_output_path = os.path.join(preferences.get("output_dir"),
-                                           "shaken-stats.csv")
+                                           default_name)
         path = filename_input(purpose="the shaken stats",
                               text=default_output_path)
         if path is None:
@@ -426,6 +1014,10 @@ class _StatsWorker:
         return True
 
     def write_stats_to_file(self):
+        if self.windows:
+            self.write_window_stats_to_file()
+            return
+
         with open(self.output_path, "w", newline="") as out_file:
             writer = csv.writer(out_file)
             writer.writerow([
@@ -437,3 +1029,21 @@ class _StatsWorker:
                 ta.email_stats.total_num_closed, ta.email_stats.total_time,
                 ta.help_stats.total_num_closed, ta.help_stats.total_time
             ] for netid, ta in self.tas.items()])
+
+    def write_window_stats_to_file(self):
+        """Write one row for each TA, window, and category of work"""
+        with open(self.output_path, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["Netid", "Window", "Category", "Count", "Time"])
+            for worker in self.window_workers:
+                window = f"{worker.start_time} to {worker.end_time}"
+                for netid, ta in worker.tas.items():
+                    for category, stats in (
+                        ("Grading", ta.lab_stats),
+                        ("Email", ta.email_stats),
+                        ("Help", ta.help_stats),
+                    ):
+                        writer.writerow([
+                            netid, window, category, stats.total_num_closed,
+                            stats.total_time
+                        ])
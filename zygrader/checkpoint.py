@@ -0,0 +1,103 @@
+"""Checkpoint: Save the progress of long running jobs so they can resume
+
+A checkpoint is a JSON lines file in the class logs directory, named after
+a signature of the job's parameters. The first line describes the job and
+each following line is the result of one finished unit of work, appended
+as soon as it finishes. A crash or disconnect loses at most the line being
+written, which is skipped when the checkpoint is loaded.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+
+from zygrader.config.shared import SharedData
+
+
+def job_signature(kind: str, params) -> str:
+    """A short hash identifying a job by its kind and parameters"""
+    encoded = json.dumps([kind, params], sort_keys=True)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+
+class Checkpoint:
+    """The saved progress of one job"""
+    def __init__(self, kind: str, params, description=""):
+        self.signature = job_signature(kind, params)
+        self.description = description
+        self.path = os.path.join(SharedData.get_logs_directory(),
+                                 f"checkpoint-{kind}-{self.signature}.jsonl")
+        # When the saved job was started, set by load()
+        self.started = None
+
+        self.__lock = threading.Lock()
+        self.__file = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> typing.Dict[str, typing.Any]:
+        """Return the saved results, keyed by unit of work"""
+        results = {}
+        if not self.exists():
+            return results
+
+        with open(self.path, "r") as _file:
+            try:
+                header = json.loads(_file.readline())
+                self.started = header["started"]
+                for line in _file:
+                    entry = json.loads(line)
+                    results[entry["key"]] = entry["result"]
+            except (json.JSONDecodeError, KeyError):
+                # The last line was only partly written
+                pass
+
+        return results
+
+    def start(self, resume=False):
+        """Open the checkpoint for writing
+
+        Unless resuming, any saved progress is discarded.
+        """
+        if resume and self.exists():
+            # Drop a partly written last line so new results don't get
+            # appended to it
+            with open(self.path, "rb+") as _file:
+                _file.truncate(_file.read().rfind(b"\n") + 1)
+
+            # Without a complete header there is nothing to resume
+            if os.path.getsize(self.path):
+                self.__file = open(self.path, "a")
+                return
+
+        self.__file = open(self.path, "w")
+        header = {
+            "signature": self.signature,
+            "description": self.description,
+            "started": time.time()
+        }
+        self.__file.write(json.dumps(header) + "\n")
+        self.__file.flush()
+
+    def record(self, key: str, result):
+        """Save the result of one unit of work. Safe to call from threads."""
+        line = json.dumps({"key": key, "result": result}) + "\n"
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+
+    def close(self):
+        """Stop writing but keep the checkpoint so the job can resume"""
+        with self.__lock:
+            if self.__file:
+                self.__file.close()
+                self.__file = None
+
+    def finish(self):
+        """The job is done, remove the checkpoint"""
+        self.close()
+        if self.exists():
+            os.remove(self.path)
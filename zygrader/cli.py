@@ -0,0 +1,481 @@
+"""CLI: Headless subcommands for admin tasks
+
+Each subcommand runs one of the admin tools from flags (or a job file)
+instead of curses prompts, so it can be scheduled with cron. Progress is
+printed to stderr and the same CSV files are written as from the menus.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from zygrader import admin, bobs_shake, data, grade_puller
+from zygrader.config import preferences
+from zygrader.zybooks import Zybooks
+
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M"]
+
+# Every assignment in a pull job file needs these
+PULL_JOB_KEYS = ["assignment", "zybook_sections", "class_sections"]
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def parse_datetime(text: str) -> datetime.datetime:
+    for date_format in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    raise ValueError(f"{text} is not a date and time like 2021-02-01 23:59:59")
+
+
+def __datetime_arg(text: str) -> datetime.datetime:
+    try:
+        return parse_datetime(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def __queue_name_arg(text: str):
+    qname, _, netid = text.rpartition("=")
+    if not qname or not netid:
+        raise argparse.ArgumentTypeError(
+            f"{text} is not of the form NAME=NETID")
+    return qname, netid
+
+
+def __output_path(path, default_name):
+    return os.path.expanduser(
+        path or os.path.join(preferences.get("output_dir"), default_name))
+
+
+def __authenticate() -> bool:
+    """Sign in with the saved session from the last interactive login"""
+    log("Signing into zyBooks")
+    if Zybooks().authenticate("", ""):
+        return True
+
+    log("Error: could not sign into zyBooks."
+        " Run zygrader interactively to sign in first.")
+    return False
+
+
+def __load_gradebook():
+    """Return a GradePuller with the Canvas gradebook loaded, or None"""
+    puller = grade_puller.GradePuller()
+    try:
+        puller.load_canvas_csv()
+    except (FileNotFoundError, PermissionError) as e:
+        log(f"Error: could not read the Canvas gradebook: {e}")
+        return None
+    return puller
+
+
+def __check_assignments(puller, *assignments) -> bool:
+    real_assignments = puller.canvas_header[grade_puller.GradePuller.
+                                            NUM_CANVAS_ID_COLUMNS:]
+    for assignment in assignments:
+        if assignment and assignment not in real_assignments:
+            log(f"Error: there is no assignment named {assignment}"
+                " in the Canvas gradebook")
+            return False
+    return True
+
+
+def __check_class_sections(class_sections) -> bool:
+    known = {section.section_number for section in data.get_class_sections()}
+    unknown = [section for section in class_sections if section not in known]
+    if unknown:
+        log(f"Error: unknown class sections {unknown}")
+        return False
+    return True
+
+
+def __zybook_sections(zybooks_toc, numbers):
+    """Look up "chapter.section" numbers in the zyBook table of contents"""
+    sections = {
+        (int(chapter["number"]), int(section["number"])): section
+        for chapter in zybooks_toc
+        for section in chapter["sections"]
+    }
+
+    selected = []
+    for number in numbers:
+        try:
+            chapter, section = map(int, str(number).split("."))
+            selected.append(sections[(chapter, section)])
+        except (ValueError, KeyError):
+            raise ValueError(f"there is no zyBook section {number}")
+    return selected
+
+
+def __pull_jobs(args):
+    """The assignments to pull, from the job file or the flags"""
+    if args.job:
+        with open(args.job, "r") as job_file:
+            job = json.load(job_file)
+        if "assignments" not in job:
+            raise ValueError(f"{args.job} has no \"assignments\" list")
+        for index, assignment in enumerate(job["assignments"]):
+            missing = [key for key in PULL_JOB_KEYS if key not in assignment]
+            if missing:
+                raise ValueError(f"assignment {index + 1} in {args.job} is"
+                                 f" missing {', '.join(missing)}")
+        return job["assignments"], args.output or job.get("output")
+
+    if not (args.assignment and args.zybook_sections and args.class_sections):
+        raise ValueError("--assignment, --zybook-sections and --class-sections"
+                         " are required without --job")
+
+    assignment = {
+        "assignment": args.assignment,
+        "zybook_sections": args.zybook_sections,
+        "class_sections": args.class_sections,
+    }
+    if args.due:
+        assignment["due"] = args.due
+    return [assignment], args.output
+
+
+def __due_times(puller, class_sections, due):
+    """Each class section's due time. due may be one time for every
+    section or a map from section to time, and defaults to the sections'
+    usual due times yesterday."""
+    due_times = puller.default_due_times(class_sections)
+
+    if isinstance(due, dict):
+        for section, time in due.items():
+            due_times[int(section)] = parse_datetime(time)
+    elif isinstance(due, datetime.datetime):
+        due_times = {section: due for section in class_sections}
+    elif due:
+        due_times = {section: parse_datetime(due) for section in class_sections}
+
+    return due_times
+
+
+def pull(args) -> int:
+    try:
+        assignments, output_path = __pull_jobs(args)
+    except (OSError, ValueError, KeyError) as e:
+        log(f"Error: {e}")
+        return 1
+
+    puller = __load_gradebook()
+    if not puller:
+        return 1
+    puller.force_refresh = args.refresh
+    assignment_names = [job["assignment"] for job in assignments]
+    if not __check_assignments(puller, *assignment_names):
+        return 1
+    if not __authenticate():
+        return 1
+
+    zybooks_toc = puller.zy_api.get_table_of_contents()
+    if not zybooks_toc:
+        log("Error: could not fetch the zyBook table of contents")
+        return 1
+
+    jobs = []
+    for job in assignments:
+        try:
+            class_sections = [int(section) for section in job["class_sections"]]
+        except (TypeError, ValueError):
+            log(f"Error: bad class sections for {job['assignment']}")
+            return 1
+        if not __check_class_sections(class_sections):
+            return 1
+        try:
+            zybook_sections = __zybook_sections(zybooks_toc,
+                                                job["zybook_sections"])
+            due_times = __due_times(puller, class_sections, job.get("due"))
+        except ValueError as e:
+            log(f"Error: {e}")
+            return 1
+        jobs.append(
+            grade_puller.GradePuller.Assignment(job["assignment"],
+                                                zybook_sections, class_sections,
+                                                due_times))
+
+    num_exports = len(puller.distinct_exports(jobs))
+    log(f"Pulling {len(jobs)} assignments from {num_exports} completion"
+        " reports")
+    try:
+        puller.record_assignments(
+            jobs, lambda done, total: log(
+                f"  Fetched completion report {done}/{total}"))
+    except grade_puller.GradePuller.StoppingException:
+        log("Error: zyBooks did not return a completion report")
+        return 1
+
+    output_path = os.path.expanduser(output_path
+                                     or puller.default_upload_file_path())
+    puller.write_upload_file(output_path, restrict_sections=True)
+    log(f"Wrote {output_path}")
+    return 0
+
+
+def unmatched(args) -> int:
+    puller = __load_gradebook()
+    if not puller or not __authenticate():
+        return 1
+    puller.force_refresh = args.refresh
+
+    zybooks_toc = puller.zy_api.get_table_of_contents()
+    if not zybooks_toc:
+        log("Error: could not fetch the zyBook table of contents")
+        return 1
+    zybook_section_1_1 = zybooks_toc[0]["sections"][0]
+
+    log("Fetching a completion report from zyBooks")
+    try:
+        zybooks_students, zybooks_header = puller.fetch_completion_report(
+            grade_puller.create_last_night(), [zybook_section_1_1])
+    except grade_puller.GradePuller.StoppingException:
+        log("Error: zyBooks did not return a completion report")
+        return 1
+
+    (canvas_students, canvas_headers, zybook_students,
+     zybook_headers) = puller.unmatched_students(zybooks_students,
+                                                 zybooks_header)
+
+    for students, headers, name, path in [
+        (canvas_students, canvas_headers, "canvas",
+         __output_path(args.canvas_output, "unmatched_canvas.csv")),
+        (zybook_students, zybook_headers, "zybooks",
+         __output_path(args.zybooks_output, "unmatched_zybooks.csv")),
+    ]:
+        if not students:
+            log(f"There are no unmatched {name} students")
+            continue
+        puller.write_list(path, students, headers)
+        log(f"Wrote {len(students)} unmatched {name} students to {path}")
+
+    return 0
+
+
+def shake(args) -> int:
+    if args.window:
+        if args.start_time or args.end_time or args.period:
+            log("Error: pass either --window or --from and --to")
+            return 1
+        if any(end <= start for start, end in args.window):
+            log("Error: each --window must end after it starts")
+            return 1
+        windows = args.window
+    elif not args.start_time or not args.end_time:
+        log("Error: pass --from and --to, or at least one --window")
+        return 1
+    elif args.end_time <= args.start_time:
+        log("Error: --to must be after --from")
+        return 1
+    elif args.period:
+        windows = bobs_shake.split_time_range(args.start_time, args.end_time,
+                                              args.period)
+    else:
+        windows = None
+
+    output_path = __output_path(
+        args.output,
+        "shaken-stats-by-window.csv" if windows else "shaken-stats.csv")
+    errors_path = __output_path(args.errors_output, "bad-queue-data.csv")
+
+    if windows:
+        log(f"Shaking {len(windows)} windows")
+        unknown_qnames = bobs_shake.shake_windows_unattended(
+            windows, args.queue_csv, output_path, errors_path,
+            dict(args.queue_name), log, args.refresh)
+    else:
+        unknown_qnames = bobs_shake.shake_unattended(args.start_time,
+                                                     args.end_time,
+                                                     args.queue_csv,
+                                                     output_path, errors_path,
+                                                     dict(args.queue_name), log,
+                                                     args.refresh)
+    if unknown_qnames:
+        log("Error: these names in the queue data have no stored netid:")
+        for qname in unknown_qnames:
+            log(f"  {qname}")
+        log('Pass --queue-name "NAME=NETID" for each of them')
+        return 1
+
+    log(f"Wrote {output_path}")
+    return 0
+
+
+def gaps(args) -> int:
+    puller = __load_gradebook()
+    if not puller:
+        return 1
+
+    rows = admin.gradebook_gaps(puller)
+    if not rows:
+        log("There are no gaps in the gradebook")
+        return 0
+
+    output_path = __output_path(args.output, "gradebook_gaps.csv")
+    admin.write_rows(output_path, rows)
+    log(f"Wrote {output_path}")
+    return 0
+
+
+def mercy(args) -> int:
+    if len(args.midterm) > 2:
+        log("Error: at most two midterms can be given")
+        return 1
+
+    puller = __load_gradebook()
+    if not puller or not __check_assignments(puller, *args.midterm, args.final):
+        return 1
+
+    midterm_1 = args.midterm[0]
+    midterm_2 = args.midterm[1] if len(args.midterm) > 1 else None
+    admin.apply_midterm_mercy(puller, midterm_1, midterm_2, args.final)
+
+    output_path = __output_path(args.output, "midterm_mercy.csv")
+    admin.write_midterm_mercy(puller, output_path, midterm_1, midterm_2)
+    log(f"Wrote {output_path}")
+    log("Don't forget to manually correct as necessary"
+        " (for any students who should not have a score replaced).")
+    return 0
+
+
+def attendance(args) -> int:
+    schemes = dict(admin.ATTENDANCE_SCHEMES)
+    try:
+        points_by_classes_missed = list(
+            schemes.get(args.scheme) or map(int, args.scheme.split(",")))
+    except ValueError:
+        log(f"Error: the scheme must be one of {', '.join(schemes)}"
+            " or a comma separated list of scores")
+        return 1
+
+    puller = __load_gradebook()
+    if not puller or not __check_assignments(
+            puller, args.participation, args.first_missed, args.last_missed):
+        return 1
+    if not __check_class_sections(args.class_sections):
+        return 1
+
+    admin.apply_attendance_score(puller, args.participation, args.first_missed,
+                                 args.last_missed, args.class_sections,
+                                 points_by_classes_missed)
+
+    output_path = __output_path(args.output, "participation.csv")
+    admin.write_attendance_score(puller, output_path, args.participation,
+                                 args.class_sections)
+    log(f"Wrote {output_path}")
+    return 0
+
+
+def add_subcommands(parser):
+    """Add the headless subcommands to the main argument parser"""
+    subparsers = parser.add_subparsers(
+        dest="command",
+        title="headless commands",
+        description="run an admin tool without the menus")
+
+    pull_parser = subparsers.add_parser(
+        "pull", help="pull grades from zyBooks into a Canvas upload file")
+    pull_parser.add_argument("--job",
+                             help="JSON file listing the assignments to pull")
+    pull_parser.add_argument("--assignment", help="Canvas assignment name")
+    pull_parser.add_argument("--zybook-sections",
+                             nargs="+",
+                             metavar="CHAPTER.SECTION",
+                             help="zyBook sections to grade")
+    pull_parser.add_argument("--class-sections",
+                             nargs="+",
+                             type=int,
+                             help="class sections to grade")
+    pull_parser.add_argument("--due",
+                             type=__datetime_arg,
+                             help="due time for every section"
+                             " (default: each section's usual due time)")
+    pull_parser.add_argument("--output", help="Canvas upload file to write")
+    pull_parser.add_argument("--refresh",
+                             action="store_true",
+                             help="don't use cached completion reports")
+    pull_parser.set_defaults(command_fn=pull)
+
+    unmatched_parser = subparsers.add_parser(
+        "unmatched", help="report students that can't be matched to zyBooks")
+    unmatched_parser.add_argument("--canvas-output")
+    unmatched_parser.add_argument("--zybooks-output")
+    unmatched_parser.add_argument("--refresh",
+                                  action="store_true",
+                                  help="don't use a cached completion report")
+    unmatched_parser.set_defaults(command_fn=unmatched)
+
+    shake_parser = subparsers.add_parser("shake",
+                                         help="run Bob's Shake TA statistics")
+    shake_parser.add_argument("--from", dest="start_time", type=__datetime_arg)
+    shake_parser.add_argument("--to", dest="end_time", type=__datetime_arg)
+    shake_parser.add_argument("--period",
+                              choices=list(bobs_shake.PERIODS),
+                              help="report each day or week from --from"
+                              " to --to separately")
+    shake_parser.add_argument("--window",
+                              type=__datetime_arg,
+                              nargs=2,
+                              action="append",
+                              default=[],
+                              metavar=("FROM", "TO"),
+                              help="a time range to report separately,"
+                              " instead of --from and --to")
+    shake_parser.add_argument("--queue-csv",
+                              required=True,
+                              help="data copied from the help queue")
+    shake_parser.add_argument("--queue-name",
+                              type=__queue_name_arg,
+                              action="append",
+                              default=[],
+                              metavar="NAME=NETID",
+                              help="netid of a TA new to the queue data")
+    shake_parser.add_argument("--output")
+    shake_parser.add_argument("--errors-output",
+                              help="where to write queue rows with errors")
+    shake_parser.add_argument("--refresh",
+                              action="store_true",
+                              help="redo the saved daily summaries")
+    shake_parser.set_defaults(command_fn=shake)
+
+    gaps_parser = subparsers.add_parser(
+        "gaps", help="report gradebook cells without a score")
+    gaps_parser.add_argument("--output")
+    gaps_parser.set_defaults(command_fn=gaps)
+
+    mercy_parser = subparsers.add_parser(
+        "mercy", help="replace the lower midterm with the final exam score")
+    mercy_parser.add_argument("--midterm",
+                              action="append",
+                              required=True,
+                              help="midterm assignment (once or twice)")
+    mercy_parser.add_argument("--final", required=True)
+    mercy_parser.add_argument("--output")
+    mercy_parser.set_defaults(command_fn=mercy)
+
+    attendance_parser = subparsers.add_parser(
+        "attendance", help="calculate participation from classes missed")
+    attendance_parser.add_argument("--participation", required=True)
+    attendance_parser.add_argument("--first-missed", required=True)
+    attendance_parser.add_argument("--last-missed", required=True)
+    attendance_parser.add_argument("--class-sections",
+                                   nargs="+",
+                                   type=int,
+                                   required=True)
+    attendance_parser.add_argument(
+        "--scheme",
+        required=True,
+        help="TR, MWF or a comma separated list of scores")
+    attendance_parser.add_argument("--output")
+    attendance_parser.set_defaults(command_fn=attendance)
+
+
+def run(args) -> int:
+    """Run a headless subcommand, returning the exit status"""
+    return args.command_fn(args)
@@ -0,0 +1,486 @@
+"""Compiler: Compile student code, caching executables and compiler errors
+
+Compiled results are stored in zygrader_data/SEMESTER_FOLDER/.compiled/ and
+shared between all graders. Entries are keyed by a hash of the source files,
+the compiler version, and the compile flags, so running a submission again
+(or a pair partner's identical code) skips the compiler entirely.
+"""
+import concurrent.futures
+import functools
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import typing
+
+from zygrader import supervisor
+from zygrader.config.shared import SharedData
+
+COMPILER = "g++"
+COMPILE_FLAGS = ["-g"]
+
+EXECUTABLE_NAME = "run"
+OBJECT_NAME = "object.o"
+STDERR_NAME = "stderr.txt"
+# Touched whenever an entry is used, for least recently used eviction
+USED_NAME = "used"
+
+# Standard headers included by nearly every lab. In multi-file compiles, the
+# ones a source file includes before anything else are precompiled once per
+# compiler version and flags.
+COMMON_HEADERS = [
+    "iostream", "iomanip", "fstream", "sstream", "string", "vector", "cmath",
+    "algorithm", "stdexcept"
+]
+PCH_HEADER_NAME = "zygrader_common.h"
+
+# Limits for a single compiler process, so one pathological submission can't
+# slow down a shared lab server. The timeout is in seconds.
+COMPILE_TIMEOUT = 60
+COMPILE_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+
+# The cache is shared by all graders, evict the least recently used entries
+# once it grows past this size (in bytes). Checking the size walks the whole
+# cache, so it is done at most once per EVICT_INTERVAL seconds, after new
+# entries are built.
+CACHE_SIZE_LIMIT = 1024 * 1024 * 1024
+EVICT_INTERVAL = 5 * 60
+EVICTED_NAME = ".evicted"
+
+# Compiler processes one multi-file compile may run at once. Workers of a
+# create_pool() pool get an even share of the CPUs instead, so a lab-wide
+# compile runs about one compiler per CPU in total.
+__compile_threads = os.cpu_count() or 1
+
+
+class CompileTimeout(Exception):
+    pass
+
+
+class CompileResult:
+    def __init__(self, executable: str, stderr: str, cached: bool):
+        # Path to the executable, empty if compilation failed
+        self.executable = executable
+        self.stderr = stderr
+        self.cached = cached
+
+    def success(self) -> bool:
+        return bool(self.executable)
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiler_version() -> str:
+    """Return the first line of the compiler's version string"""
+    try:
+        version = subprocess.run([COMPILER, "--version"],
+                                 encoding="utf-8",
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+    except OSError:
+        return ""
+    return version.stdout.split("\n")[0]
+
+
+def __hash_files(digest, root_dir: str, paths: typing.List[str]):
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, root_dir).encode())
+        digest.update(b"\0")
+        with open(path, "rb") as _file:
+            digest.update(_file.read())
+        digest.update(b"\0")
+
+
+def get_cache_key(root_dir: str, flags: typing.List[str]) -> str:
+    """Hash every file under root_dir along with the compiler and flags
+
+    Headers and data files are included because they can change the result
+    of compiling even when the .cpp files are identical.
+    """
+    digest = hashlib.sha256()
+    digest.update(get_compiler_version().encode())
+    digest.update("\0".join(flags).encode())
+
+    paths = []
+    for root, _, files in os.walk(root_dir):
+        for file in files:
+            paths.append(os.path.join(root, file))
+
+    __hash_files(digest, root_dir, paths)
+
+    return digest.hexdigest()
+
+
+def __touch(path: str):
+    """Set the modification time of path to now, creating it if needed
+
+    Created files are group writable. Anyone who may write to a file may set
+    its time to now, so any grader can mark it, not only its owner.
+    """
+    try:
+        os.utime(path)
+        return
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return
+
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o664)
+    except OSError:
+        return
+    try:
+        # The mode given to open is masked by the umask
+        os.fchmod(fd, 0o664)
+    except OSError:
+        pass  # Another grader created it first
+    finally:
+        os.close(fd)
+
+
+def __read_entry(entry: str) -> CompileResult:
+    with open(os.path.join(entry, STDERR_NAME), "r") as _file:
+        stderr = _file.read()
+
+    executable = os.path.join(entry, EXECUTABLE_NAME)
+    if not os.path.exists(executable):
+        executable = ""
+
+    return CompileResult(executable, stderr, True)
+
+
+def __get_entry(key: str, build_fn: typing.Callable[[str], None]) -> str:
+    """Return the cache entry for key, calling build_fn to create it if needed
+
+    build_fn is given a staging directory to write the entry's files into.
+    The staging directory is renamed into place afterwards so other graders
+    never see a partially written entry.
+    """
+    cache = SharedData.get_compiled_directory()
+    entry = os.path.join(cache, key)
+
+    if os.path.isdir(entry):
+        __touch(os.path.join(entry, USED_NAME))
+        return entry
+
+    # Group writable so any grader can evict it
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=cache)
+    os.chmod(staging, 0o775)
+    __touch(os.path.join(staging, USED_NAME))
+    try:
+        build_fn(staging)
+    except CompileTimeout:
+        # Timeouts may be caused by server load, so they are never cached
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(staging, entry)
+    except OSError:
+        # Another grader built the same entry first
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return entry
+
+
+def __run_compiler(staging: str,
+                   output_name: str,
+                   command: typing.List[str],
+                   root_dir: str = None):
+    """Run a compiler command, saving stderr and only successful output
+
+    With a root_dir, the command is run from it and should name sources by
+    relative paths. Cached results are shared, so neither the errors nor the
+    debug info may mention the directory they were first compiled in.
+    """
+    output = os.path.join(staging, output_name)
+    if root_dir:
+        # The compiler records its real working directory in debug info
+        command = [
+            f"-fdebug-prefix-map={path}=." for path in sorted(
+                {os.path.abspath(root_dir),
+                 os.path.realpath(root_dir)})
+        ] + command
+    try:
+        # Compiles run from a thread pool, where a preexec_fn isn't safe
+        compile_exit = subprocess.run(supervisor.limited_command(
+            [COMPILER] + command + ["-o", output],
+            {"RLIMIT_AS": (COMPILE_MEMORY_LIMIT, COMPILE_MEMORY_LIMIT)}),
+                                      cwd=root_dir,
+                                      encoding="utf-8",
+                                      stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE,
+                                      timeout=COMPILE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise CompileTimeout()
+
+    # Don't keep partial output from a failed compile
+    if compile_exit.returncode != 0 and os.path.exists(output):
+        os.remove(output)
+
+    with open(os.path.join(staging, STDERR_NAME), "w") as _file:
+        _file.write(compile_exit.stderr)
+
+
+def __entry_size(entry: str) -> int:
+    size = 0
+    for root, _, files in os.walk(entry):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return size
+
+
+def __last_used(entry: str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(entry, USED_NAME))
+    except OSError:
+        # Entries from older versions have no used file
+        return os.path.getmtime(entry)
+
+
+def evict_cache(size_limit=CACHE_SIZE_LIMIT):
+    """Remove the least recently used cache entries until under size_limit"""
+    cache = SharedData.get_compiled_directory()
+
+    entries = []
+    for name in os.listdir(cache):
+        if name.startswith("."):
+            continue  # Skip entries still being compiled
+        entry = os.path.join(cache, name)
+        try:
+            entries.append((__last_used(entry), __entry_size(entry), entry))
+        except OSError:
+            pass
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total_size <= size_limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        # Entries from older versions can't be removed by other graders
+        if not os.path.exists(entry):
+            total_size -= size
+
+
+def __evict_if_due():
+    """Run evict_cache unless some grader did in the last EVICT_INTERVAL"""
+    stamp = os.path.join(SharedData.get_compiled_directory(), EVICTED_NAME)
+    try:
+        if time.time() - os.path.getmtime(stamp) < EVICT_INTERVAL:
+            return
+    except OSError:
+        pass
+
+    __touch(stamp)
+    evict_cache()
+
+
+def leading_common_headers(source_file: str) -> typing.List[str]:
+    """The COMMON_HEADERS a source file includes before any other code
+
+    Only comments and blank lines may come before them. Force-including
+    these headers doesn't change what the file means, unlike headers the
+    file never includes, which could hide a missing #include or clash with
+    the student's names.
+    """
+    headers = []
+    in_comment = False
+    with open(source_file, "r", encoding="utf-8", errors="replace") as _file:
+        for line in _file:
+            line = line.strip()
+            if in_comment or line.startswith("/*"):
+                in_comment = "*/" not in line
+                if in_comment:
+                    continue
+                line = line[line.index("*/") + 2:].strip()
+            if not line or line.startswith("//"):
+                continue
+            match = re.fullmatch(r"#\s*include\s*<(\w+)>", line)
+            if not match or match.group(1) not in COMMON_HEADERS:
+                break
+            headers.append(match.group(1))
+    return headers
+
+
+def get_precompiled_header(flags: typing.List[str],
+                           headers: typing.List[str]) -> str:
+    """Return the path of a header that includes the standard headers
+
+    The header is precompiled alongside it so g++ loads the .gch rather
+    than parsing the standard headers for every translation unit. Returns
+    an empty string if the header could not be precompiled.
+    """
+    digest = hashlib.sha256()
+    digest.update(get_compiler_version().encode())
+    digest.update("\0".join(flags).encode())
+    digest.update(b"\0\0")
+    digest.update("\0".join(headers).encode())
+
+    def build_fn(staging):
+        header = os.path.join(staging, PCH_HEADER_NAME)
+        with open(header, "w") as _file:
+            for name in headers:
+                _file.write(f"#include <{name}>\n")
+        __run_compiler(staging, f"{PCH_HEADER_NAME}.gch",
+                       flags + ["-x", "c++-header", header])
+
+    entry = __get_entry(f"pch-{digest.hexdigest()}", build_fn)
+    if not os.path.exists(os.path.join(entry, f"{PCH_HEADER_NAME}.gch")):
+        return ""
+
+    # The .gch is only used when found next to the included header
+    return os.path.join(entry, PCH_HEADER_NAME)
+
+
+def __compile_object(root_dir: str, source_file: str, flags: typing.List[str],
+                     headers_digest: str) -> str:
+    """Compile a single translation unit, returning its object's entry"""
+    digest = hashlib.sha256()
+    digest.update(headers_digest.encode())
+    digest.update("\0".join(flags).encode())
+    __hash_files(digest, root_dir, [source_file])
+
+    def build_fn(staging):
+        __run_compiler(
+            staging, OBJECT_NAME, flags +
+            ["-c", "-I.", os.path.relpath(source_file, root_dir)], root_dir)
+
+    return __get_entry(f"obj-{digest.hexdigest()}", build_fn)
+
+
+def __compile_parallel(staging: str, root_dir: str,
+                       source_files: typing.List[str], flags: typing.List[str]):
+    """Compile each translation unit in parallel, then link
+
+    Objects are cached individually, so editing one file of a multi-file
+    lab only recompiles that file. Each file is compiled with a precompiled
+    header of the standard headers it starts by including.
+    """
+    # Every translation unit may include any header in the submission, so
+    # they are all part of each object's key
+    digest = hashlib.sha256()
+    digest.update(get_compiler_version().encode())
+    digest.update("\0".join(flags).encode())
+    headers = []
+    for root, _, files in os.walk(root_dir):
+        for file in files:
+            path = os.path.join(root, file)
+            if path not in source_files:
+                headers.append(path)
+    __hash_files(digest, root_dir, headers)
+    headers_digest = digest.hexdigest()
+
+    source_files = sorted(source_files)
+    leading_headers = [
+        tuple(leading_common_headers(source_file))
+        for source_file in source_files
+    ]
+    header_sets = sorted(set(filter(None, leading_headers)))
+
+    with concurrent.futures.ThreadPoolExecutor(
+            min(len(source_files), __compile_threads)) as executor:
+        pch_headers = dict(
+            zip(
+                header_sets,
+                executor.map(
+                    lambda headers: get_precompiled_header(
+                        flags, list(headers)), header_sets)))
+
+        def compile_object(source_file, headers):
+            compile_flags = flags
+            if pch_headers.get(headers):
+                compile_flags = flags + ["-include", pch_headers[headers]]
+            return __compile_object(root_dir, source_file, compile_flags,
+                                    headers_digest)
+
+        entries = list(
+            executor.map(compile_object, source_files, leading_headers))
+
+    stderr = ""
+    objects = []
+    for entry in entries:
+        with open(os.path.join(entry, STDERR_NAME), "r") as _file:
+            stderr += _file.read()
+        objects.append(os.path.join(entry, OBJECT_NAME))
+
+    if all(os.path.exists(_object) for _object in objects):
+        __run_compiler(staging, EXECUTABLE_NAME, flags + objects)
+        with open(os.path.join(staging, STDERR_NAME), "r") as _file:
+            stderr += _file.read()
+
+    with open(os.path.join(staging, STDERR_NAME), "w") as _file:
+        _file.write(stderr)
+
+
+def compile_code(root_dir: str,
+                 source_files: typing.List[str],
+                 flags: typing.List[str] = COMPILE_FLAGS) -> CompileResult:
+    """Compile the source files in root_dir, or return the cached result
+
+    Labs with multiple source files compile each translation unit in
+    parallel (see __compile_parallel).
+    """
+    def build_fn(staging):
+        if len(source_files) > 1:
+            __compile_parallel(staging, root_dir, source_files, flags)
+        else:
+            __run_compiler(
+                staging, EXECUTABLE_NAME, flags + ["-I."] +
+                [os.path.relpath(path, root_dir) for path in source_files],
+                root_dir)
+
+    cache = SharedData.get_compiled_directory()
+    key = get_cache_key(root_dir, flags)
+    cached = os.path.isdir(os.path.join(cache, key))
+
+    try:
+        result = __read_entry(__get_entry(key, build_fn))
+    except CompileTimeout:
+        return CompileResult(
+            "", f"Compiling took longer than {COMPILE_TIMEOUT} seconds", False)
+    result.cached = cached
+
+    # Cache hits don't grow the cache
+    if not cached:
+        __evict_if_due()
+
+    return result
+
+
+def compile_directory(root_dir: str) -> CompileResult:
+    """Compile every .cpp file found under root_dir"""
+    source_files = []
+    for root, _, files in os.walk(root_dir):
+        for file in files:
+            if file.endswith(".cpp"):
+                source_files.append(os.path.join(root, file))
+
+    return compile_code(root_dir, source_files)
+
+
+def __init_pool_worker(data_directory: str, class_code: str,
+                       compile_threads: int):
+    global __compile_threads
+    __compile_threads = compile_threads
+
+    SharedData.ZYGRADER_DATA_DIRECTORY = data_directory
+    SharedData.initialize_class_data(class_code)
+
+
+def create_pool(max_workers: int = None):
+    """Create a process pool for compiling many submissions at once
+
+    Submit compile_directory jobs to the returned executor.
+    """
+    cpu_count = os.cpu_count() or 1
+    max_workers = max_workers or cpu_count
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers,
+        initializer=__init_pool_worker,
+        initargs=(SharedData.ZYGRADER_DATA_DIRECTORY, SharedData.CLASS_CODE,
+                  max(1, cpu_count // max_workers)))
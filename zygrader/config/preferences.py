@@ -29,6 +29,8 @@ DEFAULT_PREFERENCES = {
     "theme": "Default",
     "unicode_mode": False,
     "browser_diff": False,
+    "side_by_side_diff": True,
+    "report_cache_minutes": 10,
     "save_password": False,
     "class_code": "No Override",
     "editor": "Pluma",
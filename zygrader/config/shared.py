@@ -22,6 +22,11 @@ class SharedData:
     LOGS_DIRECTORY = "logs"
     DATA_DIRECTORY = ".data"
     CACHE_DIRECTORY = ".cache"
+    EXTRACTED_DIRECTORY = ".extracted"
+    COMPILED_DIRECTORY = ".compiled"
+    INDEX_DIRECTORY = ".index"
+    REPORTS_DIRECTORY = ".reports"
+    SHAKE_DIRECTORY = ".shake"
     LOCKS_DIRECTORY = ".locks"
     FLAGS_DIRECTORY = ".flags"
 
@@ -112,6 +117,26 @@ class SharedData:
     def get_cache_directory(cls):
         return cls.get_config_directory(cls.CACHE_DIRECTORY)
 
+    @classmethod
+    def get_extracted_directory(cls):
+        return cls.get_config_directory(cls.EXTRACTED_DIRECTORY)
+
+    @classmethod
+    def get_compiled_directory(cls):
+        return cls.get_config_directory(cls.COMPILED_DIRECTORY)
+
+    @classmethod
+    def get_index_directory(cls):
+        return cls.get_config_directory(cls.INDEX_DIRECTORY)
+
+    @classmethod
+    def get_reports_directory(cls):
+        return cls.get_config_directory(cls.REPORTS_DIRECTORY)
+
+    @classmethod
+    def get_shake_directory(cls):
+        return cls.get_config_directory(cls.SHAKE_DIRECTORY)
+
     @classmethod
     def get_locks_directory(cls):
         return cls.get_config_directory(cls.LOCKS_DIRECTORY)
@@ -7,7 +7,7 @@ import subprocess
 import time
 from collections import Iterable
 
-from zygrader import ui, utils
+from zygrader import compiler, supervisor, test_bench, ui, utils
 from zygrader.config import preferences
 from zygrader.config.shared import SharedData
 from zygrader.zybooks import Zybooks
@@ -305,17 +305,12 @@ class Submission(Iterable):
                 self.flag |= SubmissionFlag.BAD_ZIP_URL
                 continue
 
-            # TODO: Can the name be removed from the file itself?
-            files = utils.extract_zip(zip_file)
-
-            # Write file to subdirectory in temporary directory
+            # Link the extracted files into a subdirectory of the temporary
+            # directory. Only the first grader to open a zip extracts it.
             part_directory = os.path.join(tmp_dir,
                                           self.get_part_identifier(part))
-            os.makedirs(part_directory)
-            for file_name in files.keys():
-                with open(os.path.join(part_directory, file_name),
-                          "w") as source_file:
-                    source_file.write(files[file_name])
+            extracted_directory = utils.get_extracted_submission(zip_file)
+            utils.link_tree(extracted_directory, part_directory)
 
         return tmp_dir
 
@@ -328,6 +323,8 @@ class Submission(Iterable):
         editor_path = preferences.EDITORS[user_editor]
 
         files = utils.get_source_file_paths(self.files_directory)
+        # Editors save in place, which would change the shared extracted copy
+        utils.detach_files(files)
 
         # Terminal-based editors
         if user_editor in {"Vim", "Emacs", "Nano", "Less"}:
@@ -375,13 +372,20 @@ class Submission(Iterable):
         if self.do_resume_code(SharedData.running_process):
             stopped = self.wait_on_child(SharedData.running_process)
         else:
+            part = None
+            if len(self.lab.parts) > 1:
+                part = self.pick_part()
+                if part is None:
+                    return False
+
             # Get path to executable
-            executable = self.compile_code()
+            executable = self.compile_code(part)
             if not executable:
                 return False  # Could not compile code
 
             SharedData.RUNNING_CODE = True
-            stopped = self.run_code(executable, use_gdb)
+            stopped = self.run_code(executable, use_gdb,
+                                    self.get_part_directory(part))
 
         if not stopped:
             SharedData.running_process = None
@@ -428,52 +432,67 @@ class Submission(Iterable):
     def view_stderr(self):
         utils.view_string(self.__stderr, "compile-error")
 
-    def compile_code(self):
-        # Use a separate tmp dir to avoid opening the binary in a text editor
-        tmp_dir = utils.create_tempdir()
-        executable_name = os.path.join(tmp_dir, "run")
-
-        root_dir = self.files_directory
+    def get_part_directory(self, part) -> str:
+        """The directory of a part's files in the files_directory"""
         if len(self.lab.parts) > 1:
-            part = self.pick_part()
-            if part == ui.GO_BACK:
-                return False
-
-            root_dir = os.path.join(
-                self.files_directory,
-                self.get_part_identifier(self.lab.parts[part]))
+            return os.path.join(self.files_directory,
+                                self.get_part_identifier(self.lab.parts[part]))
 
-        files = utils.get_source_file_paths(root_dir)
+        # Single part labs still use the part's directory, so the files have
+        # the same paths as in the extracted store and precompiled results
+        # are found in the compile cache
+        return os.path.join(self.files_directory,
+                            self.get_part_identifier(self.response["parts"][0]))
 
-        source_files = [f for f in files if f.endswith(".cpp")]
-        compile_command = ["g++", "-g", "-o", executable_name, f"-I{root_dir}"
-                           ] + source_files
+    def compile_code(self, part=None):
+        if part is None and len(self.lab.parts) > 1:
+            part = self.pick_part()
+            if part is None:
+                return False
+        root_dir = self.get_part_directory(part)
 
-        compile_exit = subprocess.run(compile_command,
-                                      encoding="utf-8",
-                                      stdout=subprocess.DEVNULL,
-                                      stderr=subprocess.PIPE)
-        if compile_exit.returncode != 0:
-            self.save_stderr(compile_exit.stderr)
+        # The executable is stored in the shared compile cache, so it won't
+        # be opened in a text editor with the source files
+        result = compiler.compile_directory(root_dir)
+        if not result.success():
+            self.save_stderr(result.stderr)
             return False
 
         # Compiled successfully, run code
-        return os.path.abspath(executable_name)
+        return os.path.abspath(result.executable)
+
+    def get_test_cases(self, part_index) -> list:
+        """Get the local test cases for a part from its zyBooks test bench"""
+        part = self.response["parts"][part_index]
+        if part["code"] == Zybooks.NO_SUBMISSION:
+            return []
+        return test_bench.get_test_cases(part.get("test_bench", []))
+
+    def run_tests(self, part_index, tests) -> str:
+        """Compile a part and run the test cases, returning a report
+
+        Returns an empty string if the code could not be compiled.
+        """
+        executable = self.compile_code(part_index)
+        if not executable:
+            return ""
+
+        # Programs may write to their data files, which must not change the
+        # shared extracted copy
+        part_directory = self.get_part_directory(part_index)
+        utils.detach_files(utils.get_source_file_paths(part_directory))
+        results = test_bench.run_tests(executable, tests, part_directory)
+        return test_bench.format_results(results)
 
     def wait_on_child(self, child):
-        while child.poll() is None:
-            time.sleep(0.1)
-            if not SharedData.RUNNING_CODE:
-                break
-
-        # If the running process still exists
-        if SharedData.running_process and SharedData.running_process.poll(
-        ) is None:
-            return True
+        # Blocks until the child exits or is stopped with CTRL+Z
+        stopped = child.wait()
+        if not stopped:
+            print(f"\n{child.summary()}")
 
-        return False
+        return stopped
 
-    def run_code(self, executable, use_gdb):
+    def run_code(self, executable, use_gdb, part_directory):
         events = ui.get_events()
         events.clear_event_queue()
         curses.endwin()
@@ -488,10 +507,16 @@ class Submission(Iterable):
         print("#############################################################\n")
 
         if use_gdb:
-            process = subprocess.Popen(["gdb", executable],
-                                       stderr=subprocess.DEVNULL)
+            # Cached executables name their sources relative to the part
+            # directory. The program may write to its files there, which
+            # must not change the shared extracted copy.
+            utils.detach_files(utils.get_source_file_paths(part_directory))
+            process = supervisor.SupervisedProcess(["gdb", executable],
+                                                   capture_output=False,
+                                                   cwd=part_directory)
         else:
-            process = subprocess.Popen([executable], stderr=subprocess.DEVNULL)
+            spill_path = os.path.join(utils.create_tempdir(), "output.txt")
+            process = supervisor.SupervisedProcess([executable], spill_path)
         SharedData.running_process = process
 
         # Return indicator if child terminated or stopped
@@ -529,6 +554,5 @@ class Submission(Iterable):
         part_a_paths = [os.path.join(path_a, f) for f in os.listdir(path_a)]
         part_b_paths = [os.path.join(path_b, f) for f in os.listdir(path_b)]
 
-        diff = utils.make_diff_string(part_a_paths, part_b_paths, path_a,
-                                      path_b, use_browser)
-        utils.view_string(diff, "parts.diff", use_browser)
+        utils.view_diff(part_a_paths, part_b_paths, path_a, path_b,
+                        "parts.diff", use_browser)
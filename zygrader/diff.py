@@ -0,0 +1,377 @@
+"""Diff: In-process diffs of student files
+
+Finds the same hunks as `diff -w -u` without starting a process per file
+pair, for the DiffViewer layer and HTML diffs. Lines are compared with all
+whitespace removed, so indentation and spacing changes are ignored. File
+pairs are diffed in parallel, and diffs are cached by the content hashes of
+both files so viewing the same pair again (or another pair with identical
+files) is instant.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import html
+import threading
+import typing
+
+CONTEXT_LINES = 3
+
+# Edit distance after which the diff search settles for a diff that may not
+# be minimal, so very different files can't take quadratic time
+COST_LIMIT = 256
+
+HTML_CONTEXT_LINES = 5
+HTML_TAB_SIZE = 4
+
+HTML_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+    table.diff {{font-family: Courier; border: medium; border-collapse: collapse;}}
+    table.diff td {{white-space: pre-wrap; word-break: break-all; vertical-align: top;}}
+    .diff_header {{background-color: #e0e0e0;}}
+    td.diff_header {{text-align: right; padding: 0 4px;}}
+    .diff_next {{background-color: #c0c0c0;}}
+    .diff_add {{background-color: #aaffaa;}}
+    .diff_chg {{background-color: #ffff77;}}
+    .diff_sub {{background-color: #ffaaaa;}}
+</style>
+</head>
+<body>
+"""
+HTML_FOOTER = "</body>\n</html>\n"
+
+CACHE_SIZE = 256
+MAX_WORKERS = 8
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class FileText:
+    """The lines of a file and a hash of its contents"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as _file:
+            contents = _file.read()
+        self.hash = hashlib.sha256(contents).hexdigest()
+
+        text = contents.decode("utf-8", errors="replace")
+        self.lines = text.splitlines()
+
+        # diff -w ignores all whitespace when comparing lines
+        self.keys = ["".join(line.split()) for line in self.lines]
+
+
+def __middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+    """Find the middle snake of an optimal path through the edit graph
+
+    Searches forward from the top left and backward from the bottom right at
+    the same time (Myers' linear space refinement). Returns the start and end
+    of the snake where the searches overlap.
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 != 0
+    offset = n + m + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range((n + m + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1]
+                           < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - d < k < delta + d:
+                if x + backward[offset + delta - k] >= n:
+                    return x_start, y_start, x, y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1]
+                           < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x_end, y_end = x, y
+            while (x < n and y < m and a[a_hi - x - 1] == b[b_hi - y - 1]):
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + forward[offset + delta - k] >= n:
+                    return n - x, m - y, n - x_end, m - y_end
+
+        if d >= COST_LIMIT:
+            # Give up on a minimal diff and split at whichever search got
+            # furthest along its diagonals, as GNU diff does
+            best = -1
+            for k in range(-d, d + 1, 2):
+                x = min(forward[offset + k], n)
+                y = x - k
+                if 0 <= y <= m and x + y > best:
+                    best, split = x + y, (x, y)
+                x = min(backward[offset + k], n)
+                y = x - k
+                if 0 <= y <= m and x + y > best:
+                    best, split = x + y, (n - x, m - y)
+            return split + split
+
+    raise RuntimeError("No middle snake found")
+
+
+def __find_matches(a, a_lo, a_hi, b, b_lo, b_hi, matches):
+    """Append the (a index, b index) pairs of a longest common subsequence"""
+    while True:
+        # Strip the common prefix and suffix, they are always part of the LCS
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        suffix = []
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            suffix.append((a_hi, b_hi))
+
+        if a_lo < a_hi and b_lo < b_hi:
+            x, y, u, v = __middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+            __find_matches(a, a_lo, a_lo + x, b, b_lo, b_lo + y, matches)
+            matches.extend((a_lo + i, b_lo + y + i - x) for i in range(x, u))
+            __find_matches(a, a_lo + u, a_hi, b, b_lo + v, b_hi, matches)
+
+        matches.extend(reversed(suffix))
+        return
+
+
+def get_opcodes(a: FileText, b: FileText):
+    """Return difflib-style opcodes matching the lines of a against b
+
+    Uses Myers' O(ND) algorithm in linear space, which stays fast on long,
+    repetitive files where SequenceMatcher can go quadratic. Lines that
+    appear in only one file can never match, so they are set aside before
+    searching (as GNU diff does) which keeps very different files cheap.
+    """
+    a_counts = collections.Counter(a.keys)
+    b_counts = collections.Counter(b.keys)
+    a_index = [i for i, key in enumerate(a.keys) if key in b_counts]
+    b_index = [j for j, key in enumerate(b.keys) if key in a_counts]
+
+    # Compare small ints rather than strings
+    ids = {}
+    a_ids = [ids.setdefault(a.keys[i], len(ids)) for i in a_index]
+    b_ids = [ids.setdefault(b.keys[j], len(ids)) for j in b_index]
+
+    matches = []
+    __find_matches(a_ids, 0, len(a_ids), b_ids, 0, len(b_ids), matches)
+
+    opcodes = []
+    i = j = 0
+    for match_a, match_b in matches + [(len(a_ids), len(b_ids))]:
+        if match_a < len(a_ids):
+            match_a, match_b = a_index[match_a], b_index[match_b]
+        else:
+            match_a, match_b = len(a.keys), len(b.keys)
+
+        if i < match_a and j < match_b:
+            opcodes.append(("replace", i, match_a, j, match_b))
+        elif i < match_a:
+            opcodes.append(("delete", i, match_a, j, j))
+        elif j < match_b:
+            opcodes.append(("insert", i, i, j, match_b))
+
+        if match_a < len(a.keys):
+            # Extend the previous equal opcode when matches are adjacent
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][
+                    2] == match_a:
+                tag, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = tag, i1, match_a + 1, j1, match_b + 1
+            else:
+                opcodes.append(
+                    ("equal", match_a, match_a + 1, match_b, match_b + 1))
+        i, j = match_a + 1, match_b + 1
+
+    return opcodes
+
+
+def group_hunks(opcodes, context=CONTEXT_LINES):
+    """Group opcodes into hunks with `context` lines of unchanged context
+
+    This is SequenceMatcher.group_opcodes for an already computed list of
+    opcodes. Files with no changes have no hunks.
+    """
+    if not opcodes or (len(opcodes) == 1 and opcodes[0][0] == "equal"):
+        return []
+
+    opcodes = list(opcodes)
+    # Trim the unchanged lines at the start and end down to the context
+    tag, i1, i2, j1, j2 = opcodes[0]
+    if tag == "equal":
+        opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    tag, i1, i2, j1, j2 = opcodes[-1]
+    if tag == "equal":
+        opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    hunks = []
+    hunk = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        # Split long unchanged stretches into the end of one hunk and the
+        # start of the next
+        if tag == "equal" and i2 - i1 > context * 2:
+            hunk.append((tag, i1, i1 + context, j1, j1 + context))
+            hunks.append(hunk)
+            hunk = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        hunk.append((tag, i1, i2, j1, j2))
+
+    if hunk and not (len(hunk) == 1 and hunk[0][0] == "equal"):
+        hunks.append(hunk)
+    return hunks
+
+
+def __get_cached_opcodes(a: FileText, b: FileText):
+    key = (a.hash, b.hash)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    opcodes = get_opcodes(a, b)
+
+    with _cache_lock:
+        _cache[key] = opcodes
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return opcodes
+
+
+def file_diff(path_a: str, path_b: str, context=CONTEXT_LINES):
+    """Return the lines of both files and the hunks of the diff between them
+
+    Hunks are lists of difflib-style opcodes, grouped with `context` lines of
+    unchanged context.
+    """
+    a = FileText(path_a)
+    b = FileText(path_b)
+    return a.lines, b.lines, group_hunks(__get_cached_opcodes(a, b), context)
+
+
+def diff_pairs(pairs: typing.List[typing.Tuple[str, str]],
+               diff_fn) -> typing.Iterator[str]:
+    """Diff each (path_a, path_b) pair in parallel with diff_fn
+
+    Diffs are yielded in the order of the pairs as soon as each is ready, so
+    the caller can show the first diff while the rest are still running.
+    """
+    if not pairs:
+        return
+
+    workers = min(MAX_WORKERS, len(pairs))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(diff_fn, a, b) for a, b in pairs]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Skip the remaining diffs if the caller stopped early
+            for future in futures:
+                future.cancel()
+
+
+def __escape(text: str) -> str:
+    return html.escape(text.expandtabs(HTML_TAB_SIZE), quote=False)
+
+
+def __highlight_changes(line_a: str, line_b: str):
+    """Return both lines as html with the changed characters highlighted"""
+    matches = []
+    __find_matches(line_a, 0, len(line_a), line_b, 0, len(line_b), matches)
+
+    marked_a = []
+    marked_b = []
+    i = j = 0
+    for match_a, match_b in matches + [(len(line_a), len(line_b))]:
+        if i < match_a:
+            marked_a.append("<span class=\"diff_chg\">"
+                            f"{__escape(line_a[i:match_a])}</span>")
+        if j < match_b:
+            marked_b.append("<span class=\"diff_chg\">"
+                            f"{__escape(line_b[j:match_b])}</span>")
+        marked_a.append(__escape(line_a[match_a:match_a + 1]))
+        marked_b.append(__escape(line_b[match_b:match_b + 1]))
+        i, j = match_a + 1, match_b + 1
+
+    return "".join(marked_a), "".join(marked_b)
+
+
+def __html_row(number_a, text_a, number_b, text_b, class_a="", class_b=""):
+    class_a = f" class=\"{class_a}\"" if class_a else ""
+    class_b = f" class=\"{class_b}\"" if class_b else ""
+    return (f"<tr><td class=\"diff_header\">{number_a}</td>"
+            f"<td{class_a}>{text_a}</td>"
+            f"<td class=\"diff_header\">{number_b}</td>"
+            f"<td{class_b}>{text_b}</td></tr>\n")
+
+
+def __html_hunk_rows(a: FileText, b: FileText, hunk) -> typing.Iterator[str]:
+    for tag, i1, i2, j1, j2 in hunk:
+        if tag == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                yield __html_row(i + 1, __escape(a.lines[i]), j + 1,
+                                 __escape(b.lines[j]))
+            continue
+
+        # Pair up replaced lines so the changes within them can be shown,
+        # the remaining lines are plain deletions or insertions
+        paired = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+        for offset in range(max(i2 - i1, j2 - j1)):
+            i, j = i1 + offset, j1 + offset
+            if offset < paired:
+                text_a, text_b = __highlight_changes(a.lines[i], b.lines[j])
+                yield __html_row(i + 1, text_a, j + 1, text_b)
+            elif i < i2:
+                yield __html_row(i + 1, __escape(a.lines[i]), "", "",
+                                 "diff_sub")
+            else:
+                yield __html_row("", "", j + 1, __escape(b.lines[j]), "",
+                                 "diff_add")
+
+
+def write_html_diff(path_a: str, path_b: str, title_a: str, title_b: str,
+                    out: typing.TextIO):
+    """Write a side by side html table of the diff of two files to out
+
+    Only the changed regions (with some context) are shown, and characters
+    are highlighted only within changed lines. Each hunk is written as soon
+    as it is rendered, so nothing larger than a hunk is built in memory.
+    """
+    a = FileText(path_a)
+    b = FileText(path_b)
+
+    out.write("<table class=\"diff\">\n"
+              f"<thead><tr><th colspan=\"2\">{__escape(title_a)}</th>"
+              f"<th colspan=\"2\">{__escape(title_b)}</th></tr></thead>\n")
+
+    hunks = group_hunks(__get_cached_opcodes(a, b), HTML_CONTEXT_LINES)
+    if not hunks:
+        out.write("<tr><td colspan=\"4\">No Differences Found</td></tr>\n")
+
+    for index, hunk in enumerate(hunks):
+        if index > 0:
+            out.write("<tr><td class=\"diff_next\" colspan=\"4\">...</td>"
+                      "</tr>\n")
+        out.writelines(__html_hunk_rows(a, b, hunk))
+
+    out.write("</table>\n")
@@ -0,0 +1,106 @@
+"""Fuzzy Match: Find student ids that are a few typos away from each other
+
+Edit distances are computed with Myers' bit-parallel algorithm, which
+processes a whole column of the dynamic programming table with a handful
+of integer operations.
+
+To avoid comparing every pair, strings are indexed by the strings left
+after deleting up to k characters. Two strings within k edits of each
+other always share one of these, so only strings sharing one need their
+distance checked.
+"""
+import collections
+import typing
+
+
+def edit_distance(seq1: str, seq2: str, cutoff: int = None) -> int:
+    """Return the Levenshtein distance between two strings
+
+    With a cutoff, the computation stops as soon as the distance is known to
+    be at least the cutoff, and the cutoff is returned.
+    """
+    if len(seq1) > len(seq2):
+        seq1, seq2 = seq2, seq1
+    if not seq1:
+        return len(seq2) if cutoff is None else min(len(seq2), cutoff)
+    if cutoff is not None and len(seq2) - len(seq1) >= cutoff:
+        return cutoff
+
+    # Bit i of peq[c] is set where seq1[i] == c
+    peq = collections.defaultdict(int)
+    for i, char in enumerate(seq1):
+        peq[char] |= 1 << i
+
+    mask = (1 << len(seq1)) - 1
+    last = 1 << (len(seq1) - 1)
+    # Vertical positive and negative deltas of the current column
+    pv = mask
+    mv = 0
+    score = len(seq1)
+
+    remaining = len(seq2)
+    for char in seq2:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        # Shift in the top row, which increases by one each column
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+
+        # Each remaining column lowers the distance by at most one
+        remaining -= 1
+        if cutoff is not None and score - remaining >= cutoff:
+            return cutoff
+
+    return score
+
+
+def deletion_variants(text: str, max_deletions: int) -> typing.Set[str]:
+    """Return every string made by deleting up to max_deletions characters"""
+    variants = {text}
+    frontier = {text}
+    for _ in range(max_deletions):
+        frontier = {
+            variant[:i] + variant[i + 1:]
+            for variant in frontier
+            for i in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+class NearMatchIndex:
+    """An index of strings for finding those less than cutoff edits away"""
+    def __init__(self, cutoff: int):
+        self.cutoff = cutoff
+        self.__entries = []
+        self.__variants = collections.defaultdict(list)
+
+    def add(self, key, text: str):
+        entry = len(self.__entries)
+        self.__entries.append((key, text))
+        for variant in deletion_variants(text, self.cutoff - 1):
+            self.__variants[variant].append(entry)
+
+    def find(self, text: str) -> typing.List:
+        """Return the keys of the indexed strings within the cutoff of text"""
+        candidates = set()
+        for variant in deletion_variants(text, self.cutoff - 1):
+            candidates.update(self.__variants.get(variant, ()))
+
+        keys = []
+        for entry in sorted(candidates):
+            key, other = self.__entries[entry]
+            if edit_distance(text, other, self.cutoff) < self.cutoff:
+                keys.append(key)
+        return keys
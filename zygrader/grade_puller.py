@@ -1,9 +1,12 @@
+import collections
+import concurrent.futures
 import csv
 import datetime
 import os
+import typing
 from zygrader.config import preferences
 
-from zygrader import data, ui
+from zygrader import data, fuzzy_match, report_cache, ui
 from zygrader.config.shared import SharedData
 from zygrader.ui.templates import ZybookSectionSelector, filename_input
 from zygrader.utils import fetch_zybooks_toc
@@ -21,6 +24,16 @@ def create_last_night():
 class GradePuller:
     NUM_CANVAS_ID_COLUMNS = 5
     NUM_ZYBOOKS_ID_COLUMNS = 5
+    # Completion reports fetched from zyBooks at once
+    REPORT_WORKERS = 4
+
+    class Assignment(typing.NamedTuple):
+        """One Canvas column to fill from a zyBooks completion report"""
+        canvas_assignment: str
+        zybook_sections: list
+        class_sections: list
+        # The due time of each class section
+        due_times: dict
 
     class StoppingException(Exception):
         pass
@@ -28,13 +41,14 @@ class GradePuller:
     def __init__(self):
         self.window = ui.get_window()
         self.zy_api = Zybooks()
+        # Fetch completion reports even if a recent one is cached
+        self.force_refresh = False
 
     def pull(self):
         try:
             self.read_canvas_csv()
-            self.selected_assignments = set()
-            self.involved_class_sections = set()
 
+            assignments = []
             more_assignments = True
             while more_assignments:
                 try:
@@ -47,9 +61,9 @@ class GradePuller:
                 class_sections = self.select_class_sections()
                 due_times = self.select_due_times(class_sections)
 
-                self.add_assignment_to_report(canvas_assignment,
-                                              zybook_sections, class_sections,
-                                              due_times)
+                assignments.append(
+                    GradePuller.Assignment(canvas_assignment, zybook_sections,
+                                           class_sections, due_times))
 
                 msg = ["Add another assignment to the report?"]
                 popup = ui.layers.BoolPopup("More Assignments")
@@ -57,6 +71,10 @@ class GradePuller:
                 self.window.run_layer(popup)
                 more_assignments = popup.get_result()
 
+            if not assignments:
+                raise GradePuller.StoppingException()
+            self.fetch_and_record_assignments(assignments)
+
             upload_file_path = self.select_upload_file_path()
             self.write_upload_file(upload_file_path, restrict_sections=True)
         except GradePuller.StoppingException:
@@ -64,28 +82,38 @@ class GradePuller:
             popup.set_message(["Grade Puller stopped"])
             self.window.run_layer(popup)
 
+    def load_canvas_csv(self, path=None):
+        """Read the Canvas gradebook without any UI
+
+        Raises FileNotFoundError or PermissionError if it can't be read.
+        """
+        path = path or SharedData.get_canvas_master()
+        self.canvas_students = dict()
+        self.selected_assignments = set()
+        self.involved_class_sections = set()
+        bad_id_count = 0
+        with open(path, "r", newline="") as canvas_master_file:
+            canvas_reader = csv.DictReader(canvas_master_file)
+            self.canvas_header = canvas_reader.fieldnames
+            self.canvas_points_out_of = canvas_reader.__next__()
+            for row in canvas_reader:
+                if row["Student"] == "Student, Test":
+                    continue
+                id_str = row["SIS User ID"]
+                if id_str:
+                    row["id_number"] = int(id_str)
+                else:
+                    bad_id_count += 1
+                    row["id_number"] = f"bad_canvas_id_{bad_id_count}"
+                row["section_number"] = (
+                    self.parse_section_from_canvas_student(row))
+                self.canvas_students[row["id_number"]] = row
+
     def read_canvas_csv(self):
         path = SharedData.get_canvas_master()
         popup = ui.layers.Popup("Error in Reading Master CSV")
         try:
-            self.canvas_students = dict()
-            bad_id_count = 0
-            with open(path, "r", newline="") as canvas_master_file:
-                canvas_reader = csv.DictReader(canvas_master_file)
-                self.canvas_header = canvas_reader.fieldnames
-                self.canvas_points_out_of = canvas_reader.__next__()
-                for row in canvas_reader:
-                    if row["Student"] == "Student, Test":
-                        continue
-                    id_str = row["SIS User ID"]
-                    if id_str:
-                        row["id_number"] = int(id_str)
-                    else:
-                        bad_id_count += 1
-                        row["id_number"] = f"bad_canvas_id_{bad_id_count}"
-                    row["section_number"] = (
-                        self.parse_section_from_canvas_student(row))
-                    self.canvas_students[row["id_number"]] = row
+            self.load_canvas_csv(path)
         except FileNotFoundError:
             msg = [
                 f"Could not find {path}",
@@ -125,6 +153,17 @@ class GradePuller:
             raise GradePuller.StoppingException()
         return res
 
+    class _RefreshToggle(ui.layers.Toggle):
+        def __init__(self, puller):
+            super().__init__()
+            self.__puller = puller
+
+        def is_toggled(self):
+            return self.__puller.force_refresh
+
+        def toggle(self):
+            self.__puller.force_refresh = not self.__puller.force_refresh
+
     class _SectionToggle(ui.layers.Toggle):
         def __init__(self, index, data):
             super().__init__()
@@ -164,9 +203,11 @@ class GradePuller:
             {section.section_group
              for section in sections})]
 
-        selections = {(i, j): False
-                      for i, (_, group_list) in enumerate(section_groups)
-                      for j, _ in enumerate(group_list)}
+        selections = {
+            (i, j): False
+            for i, (_, group_list) in enumerate(section_groups)
+            for j, _ in enumerate(group_list)
+        }
 
         popup = ui.layers.ListLayer("Select Class Sections", popup=True)
         popup.set_exit_text("Done")
@@ -187,14 +228,13 @@ class GradePuller:
             if selected
         ]
 
-    def select_due_times(self, class_sections):
+    def default_due_times(self, class_sections):
+        """Each section's default due time on the previous day"""
         now = datetime.datetime.now()
         yesterday = now - datetime.timedelta(days=1)
         stored_class_sections = data.get_class_sections_in_ordered_list()
         last_night = create_last_night()
 
-        section_padding = max([len(str(section)) for section in class_sections])
-
         default_due_times = []
         for section in stored_class_sections:
             if section:
@@ -204,11 +244,15 @@ class GradePuller:
             else:
                 default_due_times.append(last_night)
 
-        due_times = {
+        return {
             section: default_due_times[section]
             for section in class_sections
         }
 
+    def select_due_times(self, class_sections):
+        section_padding = max([len(str(section)) for section in class_sections])
+        due_times = self.default_due_times(class_sections)
+
         def select_due_times_fn(selected_index,
                                 due_time_popup: ui.layers.ListLayer):
             update_row_text = (
@@ -259,11 +303,17 @@ class GradePuller:
                         f" {time.strftime('%b %d, %Y at %I:%M:%S%p')}")
             popup.add_row_text(row_text, select_due_times_fn, index, popup)
             index += 1
+        # After the section rows so their indices match the sections
+        popup.add_row_toggle("Refresh Cached Reports",
+                             GradePuller._RefreshToggle(self))
         self.window.run_layer(popup)
 
         return due_times
 
     class StudentMapping:
+        # ids less than this many edits apart may be fuzzy matched
+        EDIT_DISTANCE_CUTOFF = 4
+
         def __init__(self, canvas_students, zybook_students):
             self.canvas_students = canvas_students
             self.zybook_students = zybook_students
@@ -275,21 +325,6 @@ class GradePuller:
             self.unmatched_canvas_ids.remove(canvas_id)
             self.unmatched_zybook_ids.remove(zybook_id)
 
-        def edit_distance(self, seq1, seq2):
-            table = [[0] * (len(seq1) + 1) for _ in range(len(seq2) + 1)]
-            for i in range(len(seq1) + 1):
-                table[0][i] = i
-            for j in range(len(seq2) + 1):
-                table[j][0] = j
-            for i in range(1, len(seq2) + 1):
-                for j in range(1, len(seq1) + 1):
-                    left_score = table[i][j - 1] + 1
-                    up_score = table[i - 1][j] + 1
-                    diag_score = (table[i - 1][j - 1] +
-                                  (0 if seq2[i - 1] == seq1[j - 1] else 1))
-                    table[i][j] = min(left_score, up_score, diag_score)
-            return table[-1][-1]
-
         def _create_mapping(self):
             self.mapping = dict()
             self.unmatched_canvas_ids = set(self.canvas_students.keys())
@@ -306,17 +341,21 @@ class GradePuller:
                     self._add_entry(student_id, netid)
                     continue
 
-            for bad_zybook_id in self.unmatched_zybook_ids.copy():
+            # normalize the remaining zybooks ids once
+            zybook_id_digits = dict()
+            for zybook_id in self.unmatched_zybook_ids:
+                id_str = self.zybook_students[zybook_id]["Student ID"]
+                zybook_id_digits[zybook_id] = ("".join(c for c in id_str
+                                                       if c.isdigit()),
+                                               any(c.isalpha() for c in id_str))
+
+            for bad_zybook_id, (digits, _) in zybook_id_digits.items():
                 # try to detect if student included issue# in id#
-                zybook_student = self.zybook_students[bad_zybook_id]
-                id_str = zybook_student["Student ID"]
-                id_chrs = [c for c in id_str if c.isdigit()]
                 # the issue number is usually the last two digits
                 # when students try to include it
-                real_id_chrs = id_chrs[:-2]
                 real_id = None
                 try:
-                    real_id = int("".join(real_id_chrs))
+                    real_id = int(digits[:-2])
                 except ValueError:
                     continue  # the student has something very wrong
                 if real_id in self.unmatched_canvas_ids:
@@ -324,35 +363,32 @@ class GradePuller:
                     continue
 
             # now try fuzzy matching id numbers
-            EDIT_DISTANCE_CUTOFF = 4
+            zybook_index = fuzzy_match.NearMatchIndex(self.EDIT_DISTANCE_CUTOFF)
+            for zybook_id in self.unmatched_zybook_ids:
+                digits, has_letters = zybook_id_digits[zybook_id]
+                if not has_letters:
+                    zybook_index.add(zybook_id, digits)
+
             consider_pairs = dict()
             for canvas_id in self.unmatched_canvas_ids:
-                for zybook_id in self.unmatched_zybook_ids:
-                    canvas_student = self.canvas_students[canvas_id]
-                    canvas_str_id = canvas_student["SIS User ID"]
-                    zybook_student = self.zybook_students[zybook_id]
-                    zybook_str_id = zybook_student["Student ID"]
-                    if not [c for c in zybook_str_id if c.isalpha()]:
-                        zybook_id_digits = [
-                            c for c in zybook_str_id if c.isdigit()
-                        ]
-                        edit_distance = self.edit_distance(
-                            zybook_id_digits, canvas_str_id)
-                        if edit_distance < EDIT_DISTANCE_CUTOFF:
-                            if canvas_id in consider_pairs:
-                                consider_pairs[canvas_id].append(zybook_id)
-                            else:
-                                consider_pairs[canvas_id] = [zybook_id]
+                canvas_student = self.canvas_students[canvas_id]
+                zybook_id_list = zybook_index.find(
+                    canvas_student["SIS User ID"])
+                if zybook_id_list:
+                    consider_pairs[canvas_id] = zybook_id_list
+            # don't fuzzy match ids if they're too close to multiple
+            # students, in either direction
+            sole_matches = collections.Counter(
+                zybook_id_list[0] for zybook_id_list in consider_pairs.values()
+                if len(zybook_id_list) == 1)
             for canvas_id, zybook_id_list in consider_pairs.items():
-                # don't fuzzy match ids if they're too close
-                # to multiple students
-                if len(zybook_id_list) == 1:
+                if (len(zybook_id_list) == 1
+                        and sole_matches[zybook_id_list[0]] == 1):
                     self._add_entry(canvas_id, zybook_id_list[0])
 
-    def add_assignment_to_report(self, canvas_assignment, zybook_sections,
-                                 class_sections, due_times):
-        zybooks_students = self.fetch_completion_reports(
-            zybook_sections, due_times)
+    def record_assignment(self, canvas_assignment, class_sections,
+                          zybooks_students):
+        """Copy the zyBooks grades for an assignment into the gradebook"""
         mapping = GradePuller.StudentMapping(self.canvas_students,
                                              zybooks_students)
 
@@ -426,72 +462,143 @@ class GradePuller:
         return report, header
 
     def fetch_completion_report(self, due_time, zybook_sections):
+        max_age = preferences.get("report_cache_minutes") * 60
+        key = report_cache.cache_key(SharedData.CLASS_CODE, zybook_sections,
+                                     due_time)
+        if max_age > 0 and not self.force_refresh:
+            cached = report_cache.get(key, max_age)
+            if cached:
+                return cached
+
         csv_string = self.zy_api.get_completion_report(due_time,
                                                        zybook_sections)
         if not csv_string:
             raise GradePuller.StoppingException()
 
-        return self.parse_completion_report(csv_string)
-
-    def fetch_completion_reports(self, zybook_sections, due_times):
-        unique_due_times = set(time for time in due_times.values())
-        due_time_to_sections = {time: [] for time in unique_due_times}
-        for section_num, due_time in due_times.items():
-            due_time_to_sections[due_time].append(section_num)
+        report, header = self.parse_completion_report(csv_string)
+        if max_age > 0:
+            report_cache.put(key, report, header)
+        return report, header
 
+    def fetch_and_record_assignments(self, assignments):
+        num_exports = len(self.distinct_exports(assignments))
         wait_msg = [
-            "Fetching completion reports from zyBooks",
-            "(one per unique due time)",
-            f"Completed 0/{len(unique_due_times)}",
+            f"Fetching {num_exports} completion reports from zyBooks",
+            f"(for {len(assignments)} assignments)",
+            f"Completed 0/{num_exports}",
         ]
 
         popup = ui.layers.WaitPopup("Fetch Reports")
         popup.set_message(wait_msg)
 
-        zybooks_students = dict()
+        def progress_fn(num_completed, num_reports):
+            wait_msg[-1] = f"Completed {num_completed}/{num_reports}"
+            popup.set_message(wait_msg)
 
-        def fetch_reports_fn():
-            num_completed = 0
-            for due_time, class_section_list in due_time_to_sections.items():
-                report, _ = self.fetch_completion_report(
-                    due_time, zybook_sections)
-
-                bad_section_count = 0
-                for id, row in report.items():
-                    try:
-                        if (int(row["Class section"])) in class_section_list:
-                            zybooks_students[id] = row
-                    except ValueError:
-                        bad_section_count += 1
-                        key = f"bad_zy_class_section_{bad_section_count}"
-                        zybooks_students[key] = row
-
-                num_completed += 1
-                wait_msg[-1] = (f"Completed {num_completed}"
-                                f"/{len(unique_due_times)}")
-                popup.set_message(wait_msg)
-
-        popup.set_wait_fn(fetch_reports_fn)
+        def wait_fn():
+            try:
+                self.record_assignments(assignments, progress_fn)
+                return True
+            except GradePuller.StoppingException:
+                return False
+
+        popup.set_wait_fn(wait_fn)
         self.window.run_layer(popup)
+        if popup.canceled or not popup.get_result():
+            raise GradePuller.StoppingException()
+
+    def distinct_exports(self, assignments) -> dict:
+        """Map each distinct completion report the assignments need to its
+        zyBook sections and due time
+
+        Assignments that share zyBook sections and a due time share a report.
+        """
+        exports = dict()
+        for assignment in assignments:
+            for due_time in set(assignment.due_times.values()):
+                key = report_cache.cache_key(SharedData.CLASS_CODE,
+                                             assignment.zybook_sections,
+                                             due_time)
+                exports.setdefault(key, (assignment.zybook_sections, due_time))
+        return exports
+
+    def fetch_exports(self, exports: dict, progress_fn=None) -> dict:
+        """Fetch the completion reports of distinct_exports concurrently
+
+        progress_fn is called with the number of reports fetched so far and
+        the total number of reports.
+        """
+        reports = dict()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=GradePuller.REPORT_WORKERS) as executor:
+            futures = {
+                executor.submit(self.fetch_completion_report, due_time, zybook_sections):
+                key
+                for key, (zybook_sections, due_time) in exports.items()
+            }
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    reports[futures[future]], _ = future.result()
+                    if progress_fn:
+                        progress_fn(len(reports), len(exports))
+            except GradePuller.StoppingException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return reports
+
+    def record_assignments(self, assignments, progress_fn=None):
+        """Fetch the completion reports for every assignment at once, then
+        record each assignment's scores from them"""
+        reports = self.fetch_exports(self.distinct_exports(assignments),
+                                     progress_fn)
+
+        for assignment in assignments:
+            zybooks_students = self.collect_students(assignment, reports)
+            self.record_assignment(assignment.canvas_assignment,
+                                   assignment.class_sections, zybooks_students)
+
+    def collect_students(self, assignment, reports: dict) -> dict:
+        """Keep each student's row from the report for their class section"""
+        due_time_to_sections = collections.defaultdict(list)
+        for section_num, due_time in assignment.due_times.items():
+            due_time_to_sections[due_time].append(section_num)
+
+        zybooks_students = dict()
+        for due_time, class_section_list in due_time_to_sections.items():
+            report_key = report_cache.cache_key(SharedData.CLASS_CODE,
+                                                assignment.zybook_sections,
+                                                due_time)
+
+            bad_section_count = 0
+            for id, row in reports[report_key].items():
+                try:
+                    if (int(row["Class section"])) in class_section_list:
+                        zybooks_students[id] = row
+                except ValueError:
+                    bad_section_count += 1
+                    key = f"bad_zy_class_section_{bad_section_count}"
+                    zybooks_students[key] = row
 
         return zybooks_students
 
-    def select_upload_file_path(self):
+    def default_upload_file_path(self):
         default_file_name = (
             datetime.datetime.now().isoformat(timespec='seconds') + "--" +
             "_&_".join(self.selected_assignments) + ".csv")
         default_file_name = default_file_name.replace(" ", "_")
 
-        default_path_str = os.path.join(preferences.get("output_dir"),
-                                        default_file_name)
+        return os.path.join(os.path.expanduser(preferences.get("output_dir")),
+                            default_file_name)
 
+    def select_upload_file_path(self):
+        default_path_str = self.default_upload_file_path()
         path = filename_input(purpose="the upload file", text=default_path_str)
         if path is None:
             raise GradePuller.StoppingException()
         return path
 
     def write_upload_file(self, path, restrict_sections=False):
-        ui.get_window().debug(str(len(self.canvas_students)))
         with open(path, "w", newline="") as out_file:
             id_columns = self.canvas_header[:GradePuller.NUM_CANVAS_ID_COLUMNS]
             fieldnames = id_columns + list(self.selected_assignments)
@@ -531,29 +638,17 @@ class GradePuller:
 
             zybooks_students, zybooks_header = popup.get_result()
 
-            mapping = GradePuller.StudentMapping(self.canvas_students,
-                                                 zybooks_students)
-
-            unmatched_canvas_students = sorted(
-                [
-                    self.canvas_students[id]
-                    for id in mapping.unmatched_canvas_ids
-                ],
-                key=lambda student: student['Student'].lower())
-            unmatched_zybook_students = sorted(
-                [zybooks_students[id] for id in mapping.unmatched_zybook_ids],
-                key=lambda student: student['Last name'].lower())
-
-            num_id_columns = GradePuller.NUM_CANVAS_ID_COLUMNS
-            canvas_report_headers = self.canvas_header[:num_id_columns]
+            (unmatched_canvas_students, canvas_report_headers,
+             unmatched_zybook_students,
+             zybooks_report_headers) = self.unmatched_students(
+                 zybooks_students, zybooks_header)
+
             self.report_list(
                 unmatched_canvas_students, canvas_report_headers,
                 "unmatched canvas students",
                 os.path.join(preferences.get("output_dir"),
                              "unmatched_canvas.csv"))
 
-            num_id_columns = GradePuller.NUM_ZYBOOKS_ID_COLUMNS
-            zybooks_report_headers = zybooks_header[:num_id_columns]
             self.report_list(
                 unmatched_zybook_students,
                 zybooks_report_headers,
@@ -568,6 +663,34 @@ class GradePuller:
             popup.set_message(msg)
             self.window.run_layer(popup)
 
+    def unmatched_students(self, zybooks_students, zybooks_header):
+        """Return the Canvas and zyBooks students that could not be matched,
+        each with the header columns to report for them"""
+        mapping = GradePuller.StudentMapping(self.canvas_students,
+                                             zybooks_students)
+
+        unmatched_canvas_students = sorted(
+            [self.canvas_students[id] for id in mapping.unmatched_canvas_ids],
+            key=lambda student: student['Student'].lower())
+        unmatched_zybook_students = sorted(
+            [zybooks_students[id] for id in mapping.unmatched_zybook_ids],
+            key=lambda student: student['Last name'].lower())
+
+        canvas_report_headers = self.canvas_header[:GradePuller.
+                                                   NUM_CANVAS_ID_COLUMNS]
+        zybooks_report_headers = zybooks_header[:GradePuller.
+                                                NUM_ZYBOOKS_ID_COLUMNS]
+        return (unmatched_canvas_students, canvas_report_headers,
+                unmatched_zybook_students, zybooks_report_headers)
+
+    def write_list(self, path, data, headers):
+        with open(path, "w", newline="") as out_file:
+            writer = csv.DictWriter(out_file,
+                                    fieldnames=headers,
+                                    extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(data)
+
     def report_list(self, data, headers, name, default_path=""):
         if not data:
             popup = ui.layers.Popup("No Data")
@@ -579,9 +702,4 @@ class GradePuller:
         if path is None:
             raise GradePuller.StoppingException()
 
-        with open(path, "w", newline="") as out_file:
-            writer = csv.DictWriter(out_file,
-                                    fieldnames=headers,
-                                    extrasaction="ignore")
-            writer.writeheader()
-            writer.writerows(data)
+        self.write_list(path, data, headers)
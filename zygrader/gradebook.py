@@ -0,0 +1,170 @@
+"""Gradebook: A column oriented view of the Canvas gradebook
+
+The Canvas export is parsed once into one array of scores per assignment,
+with a mask of the cells that have no score, and an index from class
+section to rows. Bulk grade changes are done a column at a time with NumPy
+when it is installed, and with the array module otherwise.
+
+Changed scores are written back to the student rows of the GradePuller the
+gradebook was made from, so the upload file is written the same way.
+"""
+import array
+import math
+import typing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Column(typing.NamedTuple):
+    # The score in each row, NaN where the cell isn't a number
+    values: typing.Any
+    # True where the cell is empty
+    missing: typing.Any
+
+
+def parse_score(cell: str) -> float:
+    try:
+        return float(cell)
+    except ValueError:
+        return math.nan
+
+
+class Gradebook:
+    def __init__(self, puller):
+        self.header = puller.canvas_header
+        self.points_out_of = puller.canvas_points_out_of
+        self.students = list(puller.canvas_students.values())
+        self.names = [student["Student"] for student in self.students]
+
+        # Row indices of the students in each class section
+        self.section_index = dict()
+        for row, student in enumerate(self.students):
+            self.section_index.setdefault(student["section_number"],
+                                          []).append(row)
+
+        self.__columns = dict()
+
+    def __len__(self):
+        return len(self.students)
+
+    def column(self, assignment: str) -> Column:
+        """The parsed scores of an assignment, parsed on first use"""
+        if assignment not in self.__columns:
+            cells = [student[assignment] for student in self.students]
+            scores = [parse_score(cell) for cell in cells]
+            missing = [not cell for cell in cells]
+            if numpy:
+                self.__columns[assignment] = Column(
+                    numpy.array(scores, dtype=float),
+                    numpy.array(missing, dtype=bool))
+            else:
+                self.__columns[assignment] = Column(array.array("d", scores),
+                                                    bytearray(missing))
+        return self.__columns[assignment]
+
+    def rows(self, class_sections) -> typing.List[int]:
+        """The rows of the students in any of the class sections"""
+        return sorted(row for section in class_sections
+                      for row in self.section_index.get(section, ()))
+
+    def set_scores(self, assignment: str, rows, scores):
+        """Set the scores of an assignment for the given rows"""
+        values = self.column(assignment).values
+        missing = self.column(assignment).missing
+        for row, score in zip(rows, scores):
+            row = int(row)
+            # NumPy scalars become plain ints and floats for the CSV writer
+            score = score.item() if hasattr(score, "item") else score
+            values[row] = score
+            missing[row] = False
+            self.students[row][assignment] = score
+
+    def gaps(self, assignments) -> typing.Dict[str, typing.List[str]]:
+        """The names of the students missing a score for each assignment,
+        leaving out assignments without gaps"""
+        all_gaps = dict()
+        for assignment in assignments:
+            missing = self.column(assignment).missing
+            if numpy:
+                rows = numpy.flatnonzero(missing)
+            else:
+                rows = [row for row, empty in enumerate(missing) if empty]
+            if len(rows):
+                all_gaps[assignment] = [self.names[row] for row in rows]
+        return all_gaps
+
+    def replace_lowest(self, assignments: typing.List[str], replacement: str):
+        """For each student, replace the lowest score of the assignments
+        with the replacement assignment's score if it is higher
+
+        Ties go to the first assignment. Students missing any of the scores
+        are left as they are.
+        """
+        columns = [self.column(assignment).values for assignment in assignments]
+        replacements = self.column(replacement).values
+
+        if numpy:
+            scores = numpy.vstack(columns)
+            lowest = numpy.argmin(scores, axis=0)
+            lowest_scores = scores[lowest, numpy.arange(len(self))]
+            # Comparisons with NaN are false, so rows with a missing score
+            # are never replaced
+            replace = ((replacements > lowest_scores)
+                       & ~numpy.isnan(scores).any(axis=0))
+            for index, assignment in enumerate(assignments):
+                rows = numpy.flatnonzero(replace & (lowest == index))
+                self.set_scores(assignment, rows, replacements[rows])
+            return
+
+        replaced = [([], []) for _ in assignments]
+        for row in range(len(self)):
+            row_scores = [column[row] for column in columns]
+            if any(math.isnan(score) for score in row_scores):
+                continue
+            index = min(range(len(row_scores)), key=row_scores.__getitem__)
+            if replacements[row] > row_scores[index]:
+                replaced[index][0].append(row)
+                replaced[index][1].append(replacements[row])
+        for assignment, (rows, scores) in zip(assignments, replaced):
+            self.set_scores(assignment, rows, scores)
+
+    def totals(self, assignments: typing.List[str], rows):
+        """The sum of the assignments' scores for each of the rows. Cells
+        without a number count as the assignment's points possible."""
+        if numpy:
+            rows = numpy.asarray(rows, dtype=int)
+            totals = numpy.zeros(len(rows))
+            for assignment in assignments:
+                scores = self.column(assignment).values[rows]
+                out_of = parse_score(self.points_out_of[assignment])
+                totals += numpy.where(numpy.isnan(scores), out_of, scores)
+            return totals
+
+        totals = array.array("d", bytes(8 * len(rows)))
+        for assignment in assignments:
+            values = self.column(assignment).values
+            out_of = parse_score(self.points_out_of[assignment])
+            for i, row in enumerate(rows):
+                score = values[row]
+                totals[i] += out_of if math.isnan(score) else score
+        return totals
+
+
+def lookup(values, table: typing.List, default=0):
+    """Map each value to table[value], or default where the value is not a
+    valid index into the table"""
+    if numpy:
+        indices = numpy.asarray(values).astype(int)
+        valid = (indices >= 0) & (indices < len(table))
+        return numpy.where(
+            valid,
+            numpy.asarray(table)[numpy.clip(indices, 0,
+                                            len(table) - 1)], default)
+
+    return [
+        table[int(value)] if 0 <= int(value) < len(table) else default
+        for value in values
+    ]
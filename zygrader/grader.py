@@ -155,9 +155,8 @@ def view_diff(first: model.Submission, second: model.Submission):
     paths_a.sort()
     paths_b.sort()
 
-    diff = utils.make_diff_string(paths_a, paths_b, first.student.full_name,
-                                  second.student.full_name, use_browser)
-    utils.view_string(diff, "submissions.diff", use_browser)
+    utils.view_diff(paths_a, paths_b, first.student.full_name,
+                    second.student.full_name, "submissions.diff", use_browser)
 
 
 def run_code_fn(window, submission):
@@ -170,6 +169,39 @@ def run_code_fn(window, submission):
         window.run_layer(popup)
 
 
+def run_tests_fn(window, submission):
+    """Callback to run a submission against its zyBooks test bench"""
+    part_index = 0
+    if len(submission.lab.parts) > 1:
+        part_index = submission.pick_part()
+        if part_index is None:
+            return
+
+    tests = submission.get_test_cases(part_index)
+    if not tests:
+        popup = ui.layers.Popup("No Tests", [
+            "There are no output tests to run for this submission.",
+        ])
+        window.run_layer(popup)
+        return
+
+    popup = ui.layers.WaitPopup("Run Tests")
+    popup.set_message([f"Running {len(tests)} tests"])
+    popup.set_wait_fn(lambda: submission.run_tests(part_index, tests))
+    window.run_layer(popup)
+    if popup.canceled:
+        return
+
+    report = popup.get_result()
+    if not report:
+        popup = ui.layers.OptionsPopup("Error", ["Could not compile code"])
+        popup.add_option("View Log", submission.view_stderr)
+        window.run_layer(popup)
+        return
+
+    utils.view_string(report, "tests.txt")
+
+
 def pair_programming_submission_callback(lab, submission):
     """Show both pair programming students for viewing a diff"""
     window = ui.get_window()
@@ -378,6 +410,7 @@ def student_select_fn(student, lab, use_locks):
             popup.add_option("Diff Parts",
                              lambda: diff_parts_fn(window, submission))
         popup.add_option("Run", lambda: run_code_fn(window, submission))
+        popup.add_option("Run Tests", lambda: run_tests_fn(window, submission))
         popup.add_option("View", lambda: submission.show_files())
         window.run_layer(popup)
 
@@ -6,8 +6,8 @@ import signal
 import sys
 import time
 
-from zygrader import (admin, config, data, email_manager, grader, logger, ui,
-                      updater, user, utils, zybooks)
+from zygrader import (admin, cli, config, data, email_manager, grader, logger,
+                      ui, updater, user, utils, zybooks)
 from zygrader.config import preferences, versioning
 from zygrader.config.shared import SharedData
 
@@ -30,7 +30,7 @@ def sigint_handler(signum, frame):
         # If child process is running
         if SharedData.running_process.poll() is None:
             SharedData.RUNNING_CODE = False
-            SharedData.running_process.send_signal(signal.SIGINT)
+            SharedData.running_process.interrupt()
             SharedData.running_process = None
     else:
         # Terminating the program
@@ -72,6 +72,8 @@ def parse_args():
                        "--install-version",
                        help="Specify version to install")
 
+    cli.add_subcommands(parser)
+
     return parser.parse_args()
 
 
@@ -191,8 +193,9 @@ def start():
 
     args = parse_args()
 
-    # Check for updates
-    if not args.no_update and not args.install_version:
+    # Check for updates. Headless commands may be run unattended, so they
+    # never update.
+    if not (args.command or args.no_update or args.install_version):
         latest_version = updater.get_latest_version()
         if latest_version != SharedData.VERSION:
             updater.update_zygrader(latest_version)
@@ -225,6 +228,9 @@ def start():
     data.get_students()
     data.get_labs()
 
+    if args.command:
+        sys.exit(cli.run(args))
+
     # Change directory to the default output dir
     os.chdir(os.path.expanduser(preferences.get("output_dir")))
 
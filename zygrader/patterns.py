@@ -0,0 +1,160 @@
+"""Patterns: Match many search patterns in one pass over a file
+
+Literal patterns are found together with an Aho-Corasick automaton, and
+regex patterns are combined into a single regex. Each file is scanned
+once no matter how many patterns are being searched for, and the scan
+stops as soon as every pattern has been found.
+"""
+import collections
+import re
+import typing
+
+# Patterns written as /.../ are regexes, everything else is a literal
+REGEX_DELIMITER = "/"
+
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class Pattern(typing.NamedTuple):
+    text: str
+    is_regex: bool
+
+    @staticmethod
+    def parse(text: str) -> "Pattern":
+        if (len(text) > 2 and text.startswith(REGEX_DELIMITER)
+                and text.endswith(REGEX_DELIMITER)):
+            return Pattern(text[1:-1], True)
+        return Pattern(text, False)
+
+    def regex(self) -> str:
+        """The pattern as a regex string"""
+        return self.text if self.is_regex else re.escape(self.text)
+
+    def __str__(self):
+        if self.is_regex:
+            return f"{REGEX_DELIMITER}{self.text}{REGEX_DELIMITER}"
+        return self.text
+
+
+class AhoCorasick:
+    """Find which of a set of strings occur in a text in a single pass"""
+    def __init__(self, words: typing.List[str]):
+        # The trie, as a list of {character: state} transitions
+        self.__goto = [{}]
+        self.__fail = [0]
+        # The indices of the words that end at each state
+        self.__output = [set()]
+
+        for index, word in enumerate(words):
+            state = 0
+            for char in word:
+                if char not in self.__goto[state]:
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__output.append(set())
+                    self.__goto[state][char] = len(self.__goto) - 1
+                state = self.__goto[state][char]
+            self.__output[state].add(index)
+
+        # Breadth first, link each state to the longest proper suffix of its
+        # string that is also in the trie
+        queue = collections.deque(self.__goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.__goto[state].items():
+                queue.append(next_state)
+                fail = self.__fail[state]
+                while fail and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                self.__fail[next_state] = self.__goto[fail].get(char, 0)
+                self.__output[next_state] |= self.__output[
+                    self.__fail[next_state]]
+
+    def search(self, text: str, wanted: int) -> typing.Set[int]:
+        """Return the indices of the words found in text
+
+        Stops early once `wanted` different words have been found.
+        """
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.__goto[state]:
+                state = self.__fail[state]
+            state = self.__goto[state].get(char, 0)
+            if self.__output[state]:
+                found |= self.__output[state]
+                if len(found) >= wanted:
+                    break
+        return found
+
+
+class PatternSet:
+    """A list of patterns that are searched for together"""
+    def __init__(self, patterns: typing.List[Pattern]):
+        self.patterns = patterns
+
+        self.__literal_indices = [
+            i for i, pattern in enumerate(patterns) if not pattern.is_regex
+        ]
+        self.__automaton = AhoCorasick(
+            [patterns[i].text for i in self.__literal_indices])
+
+        self.__regex_indices = [
+            i for i, pattern in enumerate(patterns) if pattern.is_regex
+        ]
+        self.__combined = None
+        self.__regexes = [
+            re.compile(patterns[i].text) for i in self.__regex_indices
+        ]
+        if self.__regexes:
+            self.__combined = self.__combine()
+
+    def __combine(self):
+        """Combine the regexes into one
+
+        A lookahead for any of the regexes finds each position where one
+        matches, then optional named lookaheads record every regex that
+        matches there. Returns None if the regexes can't be combined (if
+        they use backreferences, global flags or clashing group names).
+        """
+        # Group numbers change when combined, so backreferences would break
+        if any(BACKREFERENCE.search(regex.pattern) for regex in self.__regexes):
+            return None
+
+        alternatives = "|".join(f"(?:{regex.pattern})"
+                                for regex in self.__regexes)
+        lookaheads = "".join(f"(?:(?=(?P<p{i}>{regex.pattern})))?"
+                             for i, regex in enumerate(self.__regexes))
+        try:
+            return re.compile(f"(?=(?:{alternatives})){lookaheads}")
+        except re.error:
+            return None
+
+    def __search_regexes(self, text: str) -> typing.Set[int]:
+        if not self.__combined:
+            return {
+                self.__regex_indices[i]
+                for i, regex in enumerate(self.__regexes) if regex.search(text)
+            }
+
+        found = set()
+        for match in self.__combined.finditer(text):
+            for name, value in match.groupdict().items():
+                if value is not None:
+                    found.add(self.__regex_indices[int(name[1:])])
+            if len(found) == len(self.__regexes):
+                break
+        return found
+
+    def search(self, text: str) -> typing.Set[int]:
+        """Return the indices of the patterns found in text"""
+        found = set()
+        if self.__literal_indices:
+            found |= {
+                self.__literal_indices[i]
+                for i in self.__automaton.search(text,
+                                                 len(self.__literal_indices))
+            }
+        if self.__regexes:
+            found |= self.__search_regexes(text)
+        return found
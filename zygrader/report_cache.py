@@ -0,0 +1,92 @@
+"""Report Cache: Reuse completion reports fetched from zyBooks recently
+
+zyBooks takes a while to generate each completion report export, and the
+grade puller often asks for the same report again (re-pulling after a
+mistake, or finding unmatched students right after a pull). Parsed reports
+are kept in memory and in zygrader_data/SEMESTER_FOLDER/.reports/, keyed
+by the class code, the zyBook sections and the due time, and are reused
+until they are older than the user's cache time.
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+
+from zygrader.config.shared import SharedData
+
+# Reports older than this are removed from disk when another is saved
+MAX_AGE = 24 * 60 * 60
+
+__memory = dict()
+__lock = threading.Lock()
+
+
+def cache_key(class_code: str, zybook_sections,
+              due_time: datetime.datetime) -> str:
+    section_ids = sorted(section["canonical_section_id"]
+                         for section in zybook_sections)
+    due = due_time.astimezone(datetime.timezone.utc).isoformat()
+    encoded = json.dumps([class_code, section_ids, due])
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def __report_path(key: str) -> str:
+    return os.path.join(SharedData.get_reports_directory(), f"{key}.json")
+
+
+def get(key: str, max_age: float) -> typing.Optional[typing.Tuple]:
+    """Return the cached (report, header) if it is at most max_age seconds
+    old, or None"""
+    now = time.time()
+    with __lock:
+        if key in __memory:
+            fetched, report, header = __memory[key]
+            if now - fetched <= max_age:
+                return dict(report), header
+
+    try:
+        with open(__report_path(key), "r") as _file:
+            cached = json.load(_file)
+    except (OSError, ValueError):
+        return None
+    if now - cached["fetched"] > max_age:
+        return None
+
+    # JSON keys are strings, so rebuild the report from each row's id
+    report = {row["id_number"]: row for row in cached["rows"]}
+    with __lock:
+        __memory[key] = (cached["fetched"], report, cached["header"])
+    return dict(report), cached["header"]
+
+
+def put(key: str, report: dict, header: typing.List[str]):
+    """Save a freshly fetched report"""
+    fetched = time.time()
+    with __lock:
+        __memory[key] = (fetched, report, header)
+
+    directory = SharedData.get_reports_directory()
+    contents = {
+        "fetched": fetched,
+        "header": header,
+        "rows": list(report.values())
+    }
+    # Write to a temporary name first so other graders never read a
+    # partially written report
+    fd, temp_name = tempfile.mkstemp(prefix=".report-", dir=directory)
+    with os.fdopen(fd, "w") as _file:
+        json.dump(contents, _file)
+    os.chmod(temp_name, 0o644)
+    os.replace(temp_name, __report_path(key))
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if fetched - os.path.getmtime(path) > MAX_AGE:
+                os.remove(path)
+        except OSError:
+            pass
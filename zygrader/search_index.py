@@ -0,0 +1,193 @@
+"""Search Index: A trigram index of cached submissions for fast searches
+
+Each lab part has an index in zygrader_data/SEMESTER_FOLDER/.index/ that
+maps the lowercase trigrams of each submitted file to the (student,
+submission, file) that contains them. Zips are added as they are searched,
+so the index grows with the zip cache. A search first finds the literal
+strings its pattern requires, and only the files containing all of their
+trigrams are decompressed and checked with the real pattern.
+"""
+import os
+import sqlite3
+import threading
+import typing
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from zygrader.config.shared import SharedData
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS zips (zip TEXT PRIMARY KEY, student TEXT);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, zip TEXT, name TEXT);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER, file INTEGER, PRIMARY KEY (trigram, file)
+) WITHOUT ROWID;
+"""
+
+# Seconds to wait on another grader writing to the same index
+LOCK_TIMEOUT = 30
+
+
+def trigrams(text: str) -> typing.Set[int]:
+    """Return the lowercase trigrams of a string, packed into integers"""
+    codes = [ord(c) for c in text.lower()]
+    return {(codes[i] << 42) | (codes[i + 1] << 21) | codes[i + 2]
+            for i in range(len(codes) - 2)}
+
+
+def __literals(parsed) -> typing.List[str]:
+    literals = []
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            literals.append("".join(run))
+            run = []
+
+        if op is sre_parse.SUBPATTERN:
+            literals.extend(__literals(av[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            min_repeat, _, item = av
+            if min_repeat >= 1:
+                literals.extend(__literals(item))
+        # Anything else (alternation, classes, ...) has no required literal
+
+    if run:
+        literals.append("".join(run))
+    return literals
+
+
+def required_literals(pattern: str) -> typing.List[str]:
+    """Return strings that every match of a regex must contain"""
+    try:
+        return __literals(sre_parse.parse(pattern))
+    except Exception:
+        # Don't narrow the search if the pattern can't be analyzed
+        return []
+
+
+class TrigramIndex:
+    """The trigram index for one lab part
+
+    Safe to share between threads. Several graders may write to the same
+    index, sqlite handles the locking.
+    """
+    def __init__(self, part_id: str):
+        path = os.path.join(SharedData.get_index_directory(),
+                            f"{part_id}.sqlite")
+        self.__connection = sqlite3.connect(path,
+                                            timeout=LOCK_TIMEOUT,
+                                            check_same_thread=False)
+        self.__lock = threading.Lock()
+        with self.__lock, self.__connection:
+            # The index can always be rebuilt, so favor write speed
+            self.__connection.execute("PRAGMA journal_mode = WAL")
+            self.__connection.execute("PRAGMA synchronous = OFF")
+            self.__connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def indexed_zips(self) -> typing.Set[str]:
+        """Return the names of all indexed zips"""
+        with self.__lock:
+            rows = self.__connection.execute("SELECT zip FROM zips")
+            return {row[0] for row in rows}
+
+    def add_zip(self, zip_name: str, student_id: str, files: typing.Dict[str,
+                                                                         str]):
+        """Index the files of a submission zip"""
+        # Skip the tokenizing when searching already indexed submissions
+        with self.__lock:
+            if self.__connection.execute("SELECT 1 FROM zips WHERE zip = ?",
+                                         (zip_name, )).fetchone():
+                return
+
+        file_trigrams = {name: trigrams(text) for name, text in files.items()}
+
+        with self.__lock, self.__connection:
+            cursor = self.__connection.execute(
+                "INSERT OR IGNORE INTO zips VALUES (?, ?)",
+                (zip_name, student_id))
+            if cursor.rowcount == 0:
+                # Already indexed by another grader
+                return
+
+            for name, grams in file_trigrams.items():
+                file_id = self.__connection.execute(
+                    "INSERT INTO files (zip, name) VALUES (?, ?)",
+                    (zip_name, name)).lastrowid
+                self.__connection.executemany(
+                    "INSERT INTO postings VALUES (?, ?)",
+                    ((trigram, file_id) for trigram in grams))
+
+    def candidate_files(
+        self, literals: typing.List[str]
+    ) -> typing.Optional[typing.Set[typing.Tuple[str, str]]]:
+        """Return the (zip, file) pairs that contain all of the literals
+
+        Returns None if the literals are too short to narrow the search.
+        """
+        query = set()
+        for literal in literals:
+            query |= trigrams(literal)
+        if not query:
+            return None
+
+        with self.__lock:
+            # Start with the rarest trigram to keep the intersection small
+            counts = sorted((self.__connection.execute(
+                "SELECT COUNT(*) FROM postings WHERE trigram = ?", (
+                    trigram, )).fetchone()[0], trigram) for trigram in query)
+
+            file_ids = None
+            for _, trigram in counts:
+                rows = self.__connection.execute(
+                    "SELECT file FROM postings WHERE trigram = ?", (trigram, ))
+                ids = {row[0] for row in rows}
+                file_ids = ids if file_ids is None else file_ids & ids
+                if not file_ids:
+                    return set()
+
+            rows = self.__connection.execute("SELECT id, zip, name FROM files")
+            return {(zip_name, name)
+                    for file_id, zip_name, name in rows if file_id in file_ids}
+
+
+class SearchPlan:
+    """Decides which zips and files a search must check
+
+    Zips indexed before the search started are only opened if the index
+    says they may contain a match for at least one of the patterns. Zips
+    indexed later (or never) are always checked in full.
+    """
+    def __init__(self, index: TrigramIndex, patterns: typing.List[str]):
+        self.__indexed = index.indexed_zips()
+
+        self.__candidates = {}
+        for pattern in patterns:
+            candidates = index.candidate_files(required_literals(pattern))
+            if candidates is None:
+                # This pattern could be in any file
+                self.__candidates = None
+                break
+
+            for zip_name, file_name in candidates:
+                self.__candidates.setdefault(zip_name, set()).add(file_name)
+
+    def should_open(self, zip_name: str) -> bool:
+        if self.__candidates is None or zip_name not in self.__indexed:
+            return True
+        return zip_name in self.__candidates
+
+    def should_search(self, zip_name: str, file_name: str) -> bool:
+        if self.__candidates is None or zip_name not in self.__indexed:
+            return True
+        return file_name in self.__candidates.get(zip_name, ())
@@ -0,0 +1,304 @@
+"""Similarity: Find pairs of submissions with suspiciously similar code
+
+Each submission is tokenized with identifiers, literals, comments and
+whitespace normalized away, so renaming variables or reformatting does not
+hide copied code. Token k-grams are hashed and winnowed into fingerprints,
+and each submission's fingerprints are summarized with a MinHash signature.
+Locality-sensitive hashing on the signatures gives the candidate pairs, so
+only submissions likely to be similar are compared in full. This keeps a
+whole-lab check at about linear time in the number of submissions.
+"""
+import collections
+import os
+import re
+import typing
+import zlib
+
+# Tokens per k-gram. Shorter matches than this are not detected.
+KGRAM_SIZE = 12
+# Winnowing window, any match at least KGRAM_SIZE + WINDOW_SIZE - 1 tokens
+# long is guaranteed to share a fingerprint
+WINDOW_SIZE = 6
+
+# MinHash signature length. The signature is split into LSH bands and pairs
+# are candidates when any band matches exactly. A pair with similarity J
+# shares a band of r rows with probability 1 - (1 - J^r)^(SIGNATURE_SIZE/r),
+# so rows per band are picked from the reporting threshold to keep at least
+# MIN_RECALL of the pairs at that threshold. For MIN_SIMILARITY this is 32
+# bands of 2 rows: about 95% recall at 0.3 and 99.6% at 0.4.
+SIGNATURE_SIZE = 64
+MIN_RECALL = 0.95
+
+# Fingerprints shared by more than this fraction of submissions are starter
+# code or otherwise unavoidable, and are ignored
+COMMON_FRACTION = 0.2
+
+# Pairs below this similarity are not reported
+MIN_SIMILARITY = 0.3
+
+SOURCE_EXTENSIONS = {".cpp", ".cc", ".c", ".h", ".hpp", ".py", ".java"}
+
+KEYWORDS = {
+    "auto", "bool", "break", "case", "catch", "char", "class", "const",
+    "continue", "default", "delete", "do", "double", "else", "enum", "false",
+    "float", "for", "if", "int", "long", "namespace", "new", "nullptr",
+    "operator", "private", "protected", "public", "return", "short", "signed",
+    "sizeof", "static", "struct", "switch", "template", "this", "throw", "true",
+    "try", "typedef", "unsigned", "using", "virtual", "void", "while", "cin",
+    "cout", "endl", "getline", "string", "vector", "def", "elif", "import",
+    "in", "not", "and", "or", "None", "True", "False", "print", "range", "self",
+    "lambda", "pass"
+}
+
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/|\#[^\n]*)
+    |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?[fFlLuU]*)
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<operator><<=|>>=|<<|>>|\+\+|--|->|==|!=|<=|>=|&&|\|\||::|[-+*/%=<>!&|^~?:;,.()\[\]{}])
+    """, re.VERBOSE | re.DOTALL)
+
+
+class Token(typing.NamedTuple):
+    text: str
+    line: int
+
+
+class Fingerprint(typing.NamedTuple):
+    hash: int
+    file: str
+    line: int
+
+
+class Submission:
+    """The normalized fingerprints of one student's submission"""
+    def __init__(self, name: str, files: typing.Dict[str, str]):
+        self.name = name
+        self.fingerprints: typing.List[Fingerprint] = []
+        for file_name, text in files.items():
+            self.fingerprints.extend(fingerprint_file(file_name, text))
+
+        self.hashes = {fingerprint.hash for fingerprint in self.fingerprints}
+        self.signature = None
+
+
+class Match(typing.NamedTuple):
+    first: Submission
+    second: Submission
+    similarity: float
+    # The matched regions in each submission, as "file:start-end" ranges
+    first_regions: typing.List[str]
+    second_regions: typing.List[str]
+
+
+def tokenize(text: str) -> typing.List[Token]:
+    """Split source code into normalized tokens
+
+    Identifiers become "V", numbers "N" and string literals "S", keywords
+    and operators are kept. Comments, preprocessor lines and whitespace are
+    dropped.
+    """
+    tokens = []
+    line = 1
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        line += text.count("\n", position, match.start())
+        position = match.start()
+
+        kind = match.lastgroup
+        if kind == "name":
+            word = match.group()
+            tokens.append(Token(word if word in KEYWORDS else "V", line))
+        elif kind == "number":
+            tokens.append(Token("N", line))
+        elif kind == "string":
+            tokens.append(Token("S", line))
+        elif kind == "operator":
+            tokens.append(Token(match.group(), line))
+
+    return tokens
+
+
+def __hash_kgram(tokens: typing.List[Token]) -> int:
+    return zlib.crc32(" ".join(token.text for token in tokens).encode())
+
+
+def fingerprint_file(file_name: str, text: str) -> typing.List[Fingerprint]:
+    """Return the winnowed fingerprints of a source file
+
+    The smallest k-gram hash of each window of WINDOW_SIZE hashes is kept
+    (the rightmost on ties), skipping repeats of the same selection.
+    """
+    tokens = tokenize(text)
+    hashes = [(__hash_kgram(tokens[i:i + KGRAM_SIZE]), tokens[i].line)
+              for i in range(len(tokens) - KGRAM_SIZE + 1)]
+    if not hashes:
+        return []
+
+    fingerprints = []
+    selected = -1
+    for start in range(max(1, len(hashes) - WINDOW_SIZE + 1)):
+        window = hashes[start:start + WINDOW_SIZE]
+        index = start + min(reversed(range(len(window))),
+                            key=lambda i: window[i][0])
+        if index != selected:
+            selected = index
+            fingerprints.append(
+                Fingerprint(hashes[index][0], file_name, hashes[index][1]))
+
+    return fingerprints
+
+
+def __mix(value: int) -> int:
+    # A cheap bit mixer so crc32 values are spread evenly over the bins
+    value = (value ^ (value >> 16)) * 0x45D9F3B & 0xFFFFFFFF
+    value = (value ^ (value >> 16)) * 0x45D9F3B & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+
+def minhash_signature(hashes: typing.Iterable[int]) -> typing.Tuple:
+    """Return a one permutation MinHash signature of a set of hashes
+
+    Each hash is placed in one of SIGNATURE_SIZE bins and the minimum of
+    each bin is kept, which costs one pass over the set instead of one pass
+    per hash function. Empty bins borrow from the next filled bin (rotation
+    densification) so small submissions still have a full signature.
+    """
+    bins = [None] * SIGNATURE_SIZE
+    for value in hashes:
+        mixed = __mix(value)
+        index = mixed % SIGNATURE_SIZE
+        if bins[index] is None or mixed < bins[index]:
+            bins[index] = mixed
+
+    if all(value is None for value in bins):
+        return tuple(bins)
+
+    signature = []
+    for index in range(SIGNATURE_SIZE):
+        distance = 0
+        while bins[(index + distance) % SIGNATURE_SIZE] is None:
+            distance += 1
+        value = bins[(index + distance) % SIGNATURE_SIZE]
+        # Offset borrowed values so they differ from the bin they came from
+        signature.append(value + distance * (1 << 32))
+    return tuple(signature)
+
+
+def band_rows(threshold: float) -> int:
+    """Return the most rows per LSH band that still make pairs at threshold
+    candidates with probability at least MIN_RECALL"""
+    for rows in range(SIGNATURE_SIZE, 1, -1):
+        if SIGNATURE_SIZE % rows:
+            continue
+        bands = SIGNATURE_SIZE // rows
+        if 1 - (1 - threshold**rows)**bands >= MIN_RECALL:
+            return rows
+    return 1
+
+
+def __candidate_pairs(submissions: typing.List[Submission], rows: int):
+    """Return index pairs of submissions that share at least one LSH band"""
+    candidates = set()
+    for band_start in range(0, SIGNATURE_SIZE, rows):
+        buckets = collections.defaultdict(list)
+        for index, submission in enumerate(submissions):
+            band = submission.signature[band_start:band_start + rows]
+            # Submissions with no fingerprints are not similar to anything
+            if None in band:
+                continue
+            buckets[band].append(index)
+
+        for bucket in buckets.values():
+            for i, first in enumerate(bucket):
+                for second in bucket[i + 1:]:
+                    candidates.add((first, second))
+
+    return candidates
+
+
+def __format_range(file_name: str, start: int, end: int) -> str:
+    if start == end:
+        return f"{file_name}:{start}"
+    return f"{file_name}:{start}-{end}"
+
+
+def __line_ranges(lines: typing.Iterable[typing.Tuple[str, int]]):
+    """Merge (file, line) pairs into "file:start-end" ranges"""
+    by_file = collections.defaultdict(set)
+    for file_name, line in lines:
+        by_file[file_name].add(line)
+
+    ranges = []
+    for file_name in sorted(by_file):
+        numbers = sorted(by_file[file_name])
+        start = end = numbers[0]
+        for number in numbers[1:]:
+            # Fingerprints are a few lines apart even in copied code
+            if number - end > KGRAM_SIZE // 2:
+                ranges.append(__format_range(file_name, start, end))
+                start = number
+            end = number
+        ranges.append(__format_range(file_name, start, end))
+
+    return ranges
+
+
+def __compare(first: Submission, second: Submission) -> Match:
+    shared = first.hashes & second.hashes
+    union = len(first.hashes | second.hashes)
+    similarity = len(shared) / union if union else 0.0
+
+    first_lines = [(f.file, f.line) for f in first.fingerprints
+                   if f.hash in shared]
+    second_lines = [(f.file, f.line) for f in second.fingerprints
+                    if f.hash in shared]
+
+    return Match(first, second, similarity, __line_ranges(first_lines),
+                 __line_ranges(second_lines))
+
+
+def read_submission(name: str, directory: str) -> Submission:
+    """Fingerprint the source files of an extracted submission"""
+    files = {}
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            _, extension = os.path.splitext(file_name)
+            if extension.lower() not in SOURCE_EXTENSIONS:
+                continue
+
+            path = os.path.join(root, file_name)
+            with open(path, "r", errors="replace") as _file:
+                files[os.path.relpath(path, directory)] = _file.read()
+
+    return Submission(name, files)
+
+
+def find_similar(submissions: typing.List[Submission],
+                 min_similarity=MIN_SIMILARITY) -> typing.List[Match]:
+    """Return the pairs of submissions that are at least min_similarity
+    similar, most similar first"""
+    # Drop fingerprints most of the class shares (starter code)
+    counts = collections.Counter()
+    for submission in submissions:
+        counts.update(submission.hashes)
+    limit = max(2, int(len(submissions) * COMMON_FRACTION))
+    common = {value for value, count in counts.items() if count > limit}
+
+    for submission in submissions:
+        submission.hashes -= common
+        submission.fingerprints = [
+            f for f in submission.fingerprints if f.hash not in common
+        ]
+        submission.signature = minhash_signature(submission.hashes)
+
+    matches = []
+    rows = band_rows(min_similarity)
+    for first, second in __candidate_pairs(submissions, rows):
+        match = __compare(submissions[first], submissions[second])
+        if match.similarity >= min_similarity:
+            matches.append(match)
+
+    matches.sort(key=lambda match: match.similarity, reverse=True)
+    return matches
@@ -0,0 +1,370 @@
+"""Supervisor: Run student code with resource limits
+
+Student programs run on shared lab servers, so an infinite loop or a fork
+bomb can slow down every grader. Supervised processes run with rlimits on
+CPU time, memory, file size and process count, and inside a cgroup v2
+group when the system allows creating one. Runaway output is capped and the
+rest is spilled to a file, up to a limit. When the program ends, its CPU time, max RSS and
+wall time are available in summary().
+"""
+import fcntl
+import os
+import pty
+import signal
+import subprocess
+import sys
+import termios
+import threading
+import time
+import typing
+
+# Seconds of CPU time (not wall time, so waiting for input doesn't count)
+CPU_TIME_LIMIT = 60
+MEMORY_LIMIT = 1024 * 1024 * 1024
+FILE_SIZE_LIMIT = 64 * 1024 * 1024
+# Processes the student code may create, in addition to the grader's own
+PROCESS_LIMIT = 32
+
+# Bytes of output shown in the terminal before the rest is spilled to a file
+OUTPUT_LIMIT = 1024 * 1024
+# Bytes of output spilled to the file before the program is killed
+SPILL_LIMIT = 64 * 1024 * 1024
+
+# Seconds to wait after an interrupt before killing the process
+INTERRUPT_GRACE_PERIOD = 1
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Sets the rlimits and joins the cgroup given as arguments, then replaces
+# itself with the program. This does the work of a preexec_fn, which is not
+# safe to use while the grader has other threads running.
+LIMIT_WRAPPER = """
+import os, resource, sys
+count = int(sys.argv[1])
+for spec in sys.argv[2:2 + count]:
+    name, soft, hard = spec.split(":")
+    limit = getattr(resource, name)
+    soft, hard = int(soft), int(hard)
+    # Limits can only be lowered
+    _, current_hard = resource.getrlimit(limit)
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    resource.setrlimit(limit, (soft, hard))
+cgroup = sys.argv[2 + count]
+if cgroup:
+    try:
+        with open(os.path.join(cgroup, "cgroup.procs"), "w") as _file:
+            _file.write("0")
+    except OSError:
+        pass
+args = sys.argv[3 + count:]
+try:
+    os.execvp(args[0], args)
+except OSError as error:
+    sys.stderr.write(f"{args[0]}: {error.strerror}\\n")
+    os._exit(127)
+"""
+
+
+def limited_command(args: typing.List[str],
+                    limits: typing.Dict[str, typing.Tuple[int, int]],
+                    cgroup: str = "") -> typing.List[str]:
+    """Wrap a command so it runs with the rlimits and in the cgroup
+
+    limits maps resource module names like "RLIMIT_AS" to (soft, hard).
+    """
+    specs = [f"{name}:{soft}:{hard}" for name, (soft, hard) in limits.items()]
+    return ([sys.executable, "-I", "-S", "-c", LIMIT_WRAPPER,
+             str(len(specs))] + specs + [cgroup] + list(args))
+
+
+def count_user_processes() -> int:
+    uid = os.getuid()
+    count = 0
+    for name in os.listdir("/proc"):
+        try:
+            if name.isdigit() and os.stat(f"/proc/{name}").st_uid == uid:
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def create_cgroup() -> str:
+    """Try to create a cgroup v2 group with memory and process limits
+
+    This only works when the grader's cgroup is delegated to their user.
+    Returns the path to the group, or an empty string if unavailable.
+    """
+    try:
+        with open("/proc/self/cgroup", "r") as _file:
+            lines = _file.read().splitlines()
+        own_group = [line[3:] for line in lines if line.startswith("0::")]
+        if not own_group:
+            return ""
+
+        path = os.path.join(CGROUP_ROOT, own_group[0].lstrip("/"),
+                            f"zygrader-{os.getpid()}-{time.time_ns()}")
+        os.mkdir(path)
+    except OSError:
+        return ""
+
+    try:
+        with open(os.path.join(path, "memory.max"), "w") as _file:
+            _file.write(str(MEMORY_LIMIT))
+        with open(os.path.join(path, "pids.max"), "w") as _file:
+            _file.write(str(PROCESS_LIMIT))
+    except OSError:
+        os.rmdir(path)
+        return ""
+
+    return path
+
+
+class SupervisedProcess:
+    """A resource-limited child process
+
+    Implements the parts of the subprocess.Popen interface used for running
+    student code (poll, send_signal), and waits on the child with a blocking
+    wait4 rather than polling. With pipes, the program's stdin and stdout
+    are pipes used through communicate() instead of the terminal.
+    """
+    def __init__(self,
+                 args: typing.List[str],
+                 spill_path: str = "",
+                 capture_output=True,
+                 pipes=False,
+                 cwd: str = None):
+        self.args = args
+        self.returncode = None
+        self.rusage = None
+        self.start_time = time.monotonic()
+        self.end_time = None
+
+        self.spill_path = spill_path
+        self.spilled = False
+        # Set when the program is killed for spilling more than SPILL_LIMIT
+        self.output_limit_reached = False
+        self.__relay_thread = None
+
+        self.__cgroup = create_cgroup()
+        process_limit = count_user_processes() + PROCESS_LIMIT
+
+        limits = {
+            "RLIMIT_CPU": (CPU_TIME_LIMIT, CPU_TIME_LIMIT + 1),
+            "RLIMIT_AS": (MEMORY_LIMIT, MEMORY_LIMIT),
+            "RLIMIT_FSIZE": (FILE_SIZE_LIMIT, FILE_SIZE_LIMIT),
+            "RLIMIT_NPROC": (process_limit, process_limit),
+            "RLIMIT_CORE": (0, 0),
+        }
+
+        stdin = None
+        stdout = None
+        if pipes:
+            stdin = stdout = subprocess.PIPE
+            capture_output = False
+        elif capture_output:
+            # Use a pty so the program still sees a terminal (line buffered
+            # output), while its output passes through the output limit
+            master, stdout = pty.openpty()
+            self.__copy_window_size(stdout)
+
+        self.__process = subprocess.Popen(limited_command(
+            args, limits, self.__cgroup),
+                                          stdin=stdin,
+                                          stdout=stdout,
+                                          stderr=subprocess.DEVNULL,
+                                          cwd=cwd)
+        self.pid = self.__process.pid
+
+        if capture_output:
+            os.close(stdout)
+            self.__relay_thread = threading.Thread(target=self.__relay_output,
+                                                   args=(master, ),
+                                                   name="Output Relay",
+                                                   daemon=True)
+            self.__relay_thread.start()
+
+    def __copy_window_size(self, fd):
+        try:
+            size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ,
+                               b"\0" * 8)
+            fcntl.ioctl(fd, termios.TIOCSWINSZ, size)
+        except OSError:
+            pass
+
+    def __relay_output(self, master):
+        """Copy output to the terminal until OUTPUT_LIMIT, then to a file
+        until SPILL_LIMIT, when the program is killed"""
+        written = 0
+        spilled = 0
+        spill_file = None
+        while True:
+            try:
+                chunk = os.read(master, 4096)
+            except OSError:
+                # EIO once every copy of the pty's other end is closed
+                break
+            if not chunk:
+                break
+
+            if written < OUTPUT_LIMIT:
+                shown = chunk[:OUTPUT_LIMIT - written]
+                os.write(sys.stdout.fileno(), shown)
+                chunk = chunk[len(shown):]
+                written += len(shown)
+
+            if chunk and self.spill_path and not self.output_limit_reached:
+                if not spill_file:
+                    spill_file = open(self.spill_path, "wb")
+                    self.spilled = True
+                    os.write(sys.stdout.fileno(),
+                             (f"\r\n[Output limit reached, the rest is written"
+                              f" to {self.spill_path}]\r\n").encode())
+                chunk = chunk[:SPILL_LIMIT - spilled]
+                spill_file.write(chunk)
+                spilled += len(chunk)
+                if spilled >= SPILL_LIMIT:
+                    # Nobody reads that much output, the program is stuck in
+                    # a loop. Keep draining the pty until it exits.
+                    self.output_limit_reached = True
+                    self.send_signal(signal.SIGKILL)
+                    os.write(sys.stdout.fileno(),
+                             b"\r\n[Output file limit reached, stopping]\r\n")
+
+        if spill_file:
+            spill_file.close()
+        os.close(master)
+
+    def __handle_status(self, status, rusage) -> bool:
+        """Record the exit status, returns True if the process stopped"""
+        if os.WIFSTOPPED(status):
+            return True
+
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self.rusage = rusage
+        self.end_time = time.monotonic()
+
+        # Let Popen know the process was reaped
+        self.__process.returncode = self.returncode
+
+        if self.__cgroup:
+            try:
+                os.rmdir(self.__cgroup)
+            except OSError:
+                pass
+
+        # Show the last of the output before returning
+        if self.__relay_thread:
+            self.__relay_thread.join(timeout=1)
+
+        return False
+
+    def poll(self):
+        """Return the exit code, or None if the process hasn't exited"""
+        if self.returncode is None:
+            try:
+                pid, status, rusage = os.wait4(self.pid, os.WNOHANG)
+                if pid != 0:
+                    self.__handle_status(status, rusage)
+            except ChildProcessError:
+                pass
+        return self.returncode
+
+    def wait(self) -> bool:
+        """Block until the process exits or is stopped
+
+        Returns True if the process was stopped (paused with CTRL+Z), and
+        False if it exited.
+        """
+        if self.returncode is not None:
+            return False
+
+        try:
+            _, status, rusage = os.wait4(self.pid, os.WUNTRACED)
+        except ChildProcessError:
+            # Already reaped by poll() in a signal handler
+            return False
+
+        return self.__handle_status(status, rusage)
+
+    def communicate(self, input: bytes,
+                    timeout: float) -> typing.Tuple[bytes, bool]:
+        """Write the input and read the output until the program exits
+
+        Only for processes started with pipes. The program is killed if it
+        runs longer than timeout seconds. Returns the output and whether the
+        program timed out.
+        """
+        output = []
+
+        def write_input():
+            try:
+                self.__process.stdin.write(input)
+                self.__process.stdin.close()
+            except OSError:
+                # The program exited without reading all of its input
+                pass
+
+        writer = threading.Thread(target=write_input, daemon=True)
+        reader = threading.Thread(
+            target=lambda: output.append(self.__process.stdout.read()),
+            daemon=True)
+        writer.start()
+        reader.start()
+
+        reader.join(timeout)
+        timed_out = reader.is_alive()
+        if timed_out:
+            self.send_signal(signal.SIGKILL)
+            reader.join()
+        writer.join()
+        self.__process.stdout.close()
+
+        self.wait()
+        return output[0], timed_out
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def interrupt(self):
+        """Send SIGINT, killing the process if it is still alive shortly after
+
+        This ensures a program that ignores SIGINT can't keep running.
+        """
+        self.send_signal(signal.SIGINT)
+
+        timer = threading.Timer(INTERRUPT_GRACE_PERIOD, self.send_signal,
+                                (signal.SIGKILL, ))
+        timer.daemon = True
+        timer.start()
+
+    def summary(self) -> str:
+        """A summary of how the process exited and the resources it used"""
+        if self.returncode is None:
+            return ""
+
+        if self.returncode >= 0:
+            status = f"Exited with code {self.returncode}"
+        else:
+            sig = -self.returncode
+            cpu_time = self.rusage.ru_utime + self.rusage.ru_stime
+            # SIGKILL is sent if the program ignores SIGXCPU at the hard limit
+            if sig == signal.SIGXCPU or (sig == signal.SIGKILL
+                                         and cpu_time >= CPU_TIME_LIMIT):
+                status = "Killed: CPU time limit reached"
+            elif self.output_limit_reached:
+                status = "Killed: output limit reached"
+            else:
+                status = f"Killed by {signal.Signals(sig).name}"
+
+        cpu_time = self.rusage.ru_utime + self.rusage.ru_stime
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = self.rusage.ru_maxrss / 1024
+        wall_time = self.end_time - self.start_time
+        return (f"{status} | CPU {cpu_time:.2f}s | Max RSS {max_rss:.1f} MB"
+                f" | Wall {wall_time:.2f}s")
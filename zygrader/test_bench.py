@@ -0,0 +1,147 @@
+"""Test Bench: Run a submission's zyBooks test bench locally
+
+Each submission's JSON contains the lab's test bench. Tests that give the
+program input and compare its output are turned into local test cases and
+run against the compiled submission in a worker pool. This shows how a
+submission does on the hidden cases without typing input by hand.
+"""
+import concurrent.futures
+import difflib
+import os
+import typing
+
+from zygrader import supervisor
+
+# Seconds each test may run before it is stopped and marked as failed
+TEST_TIMEOUT = 5
+
+# Keys zyBooks has used for test input and expected output
+INPUT_KEYS = ["input", "stdin"]
+OUTPUT_KEYS = ["output", "expected_output", "stdout"]
+
+
+class TestCase:
+    def __init__(self, name: str, input: str, expected: str, max_score: int):
+        self.name = name
+        self.input = input
+        self.expected = expected
+        self.max_score = max_score
+
+
+class TestResult:
+    def __init__(self, test: TestCase, output: str, timed_out: bool,
+                 passed: bool):
+        self.test = test
+        self.output = output
+        self.timed_out = timed_out
+        self.passed = passed
+
+    def get_diff(self) -> typing.List[str]:
+        """A unified diff between the expected and actual output"""
+        return list(
+            difflib.unified_diff(self.test.expected.splitlines(),
+                                 self.output.splitlines(),
+                                 "expected",
+                                 "actual",
+                                 lineterm=""))
+
+
+def __find_value(test: dict, keys: typing.List[str]):
+    # Values are sometimes nested in the test's options
+    for source in [test, test.get("options", {})]:
+        if not isinstance(source, dict):
+            continue
+        for key in keys:
+            if isinstance(source.get(key), str):
+                return source[key]
+    return None
+
+
+def get_test_cases(test_bench: list) -> typing.List[TestCase]:
+    """Convert the output tests of a zyBooks test bench to TestCases
+
+    Tests without both an input and an expected output (unit tests) are
+    skipped.
+    """
+    tests = []
+    for index, test in enumerate(test_bench, 1):
+        input = __find_value(test, INPUT_KEYS)
+        expected = __find_value(test, OUTPUT_KEYS)
+        if input is None or expected is None:
+            continue
+
+        name = test.get("name") or f"Test {index}"
+        tests.append(TestCase(name, input, expected, test.get("max_score", 0)))
+
+    return tests
+
+
+def outputs_match(expected: str, actual: str, ignore_whitespace=True) -> bool:
+    """Compare outputs, optionally ignoring all differences in whitespace"""
+    if ignore_whitespace:
+        return expected.split() == actual.split()
+    return expected == actual
+
+
+def run_test(executable: str,
+             test: TestCase,
+             directory: str,
+             timeout=TEST_TIMEOUT,
+             ignore_whitespace=True) -> TestResult:
+    """Run the executable in the submission's directory with the test's
+    input and compare its output
+
+    The program runs with the same resource limits as running it by hand.
+    """
+    process = supervisor.SupervisedProcess([executable],
+                                           pipes=True,
+                                           cwd=directory)
+    stdout, timed_out = process.communicate(test.input.encode(), timeout)
+
+    output = stdout.decode("utf-8", errors="replace")
+    passed = not timed_out and outputs_match(test.expected, output,
+                                             ignore_whitespace)
+    return TestResult(test, output, timed_out, passed)
+
+
+def run_tests(executable: str,
+              tests: typing.List[TestCase],
+              directory: str,
+              timeout=TEST_TIMEOUT,
+              ignore_whitespace=True) -> typing.List[TestResult]:
+    """Run all tests against the executable in a worker pool
+
+    The tests run in directory, so they find the submission's data files.
+    Results are returned in the same order as the tests.
+    """
+    with concurrent.futures.ThreadPoolExecutor(os.cpu_count()) as executor:
+        return list(
+            executor.map(
+                lambda test: run_test(executable, test, directory, timeout,
+                                      ignore_whitespace), tests))
+
+
+def format_results(results: typing.List[TestResult]) -> str:
+    """Create a report of the test results, with diffs for failed tests"""
+    lines = []
+    score = 0
+    max_score = 0
+    for result in results:
+        max_score += result.test.max_score
+        if result.passed:
+            score += result.test.max_score
+            lines.append(f"PASS  {result.test.name}")
+            continue
+
+        status = "TIMEOUT" if result.timed_out else "FAIL"
+        lines.append(f"{status:5} {result.test.name}")
+        lines.append("Input:")
+        lines.extend(f"    {line}" for line in result.test.input.splitlines())
+        lines.extend(result.get_diff())
+        lines.append("")
+
+    num_passed = len([result for result in results if result.passed])
+    lines.append("")
+    lines.append(f"Passed {num_passed}/{len(results)} tests,"
+                 f" score {score}/{max_score}")
+    return "\n".join(lines) + "\n"
@@ -13,6 +13,8 @@ COLOR_PAIR_LOCKED = 2
 COLOR_PAIR_FLAGGED = 3
 COLOR_PAIR_HEADER = 4
 COLOR_PAIR_HEADER_ALT = 5
+COLOR_PAIR_DIFF_INSERT = 6
+COLOR_PAIR_DIFF_DELETE = 7
 
 
 def init_colors():
@@ -31,6 +33,10 @@ def init_colors():
     # Flagged data
     set_color(COLOR_PAIR_FLAGGED, curses.COLOR_CYAN)
 
+    # Inserted and deleted lines in diffs
+    set_color(COLOR_PAIR_DIFF_INSERT, curses.COLOR_GREEN)
+    set_color(COLOR_PAIR_DIFF_DELETE, curses.COLOR_RED)
+
     # Until a theme is set up, just use defaults from the shell
     # for the header colors
     set_color(COLOR_PAIR_HEADER, -1)
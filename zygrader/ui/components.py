@@ -1161,3 +1161,316 @@ class Logger(Component):
     def append(self, entry):
         self.__log[-1] += entry
         self.draw()
+
+
+class DiffViewer(Component):
+    """A scrollable side by side or unified view of the diffs of many files
+
+    Only the rows visible in the window are drawn. Each file's diff is only
+    computed (by calling diff_fn) the first time it is shown.
+    """
+
+    SIDE_BY_SIDE = 0
+    UNIFIED = 1
+
+    # Row types
+    FILE = 0
+    HUNK = 1
+    EQUAL = 2
+    DELETE = 3
+    INSERT = 4
+    CHANGE = 5
+    FOLD = 6
+
+    LINE_NUMBER_WIDTH = 5
+    TAB_SIZE = 4
+
+    def __init__(self,
+                 height,
+                 width,
+                 y,
+                 x,
+                 file_names: List[str],
+                 diff_fn: Callable,
+                 mode=SIDE_BY_SIDE):
+        self.height = height
+        self.width = width
+
+        self.window = curses.newwin(height, width, y, x)
+        self.window.bkgd(" ", curses.color_pair(colors.COLOR_PAIR_DEFAULT))
+        curses.curs_set(0)
+
+        self.file_names = file_names
+        # Called with a file index, returns (lines_a, lines_b, hunks) where
+        # hunks are lists of difflib-style opcodes
+        self.diff_fn = diff_fn
+        self.mode = mode
+
+        # Rows for each file in each mode, filled in as files are shown
+        self.__rows = {}
+        self.__hunk_starts = {}
+
+        self.file_index = 0
+        self._scroll = 0
+
+    def __view_rows(self):
+        # The bottom line of the window shows the status
+        return self.height - 1
+
+    def __build_rows(self, file_index):
+        lines_a, lines_b, hunks = self.diff_fn(file_index)
+
+        split_rows = [(DiffViewer.FILE, self.file_names[file_index])]
+        unified_rows = [(DiffViewer.FILE, self.file_names[file_index])]
+        split_starts = []
+        unified_starts = []
+
+        if not hunks:
+            split_rows.append((DiffViewer.FOLD, "No differences"))
+            unified_rows.append((DiffViewer.FOLD, "No differences"))
+
+        previous_end = 0
+        for hunk in hunks:
+            a_start, a_end = hunk[0][1], hunk[-1][2]
+            b_start, b_end = hunk[0][3], hunk[-1][4]
+
+            # Fold the unchanged lines between hunks
+            folded = a_start - previous_end
+            previous_end = a_end
+            if folded > 0:
+                fold = (DiffViewer.FOLD, f"{folded} unchanged lines")
+                split_rows.append(fold)
+                unified_rows.append(fold)
+
+            header = (DiffViewer.HUNK, f"@@ -{a_start + 1},{a_end - a_start}"
+                      f" +{b_start + 1},{b_end - b_start} @@")
+            split_starts.append(len(split_rows))
+            unified_starts.append(len(unified_rows))
+            split_rows.append(header)
+            unified_rows.append(header)
+
+            for tag, i1, i2, j1, j2 in hunk:
+                if tag == "equal":
+                    for i, j in zip(range(i1, i2), range(j1, j2)):
+                        split_rows.append((DiffViewer.EQUAL, i, j))
+                        unified_rows.append((DiffViewer.EQUAL, i, j))
+                    continue
+
+                for i in range(i1, i2):
+                    unified_rows.append((DiffViewer.DELETE, i, None))
+                for j in range(j1, j2):
+                    unified_rows.append((DiffViewer.INSERT, None, j))
+
+                # Replaced lines are shown next to each other
+                for offset in range(max(i2 - i1, j2 - j1)):
+                    i = i1 + offset if i1 + offset < i2 else None
+                    j = j1 + offset if j1 + offset < j2 else None
+                    if i is not None and j is not None:
+                        split_rows.append((DiffViewer.CHANGE, i, j))
+                    elif i is not None:
+                        split_rows.append((DiffViewer.DELETE, i, None))
+                    else:
+                        split_rows.append((DiffViewer.INSERT, None, j))
+
+        if hunks and previous_end < len(lines_a):
+            fold = (DiffViewer.FOLD,
+                    f"{len(lines_a) - previous_end} unchanged lines")
+            split_rows.append(fold)
+            unified_rows.append(fold)
+
+        self.__rows[file_index] = (lines_a, lines_b, {
+            DiffViewer.SIDE_BY_SIDE: split_rows,
+            DiffViewer.UNIFIED: unified_rows
+        })
+        self.__hunk_starts[file_index] = {
+            DiffViewer.SIDE_BY_SIDE: split_starts,
+            DiffViewer.UNIFIED: unified_starts
+        }
+
+    def __get_rows(self, file_index=None):
+        if file_index is None:
+            file_index = self.file_index
+        if file_index not in self.__rows:
+            self.__build_rows(file_index)
+        lines_a, lines_b, rows = self.__rows[file_index]
+        return lines_a, lines_b, rows[self.mode]
+
+    def __get_hunk_starts(self, file_index=None):
+        if file_index is None:
+            file_index = self.file_index
+        self.__get_rows(file_index)
+        return self.__hunk_starts[file_index][self.mode]
+
+    def __max_scroll(self, file_index=None):
+        _, _, rows = self.__get_rows(file_index)
+        return max(0, len(rows) - self.__view_rows())
+
+    def __format_text(self, number, lines, width, prefix=""):
+        if number is None:
+            return " " * width
+        text = lines[number].expandtabs(DiffViewer.TAB_SIZE)
+        line = (f"{number + 1:>{DiffViewer.LINE_NUMBER_WIDTH - 1}} "
+                f"{prefix}{text}")
+        return line[:width].ljust(width)
+
+    def __row_color(self, row_type, side_is_empty=False):
+        if side_is_empty:
+            return 0
+        if row_type == DiffViewer.DELETE:
+            return curses.color_pair(colors.COLOR_PAIR_DIFF_DELETE)
+        if row_type == DiffViewer.INSERT:
+            return curses.color_pair(colors.COLOR_PAIR_DIFF_INSERT)
+        if row_type == DiffViewer.CHANGE:
+            return curses.A_BOLD
+        return 0
+
+    def __draw_row(self, y, row, lines_a, lines_b):
+        row_type = row[0]
+        if row_type == DiffViewer.FILE:
+            add_str(self.window, y, 0, row[1][:self.width - 1],
+                    curses.A_BOLD | curses.A_UNDERLINE)
+            return
+        if row_type == DiffViewer.HUNK:
+            add_str(self.window, y, 0, row[1][:self.width - 1],
+                    curses.color_pair(colors.COLOR_PAIR_FLAGGED))
+            return
+        if row_type == DiffViewer.FOLD:
+            add_str(self.window, y, 0,
+                    f"{'':>{DiffViewer.LINE_NUMBER_WIDTH}}... {row[1]} ...",
+                    curses.A_DIM)
+            return
+
+        _, number_a, number_b = row
+        if self.mode == DiffViewer.UNIFIED:
+            if row_type == DiffViewer.INSERT:
+                text = self.__format_text(number_b, lines_b, self.width - 1,
+                                          "+")
+            elif row_type == DiffViewer.DELETE:
+                text = self.__format_text(number_a, lines_a, self.width - 1,
+                                          "-")
+            else:
+                text = self.__format_text(number_a, lines_a, self.width - 1,
+                                          " ")
+            add_str(self.window, y, 0, text, self.__row_color(row_type))
+            return
+
+        half = (self.width - 1) // 2
+        left = self.__format_text(number_a, lines_a, half)
+        right = self.__format_text(number_b, lines_b, self.width - half - 2)
+        left_type = DiffViewer.DELETE if row_type == DiffViewer.CHANGE else row_type
+        right_type = DiffViewer.INSERT if row_type == DiffViewer.CHANGE else row_type
+        add_str(self.window, y, 0, left,
+                self.__row_color(left_type, number_a is None))
+        add_str(self.window, y, half, "|")
+        add_str(self.window, y, half + 1, right,
+                self.__row_color(right_type, number_b is None))
+
+    def __draw_status(self):
+        hunk_starts = self.__get_hunk_starts()
+        hunk = sum(1 for start in hunk_starts if start <= self._scroll)
+        hunk = max(hunk, 1 if hunk_starts else 0)
+        mode = "Side by Side" if self.mode == DiffViewer.SIDE_BY_SIDE else "Unified"
+        status = (f" File {self.file_index + 1}/{len(self.file_names)}"
+                  f" | Hunk {hunk}/{len(hunk_starts)} | {mode}"
+                  " | n/p: hunks  [/]: files  s: view  q: close")
+        add_str(self.window, self.height - 1, 0, status[:self.width - 1],
+                curses.A_REVERSE)
+
+    def draw(self):
+        self.window.erase()
+
+        if self.file_names:
+            lines_a, lines_b, rows = self.__get_rows()
+            visible = rows[self._scroll:self._scroll + self.__view_rows()]
+            for y, row in enumerate(visible):
+                self.__draw_row(y, row, lines_a, lines_b)
+            self.__draw_status()
+
+        self.window.noutrefresh()
+
+    def resize(self, rows, cols):
+        self.height = rows
+        self.width = cols
+
+        resize_window(self.window, self.height, self.width)
+        self._scroll = min(self._scroll, self.__max_scroll())
+
+    def toggle_mode(self):
+        # Keep the same hunk in view when switching
+        hunk_starts = self.__get_hunk_starts()
+        hunk = sum(1 for start in hunk_starts if start <= self._scroll)
+
+        if self.mode == DiffViewer.SIDE_BY_SIDE:
+            self.mode = DiffViewer.UNIFIED
+        else:
+            self.mode = DiffViewer.SIDE_BY_SIDE
+
+        hunk_starts = self.__get_hunk_starts()
+        self._scroll = hunk_starts[hunk - 1] if hunk > 0 else 0
+        self._scroll = min(self._scroll, self.__max_scroll())
+
+    def scroll(self, amount):
+        """Scroll by a number of rows, moving into the next or previous file
+        when scrolling past either end of the current file"""
+        self._scroll += amount
+        if self._scroll > self.__max_scroll():
+            if self.file_index < len(self.file_names) - 1 and amount > 0:
+                self.next_file()
+            else:
+                self._scroll = self.__max_scroll()
+        elif self._scroll < 0:
+            if self.file_index > 0 and amount < 0:
+                self.previous_file()
+                self._scroll = self.__max_scroll()
+            else:
+                self._scroll = 0
+
+    def page_down(self):
+        self.scroll(self.__view_rows() - 1)
+
+    def page_up(self):
+        self.scroll(-(self.__view_rows() - 1))
+
+    def to_top(self):
+        self._scroll = 0
+
+    def to_bottom(self):
+        self._scroll = self.__max_scroll()
+
+    def next_file(self):
+        if self.file_index < len(self.file_names) - 1:
+            self.file_index += 1
+            self._scroll = 0
+
+    def previous_file(self):
+        if self.file_index > 0:
+            self.file_index -= 1
+            self._scroll = 0
+
+    def next_hunk(self):
+        for start in self.__get_hunk_starts():
+            # Hunks at the end of the file may already be in view
+            if min(start, self.__max_scroll()) > self._scroll:
+                self._scroll = min(start, self.__max_scroll())
+                return
+
+        # Continue to the first hunk of a following file with changes
+        for file_index in range(self.file_index + 1, len(self.file_names)):
+            hunk_starts = self.__get_hunk_starts(file_index)
+            if hunk_starts:
+                self.file_index = file_index
+                self._scroll = min(hunk_starts[0], self.__max_scroll())
+                return
+
+    def previous_hunk(self):
+        for start in reversed(self.__get_hunk_starts()):
+            if start < self._scroll:
+                self._scroll = start
+                return
+
+        for file_index in range(self.file_index - 1, -1, -1):
+            hunk_starts = self.__get_hunk_starts(file_index)
+            if hunk_starts:
+                self.file_index = file_index
+                self._scroll = min(hunk_starts[-1], self.__max_scroll())
+                return
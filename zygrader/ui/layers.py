@@ -738,3 +738,74 @@ class LoggerLayer(ComponentLayer):
 
     def append(self, entry):
         self.component.append(entry)
+
+
+class DiffViewer(ComponentLayer):
+    """View the diffs of a list of files without leaving zygrader
+
+    diff_fn is called with the index of a file the first time it is shown,
+    and returns (lines_a, lines_b, hunks) for that file.
+    """
+    def __init__(self,
+                 title,
+                 file_names: List[str],
+                 diff_fn,
+                 side_by_side=True):
+        super().__init__(stack_desc=title)
+
+        mode = (components.DiffViewer.SIDE_BY_SIDE
+                if side_by_side else components.DiffViewer.UNIFIED)
+
+        win = window.Window.get_window()
+        self.component = components.DiffViewer(win.rows - 1, win.cols, 1, 0,
+                                               file_names, diff_fn, mode)
+
+    def resize_component(self, rows, cols):
+        self.component.resize(rows - 1, cols)
+        self.rebuild = True
+        self.redraw = True
+
+    def event_handler(self, event: Event, event_manager: EventManager):
+        self.redraw = True
+
+        if event.type == Event.DOWN:
+            self.component.scroll(1)
+        elif event.type == Event.UP:
+            self.component.scroll(-1)
+        elif event.type == Event.SDOWN:
+            self.component.page_down()
+        elif event.type == Event.SUP:
+            self.component.page_up()
+        elif event.type == Event.HOME:
+            self.component.to_top()
+        elif event.type == Event.END:
+            self.component.to_bottom()
+        elif event.type == Event.TAB:
+            self.component.next_hunk()
+        elif event.type == Event.BTAB:
+            self.component.previous_hunk()
+        elif event.type == Event.RIGHT:
+            self.component.next_file()
+        elif event.type == Event.LEFT:
+            self.component.previous_file()
+        elif event.type == Event.ENTER:
+            event_manager.push_layer_close_event()
+        elif event.type == Event.ESC and event_manager.use_esc_back:
+            event_manager.push_layer_close_event()
+        elif event.type == Event.CHAR_INPUT:
+            if event.value == "n":
+                self.component.next_hunk()
+            elif event.value == "p":
+                self.component.previous_hunk()
+            elif event.value == "]":
+                self.component.next_file()
+            elif event.value == "[":
+                self.component.previous_file()
+            elif event.value == " ":
+                self.component.page_down()
+            elif event.value == "s":
+                self.component.toggle_mode()
+            elif event.value == "q":
+                event_manager.push_layer_close_event()
+        else:
+            self.redraw = False
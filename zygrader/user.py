@@ -124,6 +124,26 @@ def set_default_output_directory(row: ui.layers.Row):
     os.chdir(directory.get_path())
 
 
+def set_report_cache_minutes(row: ui.layers.Row):
+    window = ui.get_window()
+    text_input = ui.layers.TextInputLayer("Completion Report Cache")
+    text_input.set_prompt([
+        "How many minutes should completion reports from zyBooks be reused?",
+        "Enter 0 to always fetch a new report."
+    ])
+    text_input.set_text(str(preferences.get("report_cache_minutes")))
+    window.run_layer(text_input)
+    if text_input.canceled:
+        return
+
+    try:
+        minutes = max(0, int(text_input.get_text()))
+    except ValueError:
+        return
+    preferences.set("report_cache_minutes", minutes)
+    row.set_row_text(f"Completion Report Cache: {minutes} minutes")
+
+
 class PreferenceToggle(ui.layers.Toggle):
     def __init__(self, name, before_fn=None, after_fn=None):
         super().__init__()
@@ -195,9 +215,15 @@ def preferences_menu():
                        PreferenceToggle("clear_filter"))
     row.add_row_toggle("Open Diffs in Browser",
                        PreferenceToggle("browser_diff"))
+    row.add_row_toggle("Side by Side Diffs",
+                       PreferenceToggle("side_by_side_diff"))
     output_row = row.add_row_text(
         f"Default Output Directory: {preferences.get('output_dir')}")
     output_row.set_callback_fn(set_default_output_directory, output_row)
+    cache_row = row.add_row_text(f"Completion Report Cache:"
+                                 f" {preferences.get('report_cache_minutes')}"
+                                 f" minutes")
+    cache_row.set_callback_fn(set_report_cache_minutes, cache_row)
 
     # Class code selector
     row = popup.add_row_parent("Class Code")
@@ -5,13 +5,21 @@ General algorithms/utilities to be shared between modules
 """
 
 import curses
-import difflib
+import functools
+import hashlib
+import html
+import io
 import os
+import shutil
 import subprocess
 import tempfile
-from subprocess import DEVNULL, PIPE
+import typing
+import zipfile
+from subprocess import DEVNULL
 
-from zygrader import data, ui
+from zygrader import data, diff, ui
+from zygrader.config import preferences
+from zygrader.config.shared import SharedData
 from zygrader.zybooks import Zybooks
 
 OPENED_DIRECTORES = []
@@ -67,57 +75,54 @@ def get_diff_name(path, title_a, title_b) -> str:
     return f"{file_name} - {title_a} against {title_b}"
 
 
-def diff_files(first, second, title_a, title_b, use_html):
-    """Given two lists of equal length containing file paths, return a diff of each pair of files"""
-    diffs = {}
+def __html_diff(path_a, path_b, title_a, title_b) -> str:
+    out = io.StringIO()
+    diff.write_html_diff(path_a, path_b, title_a, title_b, out)
+    return out.getvalue()
 
-    num_files = len(first)
 
-    for index in range(num_files):
-        path_a = first[index]
-        path_b = second[index]
+@suspend_curses
+def __view_html_diff(first, second, title_a, title_b, file_name):
+    tmp_dir = create_tempdir()
+    file_path = f"{os.path.join(tmp_dir, file_name)}"
 
-        diff_name = get_diff_name(path_a, title_a, title_b)
+    pairs = list(zip(first, second))
+    names = [get_diff_name(path_a, title_a, title_b) for path_a in first]
+    diff_fn = functools.partial(__html_diff, title_a=title_a, title_b=title_b)
 
-        diff = ""
-        if use_html:
-            with open(path_a, "r") as file_a:
-                with open(path_b, "r") as file_b:
-                    html = difflib.HtmlDiff(4, 80)
-                    diff = html.make_file(file_a.readlines(),
-                                          file_b.readlines(),
-                                          title_a,
-                                          title_b,
-                                          context=True)
-        else:
-            diff_process = subprocess.Popen(
-                ["diff", "-w", "-u", "--color=always", path_a, path_b],
-                stdin=PIPE,
-                stdout=PIPE,
-                stderr=PIPE,
-                universal_newlines=True,
-            )
-            diff = str(diff_process.communicate()[0])
+    # Each file's table is written as soon as it is ready
+    with open(file_path, "w") as _file:
+        _file.write(diff.HTML_HEADER.format(title=f"{title_a} - {title_b}"))
+        for name, table in zip(names, diff.diff_pairs(pairs, diff_fn)):
+            _file.write(f"<h1>{html.escape(name)}</h1>\n")
+            _file.write(table)
+        _file.write(diff.HTML_FOOTER)
 
-        diffs[diff_name] = diff
+    subprocess.Popen(f"xdg-open {file_path}",
+                     shell=True,
+                     stdout=DEVNULL,
+                     stderr=DEVNULL)
 
-    return diffs
 
+def view_diff(first, second, title_a, title_b, file_name, use_html=False):
+    """Given two lists of equal length containing file paths, view the diffs
+    of each pair of files in zygrader or the grader's default browser
 
-def make_diff_string(first, second, title_a, title_b, use_html=False):
-    """Given to lists of equal length containing file paths, return a string containing the diffs"""
-    diffs = diff_files(first, second, title_a, title_b, use_html)
+    In zygrader each file is only diffed when it is first shown.
+    """
+    if use_html:
+        __view_html_diff(first, second, title_a, title_b, file_name)
+        return
 
-    diff_str = ""
+    names = [get_diff_name(path_a, title_a, title_b) for path_a in first]
 
-    for diff in diffs:
-        if use_html:
-            diff_str += f"<h1>{diff}</h1>\n"
-        else:
-            diff_str += f"\n\nFILE: {diff}\n"
-        diff_str += diffs[diff]
+    def diff_fn(index):
+        return diff.file_diff(first[index], second[index])
 
-    return diff_str
+    window = ui.get_window()
+    viewer = ui.layers.DiffViewer(f"{title_a} against {title_b}", names,
+                                  diff_fn, preferences.get("side_by_side_diff"))
+    window.run_layer(viewer)
 
 
 @suspend_curses
@@ -167,6 +172,164 @@ def extract_zip(input_zip, file_prefix=None):
         }
 
 
+# Submission files with these extensions are treated as text when extracted.
+# They are decoded and rewritten as utf-8 with unix newlines, everything else
+# is copied byte for byte.
+TEXT_FILE_EXTENSIONS = {
+    ".cpp", ".cc", ".c", ".h", ".hpp", ".txt", ".csv", ".dat", ".md", ".py",
+    ".java"
+}
+
+# Members of submission zips that are never useful for grading
+JUNK_DIRECTORIES = {"__MACOSX"}
+JUNK_FILES = {".DS_Store", "Thumbs.db", "desktop.ini"}
+
+EXTRACT_CHUNK_SIZE = 64 * 1024
+
+
+def __is_junk_member(name: str) -> bool:
+    parts = name.split("/")
+    if any(part in JUNK_DIRECTORIES for part in parts[:-1]):
+        return True
+    return parts[-1] in JUNK_FILES or parts[-1].startswith("._")
+
+
+def __copy_text_member(input_zip: zipfile.ZipFile, name: str, path: str):
+    """Stream a text member to disk, converting to utf-8 and unix newlines
+
+    The encoding is not known until the whole file has been decoded, so if
+    utf-8 fails partway through the member is streamed again as windows-1252.
+    The few bytes that windows-1252 leaves undefined are replaced rather than
+    leaving the file cut short.
+    """
+    for encoding, errors in [("utf-8", "strict"), ("windows-1252", "replace")]:
+        try:
+            with input_zip.open(name) as member, open(path,
+                                                      "w",
+                                                      encoding="utf-8",
+                                                      newline="\n") as out:
+                # newline=None translates \r\n and \r to \n, even across
+                # chunk boundaries
+                text = io.TextIOWrapper(member,
+                                        encoding=encoding,
+                                        errors=errors,
+                                        newline=None)
+                while True:
+                    chunk = text.read(EXTRACT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            return
+        except UnicodeDecodeError:
+            continue
+
+
+def extract_zip_to_directory(input_zip: zipfile.ZipFile, directory: str):
+    """Extract the members of a ZipFile into a directory
+
+    Members are copied to disk in chunks, so memory use is bounded no matter
+    how large the submission is. Only recognized text sources are decoded and
+    have their newlines normalized, other files (images, data blobs) are
+    copied unchanged. Junk members like __MACOSX/ are skipped.
+    """
+    root = os.path.abspath(directory)
+
+    for info in input_zip.infolist():
+        if info.is_dir() or __is_junk_member(info.filename):
+            continue
+
+        # Never write outside of the directory
+        path = os.path.abspath(os.path.join(root, info.filename))
+        if not path.startswith(root + os.sep):
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        _, extension = os.path.splitext(info.filename)
+        if extension.lower() in TEXT_FILE_EXTENSIONS:
+            __copy_text_member(input_zip, info.filename, path)
+        else:
+            with input_zip.open(info) as member, open(path, "wb") as out:
+                shutil.copyfileobj(member, out, EXTRACT_CHUNK_SIZE)
+
+
+def hash_file(path: str) -> str:
+    """Return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as _file:
+        for chunk in iter(lambda: _file.read(EXTRACT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_extracted_submission(input_zip: zipfile.ZipFile) -> str:
+    """Return the path to an extracted copy of a cached submission zip
+
+    Extracted trees are stored in zygrader_data/SEMESTER_FOLDER/.extracted/,
+    keyed by the hash of the zip's contents, and are shared between all
+    graders. A zip is only extracted the first time any grader opens it.
+    The files in the store are read-only, use link_tree to get a copy to
+    work with.
+    """
+    store = SharedData.get_extracted_directory()
+    path = os.path.join(store, hash_file(input_zip.filename))
+    if os.path.isdir(path):
+        return path
+
+    # Extract to a staging directory and rename so other graders never see
+    # a partially extracted tree.
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=store)
+    extract_zip_to_directory(input_zip, staging)
+    for root, _, files in os.walk(staging):
+        os.chmod(root, 0o755)
+        for file in files:
+            os.chmod(os.path.join(root, file), 0o444)
+
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Another grader finished extracting the same zip first
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return path
+
+
+def link_tree(source: str, destination: str):
+    """Recreate the files of the source directory in the destination
+
+    Files are hard linked when possible so nothing is copied, falling back
+    to symbolic links when the directories are on different file systems.
+    Use detach_files before letting anything write to the linked files.
+    """
+    for root, _, files in os.walk(source):
+        target_root = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target_root, exist_ok=True)
+        for file in files:
+            source_path = os.path.join(root, file)
+            target_path = os.path.join(target_root, file)
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                os.symlink(source_path, target_path)
+
+
+def detach_files(paths: typing.List[str]):
+    """Replace linked files with private, writable copies
+
+    Files from link_tree share their contents with the extracted store, so
+    they must be detached before anything may write to them, like an editor.
+    Edits then stay in this grader's copy.
+    """
+    for path in paths:
+        if not os.path.islink(path) and os.stat(path).st_nlink == 1:
+            continue
+        fd, temp_path = tempfile.mkstemp(prefix=".detach-",
+                                         dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(os.path.realpath(path), temp_path)
+        os.replace(temp_path, path)
+
+
 def get_source_file_paths(directory):
     """Get the file path for each source file
 
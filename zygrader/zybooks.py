@@ -1,5 +1,6 @@
 """ A wrapper around the zyBooks API """
 import os
+import tempfile
 import zipfile
 from datetime import datetime, timedelta, timezone
 
@@ -237,6 +238,12 @@ class Zybooks:
 
         return score
 
+    def _get_test_bench(self, submission: dict) -> list:
+        if submission["error"]:
+            return []
+
+        return submission["results"].get("config", {}).get("test_bench", [])
+
     def get_all_submissions(self, part_id, user_id):
         """Get the JSON representing all submissions of a given lab"""
         class_code = SharedData.CLASS_CODE
@@ -320,6 +327,7 @@ class Zybooks:
 
         response["date"] = self.get_time_string(submission)
         response["zip_url"] = submission["zip_location"]
+        response["test_bench"] = self._get_test_bench(submission)
 
         # Success
         return response
@@ -343,6 +351,7 @@ class Zybooks:
             response_part["max_score"] = submission["max_score"]
             response_part["zip_url"] = submission["zip_url"]
             response_part["date"] = submission["date"]
+            response_part["test_bench"] = submission["test_bench"]
 
             if submission["code"] is Zybooks.COMPILE_ERROR:
                 response_part["code"] = Zybooks.COMPILE_ERROR
@@ -399,11 +408,16 @@ class Zybooks:
             return zipfile.ZipFile(cached_name)
 
         # If not cached, download
-        zip_response = requests.get(url)
+        zip_response = Zybooks.session.get(url)
         if not zip_response.ok:
             return Zybooks.ERROR
 
-        # Write zip to cache
-        with open(cached_name, "wb") as _file:
+        # Write zip to cache. Write to a temporary name first so other graders
+        # (or other threads) never open a partially written zip.
+        fd, temp_name = tempfile.mkstemp(prefix=".download-",
+                                         dir=SharedData.get_cache_directory())
+        with os.fdopen(fd, "wb") as _file:
             _file.write(zip_response.content)
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, cached_name)
         return zipfile.ZipFile(cached_name)